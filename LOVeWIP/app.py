@@ -20,7 +20,6 @@ import string
 from dataclasses import asdict
 from datetime import datetime, timedelta, timezone
 from functools import wraps
-from io import BytesIO
 from logging.handlers import RotatingFileHandler
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -28,7 +27,7 @@ from email.mime.multipart import MIMEMultipart
 # ============================================================================
 # THIRD-PARTY KIRJASTOT
 # ============================================================================
-from flask import Flask, jsonify, render_template, request, redirect, url_for, flash, session
+from flask import Flask, Response, jsonify, render_template, request, redirect, send_file, url_for, flash, session, stream_with_context
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_wtf.csrf import CSRFProtect, generate_csrf
@@ -37,28 +36,27 @@ from flask_limiter.util import get_remote_address
 from werkzeug.middleware.proxy_fix import ProxyFix
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
 
-# ReportLab (PDF-generointi)
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-from reportlab.pdfgen import canvas
-
-# python-docx (Word-dokumentit)
-from docx import Document
-from docx.shared import Inches, Pt, RGBColor
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-
 # ============================================================================
 # OMAT MODUULIT - TÄMÄ ON KORJATTU JA TÄRKEÄ OSA
 # ============================================================================
 from data_access.database_manager import DatabaseManager
 from logic.stats_manager import EnhancedStatsManager
 from logic.achievement_manager import EnhancedAchievementManager, ENHANCED_ACHIEVEMENTS
-from logic.spaced_repetition import SpacedRepetitionManager
+from logic.spaced_repetition import DUE_POLICIES, SpacedRepetitionManager
+from logic.sr_rescheduler import SpacedRepetitionRescheduler
+from logic.workload_forecast import WorkloadForecaster
+from logic.duplicate_index import DuplicateIndex
+from logic.duplicate_scan import DuplicateScanManager
+from logic.question_import import IMPORT_MODES, DryRunValidator, ImportFormatError, QuestionImporter
+from logic.import_jobs import ImportJobManager, job_progress
+from logic.question_export import EXPORT_FORMATS, export_questions
+from logic.document_export import DocumentBuildManager
+from logic.study_packets import StudyPacketManager
 from logic.simulation_manager import SimulationManager
+from logic.item_analysis import ItemAnalysisManager
+from logic.ranking_service import RankingService
+from logic.feature_store import FeatureStore, is_due
+from logic.review_queue import ReviewQueueManager
 from models.models import User, Question
 from constants import DISTRACTORS
 
@@ -120,9 +118,27 @@ limiter = Limiter(
 # ============================================================================
 # DatabaseManager havaitsee automaattisesti PostgreSQL (Railway) vs SQLite (local)
 db_manager = DatabaseManager()
-stats_manager = EnhancedStatsManager(db_manager)
+feature_store = FeatureStore(db_manager)
+stats_manager = EnhancedStatsManager(db_manager, feature_store)
 achievement_manager = EnhancedAchievementManager(db_manager)
 spaced_repetition_manager = SpacedRepetitionManager(db_manager)
+sr_rescheduler = SpacedRepetitionRescheduler(db_manager)
+workload_forecaster = WorkloadForecaster(db_manager)
+duplicate_index = DuplicateIndex(db_manager)
+NEAR_DUPLICATE_THRESHOLD = 0.9  # Kysymystä lisättäessä varoitetaan tätä samankaltaisemmista
+duplicate_scan_manager = DuplicateScanManager(duplicate_index)
+question_importer = QuestionImporter(db_manager)
+dry_run_validator = DryRunValidator(db_manager)
+document_build_manager = DocumentBuildManager(db_manager)
+study_packet_manager = StudyPacketManager(db_manager)
+import_job_manager = ImportJobManager(db_manager, question_importer, after_import=duplicate_index.sync)
+import_job_manager.resume_unfinished()
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+LEARNER_SEARCH_STATUSES = ('validated', 'approved')
+review_queue_manager = ReviewQueueManager(db_manager, spaced_repetition_manager)
+item_analysis_manager = ItemAnalysisManager(db_manager)
+ranking_service = RankingService(db_manager)
 bcrypt = Bcrypt(app)
 
 # ============================================================================
@@ -652,42 +668,31 @@ def submit_answer_api():
     selected_option_text = data.get('selected_option_text')
     time_taken = data.get('time_taken', 0)
     
-    question = db_manager.get_question_by_id(question_id, current_user.id)
+    # Kortti SR-tietoineen (last_shown, interval, times_shown) ennen vastauksen tallennusta
+    cards = spaced_repetition_manager.get_questions_with_progress(current_user.id, [question_id])
+    question = cards[0] if cards else None
     
     if not question:
         app.logger.warning(f"Kysymystä {question_id} ei löytynyt käyttäjälle {current_user.username}")
         return jsonify({'error': 'Question not found'}), 404
     
     is_correct = (selected_option_text == question.options[question.correct])
+    # Valitun vaihtoehdon indeksi tallennetaan osioanalyysia varten
+    selected_option = question.options.index(selected_option_text) if selected_option_text in question.options else None
     
     # Päivitä normaalit tilastot
-    db_manager.update_question_stats(question_id, is_correct, time_taken, current_user.id)
+    was_due = is_due(question.last_shown, question.interval)
+    db_manager.update_question_stats(question_id, is_correct, time_taken, current_user.id, selected_option=selected_option)
+    feature_store.on_attempt(current_user.id, question.category, is_correct, was_new=not question.times_shown, was_due=was_due)
+    review_queue_manager.mark_answered(current_user.id, question_id)
     
-    # --- KORJATTU OSA: Päivitä spaced repetition -järjestelmä oikein ---
+    # Päivitä spaced repetition -aikataulu aktiivisella algoritmilla (SR_SCHEDULER: sm2 tai fsrs)
     try:
-        # 1. Määritä suorituksen laatu (0-5 asteikolla)
-        # 5 = täydellinen, 2 = väärä vastaus
-        quality = 5 if is_correct else 2
-        
-        # 2. Laske uusi kertausväli ja vaikeuskerroin
-        # (question-objekti on jo haettu aiemmin ja sisältää vanhat `interval` ja `ease_factor` arvot)
-        new_interval, new_ease_factor = spaced_repetition_manager.calculate_next_review(
-            question=question, 
-            performance_rating=quality
-        )
-        
-        # 3. Tallenna päivitetyt tiedot tietokantaan
-        spaced_repetition_manager.record_review(
-            user_id=current_user.id,
-            question_id=question_id,
-            interval=new_interval,
-            ease_factor=new_ease_factor
-        )
-        app.logger.info(f"Spaced repetition päivitetty: user={current_user.id}, q={question_id}, quality={quality}, new_interval={new_interval}")
+        new_interval = spaced_repetition_manager.review(current_user.id, question, is_correct, time_taken)
+        app.logger.info(f"Spaced repetition päivitetty: user={current_user.id}, q={question_id}, scheduler={spaced_repetition_manager.scheduler}, new_interval={new_interval}")
     except Exception as e:
         app.logger.error(f"Virhe spaced repetition päivityksessä: {e}")
         # Ei estetä vastauksen tallentamista vaikka SR epäonnistuisi
-    # --- KORJAUKSEN LOPPU ---
 
     # Tarkista saavutukset
     new_achievement_ids = achievement_manager.check_achievements(current_user.id)
@@ -742,9 +747,10 @@ def submit_simulation():
         score = 0
         total = len(question_ids)
         detailed_results = []
+        cards = {card.id: card for card in spaced_repetition_manager.get_questions_with_progress(current_user.id, question_ids)}
         
         for i, question_id in enumerate(question_ids):
-            question = db_manager.get_question_by_id(question_id, current_user.id)
+            question = cards.get(question_id)
             
             if not question:
                 app.logger.warning(f"⚠️ Question {question_id} not found")
@@ -762,12 +768,15 @@ def submit_simulation():
                 time_taken = 30
                 
                 # Tallenna question_attempts tauluun
+                was_due = is_due(question.last_shown, question.interval)
                 db_manager.update_question_stats(
                     question_id=question_id,
                     is_correct=is_correct,
                     time_taken=time_taken,
-                    user_id=current_user.id
+                    user_id=current_user.id,
+                    selected_option=user_answer_index
                 )
+                feature_store.on_attempt(current_user.id, question.category, is_correct, was_new=not question.times_shown, was_due=was_due)
                 
                 app.logger.info(f"💾 Saved answer: Q{question_id} - {'✓' if is_correct else '✗'}")
                 
@@ -792,6 +801,11 @@ def submit_simulation():
         app.logger.info(f"✅ Score: {score}/{total} = {percentage:.1f}%")
         app.logger.info(f"💾 Saved {total} answers to database")
         
+        # Kirjaa suoritettu simulaatio (suositukset ja piirteet)
+        if stats_manager.start_session(current_user.id, 'simulation'):
+            stats_manager.end_session(current_user.id, questions_answered=total, questions_correct=score)
+        feature_store.on_simulation(current_user.id)
+        
         # Poista sessio
         session.pop('simulation', None)
         session.modified = True
@@ -1009,35 +1023,93 @@ def get_achievements_api():
         logger.error(f"Koko /api/achievements-reitin suoritus epäonnistui: {e}", exc_info=True)
         return jsonify([])
 
+def choose_distractor(user):
+    """Arpoo häiriötekijän käyttäjän asetusten mukaan (tai None)."""
+    if getattr(user, 'distractors_enabled', False):
+        # Muunna prosentti (0-100) desimaaliluvuksi (0.0-1.0)
+        probability = user.distractor_probability / 100.0
+        if random.random() < probability:
+            app.logger.info(f"Näytetään häiriötekijä käyttäjälle {user.id} todennäköisyydellä {probability*100}%")
+            return random.choice(DISTRACTORS)
+    return None
+
+def review_policy_arg():
+    """Kertausjonon järjestys pyynnön policy-parametrista (tuntematon arvo = 'due')."""
+    policy = request.args.get('policy', 'due')
+    return policy if policy in DUE_POLICIES else 'due'
+
+def search_page(statuses=None):
+    """Suorittaa tekstihaun pyynnön parametreilla q, page ja per_page ja palauttaa JSON-vastauksen."""
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', SEARCH_PAGE_SIZE, type=int), 1), SEARCH_MAX_PAGE_SIZE)
+    if not query:
+        return jsonify({'success': False, 'error': 'Hakusana puuttuu'}), 400
+
+    results, total = db_manager.search_questions(query, limit=per_page, offset=(page - 1) * per_page, statuses=statuses)
+    for row in results:
+        row['rank'] = round(float(row['rank']), 4)
+        if statuses:
+            row.pop('status', None)
+    return jsonify({
+        'success': True,
+        'query': query,
+        'results': results,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': (total + per_page - 1) // per_page,
+    })
+
+@app.route("/api/search")
+@login_required
+@limiter.limit("30 per minute")
+def search_questions_api():
+    """Hakee tarkistettuja kysymyksiä aiheen mukaan (q, page, per_page)."""
+    return search_page(LEARNER_SEARCH_STATUSES)
+
 @app.route("/api/review-questions")
 @login_required
 @limiter.limit("60 per minute")
 def get_review_questions_api():
-    due_questions = spaced_repetition_manager.get_due_questions(current_user.id, limit=1)
+    """Palauttaa seuraavan kertauskysymyksen päivän kertausjonosta (policy=due|priority)."""
+    policy = review_policy_arg()
+    questions, _, _ = review_queue_manager.get_page(current_user.id, cursor=0, limit=1, policy=policy)
     
-    if not due_questions:
+    if not questions:
         return jsonify({'question': None, 'distractor': None})
-        
-    question = due_questions[0]
-    distractor = None
     
-    try:
-        # Muunna dataclass-objekti sanakirjaksi
-        question_data = asdict(question)
-    except Exception as e:
-        app.logger.error(f"Virhe review-kysymyksen käsittelyssä: {e}")
-        return jsonify({'question': None, 'distractor': None})
+    return jsonify({'question': asdict(questions[0]), 'distractor': choose_distractor(current_user)})
+
+@app.route("/api/review-queue")
+@login_required
+@limiter.limit("60 per minute")
+def get_review_queue_api():
+    """
+    Kursorisivutettu kertausjono: palauttaa seuraavat `limit` korttia häiriötekijäpäätöksineen.
+    Parametrit: cursor (oletus 0), limit (1-20, oletus 5), refresh=1 rakentaa jonon uudelleen,
+    policy=due (vanhin erääntyminen ensin, oletus) tai priority (suurin unohtamisriski ensin).
+    """
+    cursor = request.args.get('cursor', 0, type=int)
+    limit = max(1, min(request.args.get('limit', 5, type=int), 20))
+    policy = review_policy_arg()
+    if request.args.get('refresh') == '1':
+        review_queue_manager.build(current_user.id, policy)
     
-    # KORJATTU OSA: Käytä käyttäjän tallennettua todennäköisyyttä
-    if hasattr(current_user, 'distractors_enabled') and current_user.distractors_enabled:
-        # Muunna prosentti (0-100) desimaaliluvuksi (0.0-1.0)
-        probability = current_user.distractor_probability / 100.0
-        if random.random() < probability:
-            distractor = random.choice(DISTRACTORS)
-            app.logger.info(f"Näytetään häiriötekijä käyttäjälle {current_user.id} todennäköisyydellä {probability*100}%")
+    questions, next_cursor, remaining = review_queue_manager.get_page(current_user.id, cursor=cursor, limit=limit, policy=policy)
+    cards = [{'question': asdict(q), 'distractor': choose_distractor(current_user)} for q in questions]
+    return jsonify({'cards': cards, 'next_cursor': next_cursor, 'remaining': remaining})
 
-    return jsonify({'question': question_data, 'distractor': distractor})
 
+@app.route("/api/due-forecast")
+@login_required
+@limiter.limit("60 per minute")
+def get_due_forecast_api():
+    """Erääntyneiden kertausten määrä nyt ja päiväkohtainen ennuste (days=14 tai 30)."""
+    days = request.args.get('days', 14, type=int)
+    if days not in (14, 30):
+        days = 14
+    return jsonify(spaced_repetition_manager.get_due_summary(current_user.id, horizon_days=days))
 
 @app.route("/api/recommendations")
 @login_required
@@ -1045,6 +1117,16 @@ def get_review_questions_api():
 def get_recommendations_api():
     return jsonify(stats_manager.get_recommendations(current_user.id))
 
+@app.route("/api/ranking")
+@login_required
+@limiter.limit("60 per minute")
+def get_ranking_api():
+    """Palauttaa käyttäjän persentiilin muihin käyttäjiin nähden (kokonais- tai kategoriakohtainen)."""
+    category = request.args.get('category')
+    if category:
+        return jsonify({'category': category, 'ranking': ranking_service.get_percentile(current_user.id, category)})
+    return jsonify(ranking_service.get_user_ranking(current_user.id))
+
 
 
 #==============================================================================
@@ -1068,16 +1150,18 @@ def terms_route():
 def dashboard():
     """Optimoitu dashboard älykäillä suosituksilla v1.1.0"""
     
-    # Perustiedot
-    stats = stats_manager.get_learning_analytics(current_user.id)
-    streak = stats_manager.get_user_streak(current_user.id)
+    # Perustiedot esilasketuista piirteistä
+    features = feature_store.get(current_user.id)
+    streak = {'current_streak': features['current_streak'], 'longest_streak': features['longest_streak']}
     
-    # Erääntyvät kertaukset
-    due_reviews = len(spaced_repetition_manager.get_due_questions(current_user.id, limit=100))
+    # Erääntyvät kertaukset: tarkka määrä ja viikon ennuste yhdellä koostekyselyllä
+    due_summary = spaced_repetition_manager.get_due_summary(current_user.id, horizon_days=7)
+    due_reviews = due_summary['due_now']
+    features['due_count'] = due_reviews
     
     # Vastatut vs. kaikki kysymykset
-    answered_questions = stats['general']['answered_questions']
-    total_questions = stats['general']['total_questions_in_db']
+    answered_questions = features['answered_questions']
+    total_questions = db_manager.get_total_question_count()
     
     # Viikon edistys
     weekly_improvement = calculate_weekly_improvement(current_user.id)
@@ -1091,14 +1175,18 @@ def dashboard():
         recent_achievements = []
     
     # Kategoriat top 5 heikoimmat
-    categories = stats['categories']
+    categories = features['categories']
     categories_sorted = sorted(categories, key=lambda x: x.get('success_rate', 0))
     
     # ÄLYKÄS SUOSITUS
-    recommendation = generate_smart_recommendation(current_user.id, stats, streak)
+    recommendation = generate_smart_recommendation(current_user.id, features)
+    
+    # Sijoitus muihin käyttäjiin nähden
+    ranking = ranking_service.get_percentile(current_user.id)
     
     return render_template('dashboard.html',
                          due_reviews=due_reviews,
+                         due_upcoming=due_summary['upcoming_total'],
                          streak=streak,
                          answered_questions=answered_questions,
                          total_questions=total_questions,
@@ -1106,45 +1194,47 @@ def dashboard():
                          unlocked_achievements=unlocked_achievements,
                          recent_achievements=recent_achievements,
                          categories=categories_sorted,
-                         recommendation=recommendation)
+                         recommendation=recommendation,
+                         ranking=ranking)
 
-def generate_smart_recommendation(user_id, stats, streak):
-    """Generoi personoitu älykäs suositus käyttäjälle"""
+def generate_smart_recommendation(user_id, features=None):
+    """Generoi personoitu älykäs suositus käyttäjälle (haku esilasketuista piirteistä)"""
     
+    features = features or feature_store.get(user_id)
     recommendations = []
     
-    # 1. Tarkista heikot kategoriat
-    weak_categories = [c for c in stats['categories'] if c.get('success_rate', 0) < 0.7 and c.get('attempts', 0) >= 5]
-    if weak_categories:
-        weakest = weak_categories[0]
+    # 1. Tarkista heikoin kategoria
+    weakest = features.get('weakest_category')
+    weakest_rate = features.get('weakest_success_rate')
+    if weakest and weakest_rate is not None and weakest_rate < 0.7:
         recommendations.append({
             'priority': 'high',
-            'title': f"Keskity: {weakest['category']}",
-            'description': f"Onnistumisprosenttisi on {int(weakest['success_rate']*100)}%. Tarvitset lisäharjoitusta tässä aiheessa.",
+            'title': f"Keskity: {weakest}",
+            'description': f"Onnistumisprosenttisi on {int(weakest_rate*100)}%. Tarvitset lisäharjoitusta tässä aiheessa.",
             'action': 'practice_category',
-            'category': weakest['category']
+            'category': weakest
         })
     
     # 2. Tarkista onko valmis simulaatioon
-    if stats['general']['answered_questions'] >= 50 and stats['general']['avg_success_rate'] >= 0.75:
+    if features['answered_questions'] >= 50 and features['avg_success_rate'] >= 0.75:
         recommendations.append({
             'priority': 'medium',
             'title': "Kokeile koesimulaatiota!",
-            'description': f"Olet vastannut {stats['general']['answered_questions']} kysymykseen keskiarvolla {int(stats['general']['avg_success_rate']*100)}%. Testaa osaamistasi täydessä simulaatiossa!",
+            'description': f"Olet vastannut {features['answered_questions']} kysymykseen keskiarvolla {int(features['avg_success_rate']*100)}%. Testaa osaamistasi täydessä simulaatiossa!",
             'action': 'start_simulation'
         })
     
     # 3. Tarkista streak
-    if streak.get('current_streak', 0) == 0 and streak.get('longest_streak', 0) > 0:
+    if features['current_streak'] == 0 and features['longest_streak'] > 0:
         recommendations.append({
             'priority': 'high',
             'title': "Jatka harjoittelua!",
-            'description': f"Pisin putkesi oli {streak['longest_streak']} päivää. Aloita uusi putki tänään!",
+            'description': f"Pisin putkesi oli {features['longest_streak']} päivää. Aloita uusi putki tänään!",
             'action': 'practice_random'
         })
     
     # 4. Tarkista erääntyvät kertaukset
-    due_reviews = len(spaced_repetition_manager.get_due_questions(user_id, limit=100))
+    due_reviews = features['due_count']
     if due_reviews >= 10:
         recommendations.append({
             'priority': 'high',
@@ -1668,14 +1758,21 @@ def admin_add_question_route():
         random.shuffle(options)
         correct = options.index(correct_answer_text)
 
+        # Lähes identtiset kysymykset eivät estä lisäystä, mutta niistä varoitetaan
+        similar = duplicate_index.find_similar_to(question_text, NEAR_DUPLICATE_THRESHOLD)
+
         try:
-            question_normalized = db_manager.normalize_question(question_text)
-            execute_query('''
-                INSERT INTO questions (question, question_normalized, options, correct, explanation, category, difficulty, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (question_text, question_normalized, json.dumps(options), correct, explanation, category, difficulty, datetime.now()), fetch='none')
+            success, error = db_manager.add_question({
+                'question': question_text, 'explanation': explanation, 'options': options,
+                'correct': correct, 'category': category, 'difficulty': difficulty,
+            })
+            if not success:
+                raise Exception(error)
+            duplicate_index.sync()
             
             flash('Kysymys lisätty onnistuneesti!', 'success')
+            if similar:
+                flash(f'⚠️ Lähes identtinen kysymys on jo kannassa: ID {similar[0]["id"]} ({similar[0]["similarity"]}%): "{similar[0]["question"][:100]}"', 'warning')
             app.logger.info(f"Admin {current_user.username} added new question in category {category}")
             return redirect(url_for('admin_route'))
         except Exception as e:
@@ -1737,8 +1834,8 @@ def admin_questions_route():
 @admin_required
 def admin_bulk_upload_route():
     """
-    Bulk upload JSON questions with AJAX support.
-    Returns JSON response for AJAX requests, redirects for normal form submissions.
+    Bulk upload JSON questions as a background import job.
+    Returns 202 with the job for AJAX requests, redirects to the admin page (with progress) otherwise.
     """
     # Tarkista onko AJAX-pyyntö
     is_ajax = request.headers.get('X-CSRFToken') is not None or \
@@ -1758,109 +1855,232 @@ def admin_bulk_upload_route():
         flash('Tiedostoa ei valittu.', 'danger')
         return redirect(url_for('admin_route'))
     
-    if not file.filename.endswith('.json'):
+    if not file.filename.lower().endswith(('.json', '.ndjson', '.jsonl')):
         if is_ajax:
-            return jsonify({'success': False, 'error': 'Tiedoston tulee olla JSON-muotoinen (.json).'}), 400
-        flash('Tiedoston tulee olla JSON-muotoinen (.json).', 'danger')
+            return jsonify({'success': False, 'error': 'Tiedoston tulee olla JSON-muotoinen (.json, .ndjson tai .jsonl).'}), 400
+        flash('Tiedoston tulee olla JSON-muotoinen (.json, .ndjson tai .jsonl).', 'danger')
         return redirect(url_for('admin_route'))
     
-    try:
-        content = file.read().decode('utf-8')
-        questions_data = json.loads(content)
-        
-        if not isinstance(questions_data, list):
-            if is_ajax:
-                return jsonify({'success': False, 'error': 'JSON-tiedoston tulee sisältää lista kysymyksiä.'}), 400
-            flash('JSON-tiedoston tulee sisältää lista kysymyksiä.', 'danger')
-            return redirect(url_for('admin_route'))
-        
-        if len(questions_data) == 0:
-            if is_ajax:
-                return jsonify({'success': False, 'error': 'JSON-tiedosto on tyhjä.'}), 400
-            flash('JSON-tiedosto on tyhjä.', 'warning')
-            return redirect(url_for('admin_route'))
-        
-        success, result = db_manager.bulk_add_questions(questions_data)
-        
-        if success:
-            stats = result
-            
-            # Lokita onnistunut lataus
-            app.logger.info(f"Admin {current_user.username} uploaded {stats['added']} questions from JSON")
-            
-            # Jos AJAX-pyyntö, palauta JSON
-            if is_ajax:
-                return jsonify({
-                    'success': True,
-                    'added': stats.get('added', 0),
-                    'duplicates': stats.get('duplicates', 0),
-                    'skipped': stats.get('skipped', 0),
-                    'errors': stats.get('errors', [])
-                }), 200
-            
-            # Muuten flash-viestit ja redirect (vanha tapa)
-            if stats['added'] > 0:
-                flash(f"✅ Lisättiin {stats['added']} kysymystä onnistuneesti!", 'success')
-            if stats['duplicates'] > 0:
-                flash(f"🔄 Ohitettiin {stats['duplicates']} duplikaattia", 'info')
-            if stats['skipped'] > 0:
-                flash(f"⚠️ Ohitettiin {stats['skipped']} kysymystä muiden virheiden vuoksi", 'warning')
-            if stats['errors']:
-                error_msg = "Virheet:\n" + "\n".join(stats['errors'][:10])
-                if len(stats['errors']) > 10:
-                    error_msg += f"\n... ja {len(stats['errors']) - 10} muuta"
-                flash(error_msg, 'info')
-        else:
-            if is_ajax:
-                return jsonify({'success': False, 'error': f'Virhe kysymysten lataamisessa: {result}'}), 500
-            flash(f'Virhe kysymysten lataamisessa: {result}', 'danger')
-            app.logger.error(f"Bulk upload error: {result}")
-    
-    except json.JSONDecodeError as e:
-        error_msg = f'Virheellinen JSON-tiedosto: {str(e)}'
-        app.logger.error(f"JSON decode error in bulk upload: {e}")
+    mode = request.form.get('mode', 'insert')
+    if mode not in IMPORT_MODES:
+        mode = 'insert'
+
+    # Tuonti ajetaan taustatyönä (logic/import_jobs.py), jotta suuri tiedosto ei ylitä pyynnön aikarajaa
+    success, result = import_job_manager.submit(file, current_user.id, mode)
+    if not success:
+        app.logger.error(f"Bulk upload error: {result}")
         if is_ajax:
-            return jsonify({'success': False, 'error': error_msg}), 400
-        flash(error_msg, 'danger')
-        
+            return jsonify({'success': False, 'error': f'Virhe tuonnin käynnistämisessä: {result}'}), 500
+        flash(f'Virhe tuonnin käynnistämisessä: {result}', 'danger')
+        return redirect(url_for('admin_route'))
+
+    app.logger.info(f"Admin {current_user.username} started {mode} import job {result['id']} ({file.filename})")
+    if is_ajax:
+        return jsonify({'success': True, 'job': job_progress(result)}), 202
+    flash(f"📥 Tuonti '{file.filename}' käynnistettiin taustalla. Edistyminen näkyy alla.", 'info')
+    return redirect(url_for('admin_route', import_job=result['id']))
+
+
+@app.route("/admin/bulk_upload/validate", methods=['POST'])
+@admin_required
+@limiter.limit("10 per minute")
+def admin_bulk_upload_validate_route():
+    """
+    Kuivaharjoitus: tarkistaa ladatun tiedoston kirjoittamatta mitään ja palauttaa
+    raportin (logic/question_import.DryRunValidator). Raportin token tallentaa
+    tarkistetut rivit reitillä /admin/bulk_upload/commit.
+    """
+    file = request.files.get('json_file')
+    if file is None or file.filename == '':
+        return jsonify({'success': False, 'error': 'Tiedostoa ei valittu.'}), 400
+    if not file.filename.lower().endswith(('.json', '.ndjson', '.jsonl')):
+        return jsonify({'success': False, 'error': 'Tiedoston tulee olla JSON-muotoinen (.json, .ndjson tai .jsonl).'}), 400
+
+    try:
+        report = dry_run_validator.validate(file.stream, file.filename)
+    except ImportFormatError as e:
+        return jsonify({'success': False, 'error': f'Virheellinen tiedosto: {e}'}), 400
     except Exception as e:
-        error_msg = f'Odottamaton virhe: {str(e)}'
-        app.logger.error(f"Unexpected error in bulk upload: {e}")
-        if is_ajax:
-            return jsonify({'success': False, 'error': error_msg}), 500
-        flash(error_msg, 'danger')
-    
+        app.logger.error(f"Bulk upload validation error: {e}")
+        return jsonify({'success': False, 'error': f'Virhe tiedoston tarkistuksessa: {e}'}), 500
+
+    app.logger.info(f"Admin {current_user.username} validated {file.filename}: "
+                    f"{report['valid']}/{report['rows']} valid")
+    return jsonify({'success': True, 'report': report})
+
+
+@app.route("/admin/bulk_upload/commit", methods=['POST'])
+@admin_required
+@limiter.limit("10 per minute")
+def admin_bulk_upload_commit_route():
+    """Tallentaa kuivaharjoituksessa tarkistetut rivit erinä ilman uutta jäsennystä."""
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    token = request.form.get('token') or (request.get_json(silent=True) or {}).get('token', '')
+    success, result = dry_run_validator.commit(token)
+    if success and result['added']:
+        duplicate_index.sync()
+
+    if is_ajax:
+        if not success:
+            return jsonify({'success': False, 'error': result}), 400
+        return jsonify({'success': True, **result})
+    if success:
+        app.logger.info(f"Admin {current_user.username} committed validated upload: {result['added']} added")
+        flash(f"✅ {result['added']} kysymystä lisätty, {result['duplicates']} duplikaattia ohitettu.", 'success')
+    else:
+        flash(f'Tallennus epäonnistui: {result}', 'danger')
     return redirect(url_for('admin_route'))
 
 
+@app.route("/admin/import_jobs")
+@admin_required
+def admin_import_jobs_route():
+    """Viimeisimmät tuontityöt JSON-muodossa."""
+    return jsonify({'success': True, 'jobs': [job_progress(job) for job in db_manager.get_import_jobs(limit=20)]})
+
+
+@app.route("/admin/import_jobs/<job_id>")
+@admin_required
+def admin_import_job_route(job_id):
+    """Tuontityön tila (pollaus)."""
+    job = import_job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Tuontityötä ei löytynyt'}), 404
+    return jsonify({'success': True, 'job': job_progress(job)})
+
+
+@app.route("/admin/import_jobs/<job_id>/cancel", methods=['POST'])
+@admin_required
+def admin_import_job_cancel_route(job_id):
+    """Peruu tuontityön; jo lisätyt erät jäävät kantaan."""
+    cancelled = import_job_manager.cancel(job_id)
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'success': cancelled})
+    if cancelled:
+        app.logger.info(f"Admin {current_user.username} cancelled import job {job_id}")
+        flash('⏹️ Tuonti perutaan. Jo lisätyt kysymykset jäävät kantaan.', 'warning')
+    else:
+        flash('Tuontia ei voi perua (se on jo päättynyt).', 'info')
+    return redirect(url_for('admin_route', import_job=job_id))
+
+
+@app.route("/admin/import_jobs/<job_id>/resume", methods=['POST'])
+@admin_required
+def admin_import_job_resume_route(job_id):
+    """Jatkaa perutun, keskeytyneen tai virheeseen päättyneen tuonnin viimeisestä kirjatusta rivistä."""
+    resumed = import_job_manager.resume(job_id)
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'success': resumed})
+    if resumed:
+        app.logger.info(f"Admin {current_user.username} resumed import job {job_id}")
+        flash('▶️ Tuontia jatketaan.', 'info')
+    else:
+        flash('Tuontia ei voi jatkaa.', 'warning')
+    return redirect(url_for('admin_route', import_job=job_id))
+
+
 @app.route("/admin/find_duplicates", methods=['GET', 'POST'])
 @admin_required
 def admin_find_duplicates_route():
-    """Etsii duplikaatit ja samankaltaiset kysymykset."""
-    
+    """
+    Etsii duplikaatit ja samankaltaiset kysymykset. POST käynnistää taustahaun
+    (tai käyttää valmista, jos indeksi ei ole muuttunut); GET näyttää haun
+    edistymisen tai tulokset annetulla kynnyksellä.
+    """
     if request.method == 'POST':
         # Hae threshold lomakkeesta (oletuksena 95%)
-        similarity_threshold = float(request.form.get('threshold', 95)) / 100
-        
+        threshold = min(max(float(request.form.get('threshold', 95)), 50), 100)
         try:
-            similar_questions = db_manager.find_similar_questions(similarity_threshold)
-            
-            if not similar_questions:
-                flash(f'✅ Ei löytynyt duplikaatteja tai samankaltaisuus {similarity_threshold*100:.0f}% kysymyksiä!', 'success')
-            else:
-                flash(f'🔍 Löydettiin {len(similar_questions)} samankaltaista kysymysparia (kynnys: {similarity_threshold*100:.0f}%)', 'info')
-            
-            return render_template('admin_duplicates.html', 
-                                   similar_questions=similar_questions, 
-                                   threshold=similarity_threshold*100)
-        
+            job = duplicate_scan_manager.start()
         except Exception as e:
-            flash(f'Virhe duplikaattien etsinnässä: {str(e)}', 'danger')
             app.logger.error(f"Duplicate search error: {e}")
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return jsonify({'success': False, 'error': str(e)}), 500
+            flash(f'Virhe duplikaattien etsinnässä: {str(e)}', 'danger')
             return redirect(url_for('admin_route'))
-    
-    # GET-pyyntö: näytä lomake
-    return render_template('admin_duplicates.html', similar_questions=None, threshold=95)
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'success': True, **job.progress()})
+        return redirect(url_for('admin_find_duplicates_route', job=job.id, threshold=f"{threshold:g}"))
+
+    threshold = min(max(request.args.get('threshold', 95, type=float), 50), 100)
+    job = duplicate_scan_manager.get(request.args.get('job', ''))
+    if job is None:
+        # GET-pyyntö ilman työtä: näytä lomake
+        return render_template('admin_duplicates.html', similar_questions=None, threshold=threshold, job=None)
+    if not job.finished:
+        return render_template('admin_duplicates.html', similar_questions=None, threshold=threshold, job=job.progress())
+
+    if job.status == 'error':
+        flash(f'Virhe duplikaattien etsinnässä: {job.error}', 'danger')
+        return render_template('admin_duplicates.html', similar_questions=None, threshold=threshold, job=None)
+
+    if job.status == 'done':
+        # Kaikki ehdokasparit on pisteytetty: kynnyshaku tallennetuista pisteistä
+        similar_questions = db_manager.get_similar_question_pairs(threshold / 100)
+    else:
+        similar_questions = sorted(job.pairs(threshold / 100), key=lambda p: (p['id1'], p['id2']))
+    if job.status == 'cancelled':
+        flash(f'⏹️ Haku peruttiin: tarkistettiin {job.done}/{job.total} ehdokasparia, tulokset ovat osittaisia.', 'warning')
+    elif not similar_questions:
+        flash(f'✅ Ei löytynyt duplikaatteja tai samankaltaisuus {threshold:.0f}% kysymyksiä!', 'success')
+    else:
+        flash(f'🔍 Löydettiin {len(similar_questions)} samankaltaista kysymysparia (kynnys: {threshold:.0f}%)', 'info')
+    return render_template('admin_duplicates.html', similar_questions=similar_questions, threshold=threshold, job=job.progress())
+
+
+@app.route("/admin/find_duplicates/<job_id>/status")
+@admin_required
+def admin_duplicates_status_route(job_id):
+    """
+    Haun tila JSONina selaimen kyselyä varten: edistyminen ja kynnyksen ylittävät
+    parit pisteindeksistä since alkaen. next on seuraavan kyselyn since.
+    """
+    job = duplicate_scan_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Hakua ei löytynyt'}), 404
+    threshold = min(max(request.args.get('threshold', 95, type=float), 50), 100) / 100
+    since = max(request.args.get('since', 0, type=int), 0)
+    end = len(job.scores)
+    return jsonify({'success': True, 'job': job.progress(), 'pairs': job.pairs(threshold, since, end), 'next': end})
+
+
+@app.route("/admin/find_duplicates/<job_id>/cancel", methods=['POST'])
+@admin_required
+def admin_duplicates_cancel_route(job_id):
+    """Peruu käynnissä olevan duplikaattihaun."""
+    cancelled = duplicate_scan_manager.cancel(job_id)
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'success': cancelled})
+    if cancelled:
+        app.logger.info(f"Admin {current_user.username} cancelled duplicate search {job_id}")
+    return redirect(url_for('admin_find_duplicates_route', job=job_id))
+
+
+@app.route("/admin/questions/check_duplicate", methods=['POST'])
+@admin_required
+@limiter.limit("60 per minute")
+def admin_check_duplicate_route():
+    """
+    Tarkistaa kysymystekstin ennen tallennusta: täsmälleen sama (sormenjälki)
+    ja lähes identtiset (MinHash-indeksi). Parametrit: question, exclude_id (muokkaus).
+    """
+    data = request.get_json(silent=True) or request.form.to_dict()
+    question_text = (data.get('question') or '').strip()
+    exclude_id = int(data['exclude_id']) if str(data.get('exclude_id') or '').isdigit() else None
+    if not question_text:
+        return jsonify({'success': False, 'error': 'Kysymysteksti puuttuu'}), 400
+
+    is_duplicate, existing = db_manager.check_question_duplicate(question_text, exclude_id=exclude_id)
+    similar = duplicate_index.find_similar_to(question_text, NEAR_DUPLICATE_THRESHOLD, exclude_id=exclude_id)
+    return jsonify({'success': True, 'duplicate': existing if is_duplicate else None, 'similar': similar[:5]})
+
+
+@app.route("/admin/questions/search")
+@admin_required
+@limiter.limit("60 per minute")
+def admin_search_questions_route():
+    """Hakee kysymyksiä kaikista tiloista tekstihaulla (q, page, per_page)."""
+    return search_page()
 
 
 @app.route("/admin/clear_database", methods=['POST'])
@@ -1916,7 +2136,9 @@ def admin_route():
                              user_count=user_count,
                              category_count=category_count,
                              attempt_count=attempt_count,
-                             categories=categories)
+                             categories=categories,
+                             import_jobs=[job_progress(job) for job in db_manager.get_import_jobs(limit=5)],
+                             active_import_job=request.args.get('import_job'))
                              
     except Exception as e:
         flash(f'Virhe admin-sivun lataamisessa: {e}', 'danger')
@@ -1980,6 +2202,90 @@ def admin_validation_route():
         app.logger.error(f"Validation page error: {e}")
         return redirect(url_for('admin_route'))
 
+@app.route("/admin/item_analysis/run", methods=['POST'])
+@admin_required
+def admin_run_item_analysis_route():
+    """Ajaa kysymyspankin osioanalyysin (p-arvo, erottelukyky, vastausajat)."""
+    success, result = item_analysis_manager.run()
+
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        if success:
+            return jsonify({'success': True, **result})
+        return jsonify({'success': False, 'error': result}), 500
+
+    if success:
+        flash(f"📊 Osioanalyysi valmis: {result['questions']} kysymystä, {result['attempts']} vastausta ({result['seconds']} s).", 'success')
+        app.logger.info(f"Admin {current_user.username} ran item analysis")
+    else:
+        flash(f'Virhe osioanalyysissa: {result}', 'danger')
+        app.logger.error(f"Item analysis error: {result}")
+    return redirect(request.referrer or url_for('admin_route'))
+
+@app.route("/admin/features/refresh", methods=['POST'])
+@admin_required
+def admin_refresh_features_route():
+    """Laskee kaikkien käyttäjien suosituspiirteet uudelleen."""
+    success, result = feature_store.refresh_all()
+
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        if success:
+            return jsonify({'success': True, **result})
+        return jsonify({'success': False, 'error': result}), 500
+
+    if success:
+        flash(f"🔄 Käyttäjäpiirteet päivitetty: {result['users']} käyttäjää ({result['seconds']} s).", 'success')
+        app.logger.info(f"Admin {current_user.username} refreshed user features")
+    else:
+        flash(f'Virhe piirteiden päivityksessä: {result}', 'danger')
+        app.logger.error(f"Feature refresh error: {result}")
+    return redirect(request.referrer or url_for('admin_route'))
+
+@app.route("/admin/sr/reschedule", methods=['POST'])
+@admin_required
+def admin_reschedule_route():
+    """Laskee kertausaikataulut uudelleen nykyisillä SM-2-parametreilla (tai kuivaharjoituksena)."""
+    dry_run = request.form.get('dry_run') == 'on'
+    user_id = request.form.get('user_id', type=int)
+    success, result = sr_rescheduler.run(user_id=user_id, dry_run=dry_run)
+
+    if success and not dry_run and result['changed']:
+        # Erääntyvien määrät muuttuivat, päivitä suosituspiirteet
+        feature_store.refresh_all()
+
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        if success:
+            return jsonify({'success': True, **result})
+        return jsonify({'success': False, 'error': result}), 500
+
+    if success:
+        week_before = sum(result['due_before'][:7])
+        week_after = sum(result['due_after'][:7])
+        verb = 'muuttuisi' if dry_run else 'muuttui'
+        flash(f"🗓️ {result['changed']}/{result['cards']} korttia {verb}. Erääntyviä seuraavan 7 päivän aikana: {week_before} → {week_after}.", 'info' if dry_run else 'success')
+        app.logger.info(f"Admin {current_user.username} ran SR rescheduling (dry_run={dry_run}, user={user_id})")
+    else:
+        flash(f'Virhe uudelleenaikataulutuksessa: {result}', 'danger')
+        app.logger.error(f"SR rescheduling error: {result}")
+    return redirect(request.referrer or url_for('admin_route'))
+
+@app.route("/admin/sr/workload-forecast")
+@admin_required
+@limiter.limit("10 per minute")
+def admin_workload_forecast_route():
+    """
+    Kertauskuorman Monte Carlo -ennuste JSON-muodossa.
+    Parametrit: days (1-90), trials (1-50) ja user_id (toistettava; oletus kaikki käyttäjät).
+    """
+    days = min(max(request.args.get('days', 30, type=int), 1), 90)
+    trials = min(max(request.args.get('trials', 10, type=int), 1), 50)
+    user_ids = request.args.getlist('user_id', type=int) or None
+    try:
+        result = workload_forecaster.forecast(user_ids=user_ids, days=days, trials=trials)
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        app.logger.error(f"Workload forecast error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route("/admin/validate_question/<int:question_id>", methods=['POST'])
 @admin_required
 def admin_validate_question_route(question_id):
@@ -2292,8 +2598,16 @@ def admin_edit_question_route(question_id):
             categories = db_manager.get_categories()
             return render_template("admin_edit_question.html", question=question_data, categories=categories)
 
+        is_duplicate, existing = db_manager.check_question_duplicate(data['question'], exclude_id=question_id)
+        if is_duplicate:
+            flash(f'⚠️ Vastaava kysymys on jo kannassa: ID {existing["id"]} | Kategoria: {existing["category"]}', 'warning')
+            question_data = db_manager.get_single_question_for_edit(question_id)
+            categories = db_manager.get_categories()
+            return render_template("admin_edit_question.html", question=question_data, categories=categories)
+
         success, error = db_manager.update_question(question_id, data)
         if success:
+            duplicate_index.index_question(question_id, data['question'])
             flash('Kysymys päivitetty onnistuneesti!', 'success')
             app.logger.info(f"Admin {current_user.username} edited question {question_id}")
             return redirect(url_for('admin_route'))
@@ -2310,7 +2624,9 @@ def admin_edit_question_route(question_id):
         return redirect(url_for('admin_route'))
     
     categories = db_manager.get_categories()
-    return render_template("admin_edit_question.html", question=question_data, categories=categories)
+    item_stats = db_manager.get_question_item_stats([question_id]).get(question_id)
+    return render_template("admin_edit_question.html", question=question_data, categories=categories,
+                           item_stats=item_stats)
 
 @app.route("/admin/delete_question/<int:question_id>", methods=['POST'])
 @admin_required
@@ -2389,6 +2705,103 @@ def admin_delete_user_route(user_id):
     
     return redirect(url_for('admin_users_route'))
 
+def document_response(build):
+    """
+    Valmis dokumentti ladataan heti; kesken oleva palauttaa AJAX-pyynnölle 202 ja
+    muuten odotussivun, joka seuraa tilaa ja lataa dokumentin, kun se valmistuu.
+    """
+    if build['status'] == 'ready':
+        return admin_document_download_route(build['id'])
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'success': build['status'] != 'error', 'build': build}), 202
+    return render_template('admin_document_build.html', build=build)
+
+
+@app.route("/admin/documents/<build_id>")
+@admin_required
+def admin_document_status_route(build_id):
+    """Dokumentin rakennuksen tila (pollaus)."""
+    build = document_build_manager.status(build_id)
+    if build is None:
+        return jsonify({'success': False, 'error': 'Dokumenttia ei löytynyt'}), 404
+    return jsonify({'success': build['status'] != 'error', 'build': build,
+                    'download_url': url_for('admin_document_download_route', build_id=build_id)})
+
+
+@app.route("/admin/documents/<build_id>/download")
+@admin_required
+def admin_document_download_route(build_id):
+    """Lataa valmiin dokumentin välimuistista."""
+    document = document_build_manager.file(build_id)
+    if document is None:
+        flash('Dokumentti ei ole vielä valmis tai se on poistettu välimuistista.', 'warning')
+        return redirect(url_for('admin_export_questions_document_route'))
+    path, mimetype, extension = document
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    app.logger.info(f"Admin {current_user.username} downloaded document {build_id}")
+    return send_file(os.path.abspath(path), mimetype=mimetype, as_attachment=True,
+                     download_name=f'LOVe_Kysymykset_{timestamp}.{extension}')
+
+
+@app.route("/admin/study_packets", methods=['GET', 'POST'])
+@admin_required
+def admin_study_packets_route():
+    """
+    Koko ryhmän virhekoosteet: POST käynnistää taustatyön (logic/study_packets.py),
+    GET näyttää viimeisimmän työn tilan ja latauslinkin.
+    """
+    if request.method == 'POST':
+        try:
+            job = study_packet_manager.start()
+        except Exception as e:
+            app.logger.error(f"Study packet start error: {e}")
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return jsonify({'success': False, 'error': str(e)}), 500
+            flash(f'Virhe koosteiden käynnistämisessä: {str(e)}', 'danger')
+            return redirect(url_for('admin_study_packets_route'))
+        app.logger.info(f"Admin {current_user.username} started study packet job {job.id}")
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'success': True, 'job': job.progress()}), 202
+        return redirect(url_for('admin_study_packets_route', job=job.id))
+
+    job = study_packet_manager.get(request.args.get('job', '')) or study_packet_manager.latest()
+    return render_template('admin_study_packets.html', job=job.progress() if job else None)
+
+
+@app.route("/admin/study_packets/<job_id>")
+@admin_required
+def admin_study_packet_status_route(job_id):
+    """Virhekoostetyön tila (pollaus)."""
+    job = study_packet_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Työtä ei löytynyt'}), 404
+    return jsonify({'success': True, 'job': job.progress()})
+
+
+@app.route("/admin/study_packets/<job_id>/cancel", methods=['POST'])
+@admin_required
+def admin_study_packet_cancel_route(job_id):
+    """Peruu virhekoostetyön."""
+    cancelled = study_packet_manager.cancel(job_id)
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'success': cancelled})
+    flash('⏹️ Koosteiden luonti perutaan.' if cancelled else 'Työ on jo päättynyt.', 'info')
+    return redirect(url_for('admin_study_packets_route', job=job_id))
+
+
+@app.route("/admin/study_packets/<job_id>/download")
+@admin_required
+def admin_study_packet_download_route(job_id):
+    """Lataa valmiin ZIP-arkiston levyltä."""
+    job = study_packet_manager.get(job_id)
+    if job is None or job.status != 'done' or not os.path.exists(job.path):
+        flash('Koosteet eivät ole valmiina.', 'warning')
+        return redirect(url_for('admin_study_packets_route'))
+    app.logger.info(f"Admin {current_user.username} downloaded study packets {job_id}")
+    return send_file(os.path.abspath(job.path), mimetype='application/zip', as_attachment=True,
+                     download_name=f"LOVe_virhekoosteet_{job.started_at.strftime('%Y%m%d_%H%M')}.zip")
+
+
 @app.route("/admin/export_questions_document", methods=['GET', 'POST'])
 @admin_required
 def admin_export_questions_document_route():
@@ -2403,83 +2816,22 @@ def admin_export_questions_document_route():
         selected_difficulties = request.form.getlist('difficulties')
         
         try:
-            # Rakenna kysely suodattimilla
-            query = "SELECT * FROM questions WHERE 1=1"
-            params = []
-            
-            if selected_categories:
-                placeholders = ','.join('?' * len(selected_categories))
-                query += f" AND category IN ({placeholders})"
-                params.extend(selected_categories)
-            
-            if selected_difficulties:
-                placeholders = ','.join('?' * len(selected_difficulties))
-                query += f" AND difficulty IN ({placeholders})"
-                params.extend(selected_difficulties)
-            
-            # Järjestys
-            sort_mapping = {
-                'id': 'id ASC',
-                'id_desc': 'id DESC',
-                'category': 'category ASC, id ASC',
-                'difficulty': 'CASE difficulty WHEN "helppo" THEN 1 WHEN "keskivaikea" THEN 2 WHEN "vaikea" THEN 3 END, id ASC',
-                'alphabetical': 'question ASC'
-            }
-            query += f" ORDER BY {sort_mapping.get(sort_by, 'id ASC')}"
-            
-            questions = execute_query(query, tuple(params), fetch='all')
-                    
-            if not questions:
-                flash('Ei kysymyksiä vietäväksi valituilla suodattimilla.', 'warning')
-                return redirect(url_for('admin_export_questions_document_route'))
-            
             # Tarkista duplikaatit jos pyydetty
             duplicate_info = None
             if check_duplicates:
-                similar = db_manager.find_similar_questions(0.95)
+                similar = duplicate_index.find_similar_pairs(0.95)
                 if similar:
                     duplicate_info = f"⚠️ Löydettiin {len(similar)} mahdollista duplikaattia!"
-            
-            # Muunna kysymykset listaksi
-            questions_list = []
-            for q in questions:
-                questions_list.append({
-                    'id': q['id'],
-                    'question': q['question'],
-                    'options': json.loads(q['options']),
-                    'correct': q['correct'],
-                    'explanation': q['explanation'],
-                    'category': q['category'],
-                    'difficulty': q['difficulty']
-                })
-            
-            # Luo dokumentti
-            if export_format == 'pdf':
-                pdf_buffer = create_pdf_document(questions_list, include_answers, duplicate_info)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f'LOVe_Kysymykset_{timestamp}.pdf'
-                
-                from flask import make_response
-                response = make_response(pdf_buffer.getvalue())
-                response.headers['Content-Type'] = 'application/pdf'
-                response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-                
-                app.logger.info(f"Admin {current_user.username} exported {len(questions_list)} questions to PDF")
-                return response
-            
-            else:  # Word
-                doc_buffer = create_word_document(questions_list, include_answers, duplicate_info)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f'LOVe_Kysymykset_{timestamp}.docx'
-                
-                from flask import make_response
-                response = make_response(doc_buffer.getvalue())
-                response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-                response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-                
-                app.logger.info(f"Admin {current_user.username} exported {len(questions_list)} questions to Word")
-                return response
-            
+
+            build = document_build_manager.request(
+                'pdf' if export_format == 'pdf' else 'word', include_answers, sort_by,
+                selected_categories, selected_difficulties, duplicate_info
+            )
+            if build is None:
+                flash('Ei kysymyksiä vietäväksi valituilla suodattimilla.', 'warning')
+                return redirect(url_for('admin_export_questions_document_route'))
+            return document_response(build)
+
         except Exception as e:
             flash(f'Virhe dokumentin luomisessa: {str(e)}', 'danger')
             app.logger.error(f"Document export error: {e}")
@@ -2503,310 +2855,6 @@ def admin_export_questions_document_route():
         return redirect(url_for('admin_route'))
 
 
-def create_pdf_document(questions, include_answers, duplicate_info=None):
-    """Luo ammattimaisen PDF-dokumentin kysymyksistä."""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, 
-                            topMargin=0.75*inch, 
-                            bottomMargin=0.75*inch,
-                            leftMargin=0.75*inch,
-                            rightMargin=0.75*inch)
-    
-    # Tyylit
-    styles = getSampleStyleSheet()
-    
-    # Otsikkotyyli
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#5A67D8'),
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    # Alaotsikkotyyli
-    subtitle_style = ParagraphStyle(
-        'Subtitle',
-        parent=styles['Normal'],
-        fontSize=12,
-        textColor=colors.HexColor('#718096'),
-        spaceAfter=20,
-        alignment=TA_CENTER
-    )
-    
-    # Kysymystyyli
-    question_style = ParagraphStyle(
-        'Question',
-        parent=styles['Normal'],
-        fontSize=11,
-        fontName='Helvetica-Bold',
-        spaceAfter=8,
-        textColor=colors.HexColor('#2D3748')
-    )
-    
-    # Vastausvaihtoehtotyyli
-    option_style = ParagraphStyle(
-        'Option',
-        parent=styles['Normal'],
-        fontSize=10,
-        leftIndent=20,
-        spaceAfter=4
-    )
-    
-    # Selitystyyli
-    explanation_style = ParagraphStyle(
-        'Explanation',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.HexColor('#4A5568'),
-        leftIndent=10,
-        rightIndent=10,
-        spaceAfter=6,
-        borderWidth=1,
-        borderColor=colors.HexColor('#E2E8F0'),
-        borderPadding=8,
-        backColor=colors.HexColor('#F7FAFC')
-    )
-    
-    # Metatietotyyli
-    meta_style = ParagraphStyle(
-        'Meta',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.HexColor('#A0AEC0'),
-        spaceAfter=12
-    )
-    
-    # Rakenna dokumentti
-    story = []
-    
-    # Otsikko
-    story.append(Paragraph("LOVe Enhanced", title_style))
-    story.append(Paragraph("Kysymyspankki", subtitle_style))
-    story.append(Paragraph(f"Luotu: {datetime.now().strftime('%d.%m.%Y %H:%M')}", meta_style))
-    story.append(Paragraph(f"Kysymyksiä yhteensä: {len(questions)}", meta_style))
-    
-    if duplicate_info:
-        warning_style = ParagraphStyle('Warning', parent=styles['Normal'], fontSize=10, 
-                                       textColor=colors.HexColor('#F59E0B'))
-        story.append(Paragraph(duplicate_info, warning_style))
-    
-    story.append(Spacer(1, 0.3*inch))
-    
-    # Sisällysluettelo
-    story.append(Paragraph("Sisällysluettelo", styles['Heading2']))
-    
-    category_counts = {}
-    for q in questions:
-        cat = q['category']
-        category_counts[cat] = category_counts.get(cat, 0) + 1
-    
-    toc_data = [['Kategoria', 'Kysymyksiä']]
-    for cat, count in sorted(category_counts.items()):
-        toc_data.append([cat.title(), str(count)])
-    
-    toc_table = Table(toc_data, colWidths=[4*inch, 1.5*inch])
-    toc_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#5A67D8')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F7FAFC')),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E2E8F0')),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F7FAFC')])
-    ]))
-    
-    story.append(toc_table)
-    story.append(PageBreak())
-    
-    # Kysymykset
-    current_category = None
-    
-    for idx, q in enumerate(questions, 1):
-        # Kategorian otsikko
-        if q['category'] != current_category:
-            current_category = q['category']
-            story.append(Spacer(1, 0.2*inch))
-            story.append(Paragraph(f"Kategoria: {current_category.title()}", styles['Heading2']))
-            story.append(Spacer(1, 0.1*inch))
-        
-        # Kysymyksen numero ja teksti
-        question_text = f"<b>{idx}.</b> {q['question']}"
-        story.append(Paragraph(question_text, question_style))
-        
-        # Metatiedot
-        difficulty_map = {'helppo': 'Helppo', 'keskivaikea': 'Keskivaikea', 'vaikea': 'Vaikea'}
-        meta_text = f"Vaikeustaso: {difficulty_map.get(q['difficulty'], q['difficulty'])} | ID: {q['id']}"
-        story.append(Paragraph(meta_text, meta_style))
-        
-        # Vastausvaihtoehdot
-        letters = ['A', 'B', 'C', 'D']
-        for i, option in enumerate(q['options']):
-            if include_answers and i == q['correct']:
-                option_text = f"<b>{letters[i]}. {option} ✓</b>"
-                option_para = Paragraph(option_text, option_style)
-            else:
-                option_text = f"{letters[i]}. {option}"
-                option_para = Paragraph(option_text, option_style)
-            story.append(option_para)
-        
-        story.append(Spacer(1, 0.1*inch))
-        
-        # Selitys (jos vastaukset sisällytetään)
-        if include_answers:
-            correct_answer = letters[q['correct']]
-            explanation_text = f"<b>Oikea vastaus: {correct_answer}</b><br/>{q['explanation']}"
-            story.append(Paragraph(explanation_text, explanation_style))
-        
-        story.append(Spacer(1, 0.15*inch))
-        
-        # Sivunvaihto joka 5. kysymyksen jälkeen (vain jos ei ole viimeinen)
-        if idx % 5 == 0 and idx < len(questions):
-            story.append(PageBreak())
-    
-    # Rakenna PDF
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
-
-
-def create_word_document(questions, include_answers, duplicate_info=None):
-    """Luo ammattimaisen Word-dokumentin kysymyksistä."""
-    doc = Document()
-    
-    # Aseta marginaalit
-    sections = doc.sections
-    for section in sections:
-        section.top_margin = Inches(0.75)
-        section.bottom_margin = Inches(0.75)
-        section.left_margin = Inches(0.75)
-        section.right_margin = Inches(0.75)
-    
-    # Otsikko
-    title = doc.add_heading('LOVe Enhanced', 0)
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    title_run = title.runs[0]
-    title_run.font.color.rgb = RGBColor(90, 103, 216)
-    
-    subtitle = doc.add_heading('Kysymyspankki', level=2)
-    subtitle.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    # Metatiedot
-    meta = doc.add_paragraph()
-    meta.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    meta_run = meta.add_run(f'Luotu: {datetime.now().strftime("%d.%m.%Y %H:%M")}\n')
-    meta_run.font.size = Pt(10)
-    meta_run.font.color.rgb = RGBColor(160, 174, 192)
-    
-    meta_run2 = meta.add_run(f'Kysymyksiä yhteensä: {len(questions)}')
-    meta_run2.font.size = Pt(10)
-    meta_run2.font.color.rgb = RGBColor(160, 174, 192)
-    
-    if duplicate_info:
-        warning = doc.add_paragraph(duplicate_info)
-        warning_run = warning.runs[0]
-        warning_run.font.color.rgb = RGBColor(245, 158, 11)
-        warning_run.font.bold = True
-    
-    doc.add_paragraph()  # Tyhjä rivi
-    
-    # Sisällysluettelo
-    doc.add_heading('Sisällysluettelo', level=1)
-    
-    category_counts = {}
-    for q in questions:
-        cat = q['category']
-        category_counts[cat] = category_counts.get(cat, 0) + 1
-    
-    # Luo taulukko sisällysluettelosta
-    table = doc.add_table(rows=1, cols=2)
-    table.style = 'Light Grid Accent 1'
-    
-    hdr_cells = table.rows[0].cells
-    hdr_cells[0].text = 'Kategoria'
-    hdr_cells[1].text = 'Kysymyksiä'
-    
-    for cat, count in sorted(category_counts.items()):
-        row_cells = table.add_row().cells
-        row_cells[0].text = cat.title()
-        row_cells[1].text = str(count)
-    
-    doc.add_page_break()
-    
-    # Kysymykset
-    current_category = None
-    letters = ['A', 'B', 'C', 'D']
-    
-    for idx, q in enumerate(questions, 1):
-        # Kategorian otsikko
-        if q['category'] != current_category:
-            current_category = q['category']
-            doc.add_paragraph()  # Tyhjä rivi
-            cat_heading = doc.add_heading(f'Kategoria: {current_category.title()}', level=1)
-            cat_heading.runs[0].font.color.rgb = RGBColor(90, 103, 216)
-        
-        # Kysymys
-        question_para = doc.add_paragraph()
-        q_run = question_para.add_run(f'{idx}. ')
-        q_run.bold = True
-        q_run.font.size = Pt(11)
-        
-        q_text_run = question_para.add_run(q['question'])
-        q_text_run.font.size = Pt(11)
-        
-        # Metatiedot
-        difficulty_map = {'helppo': 'Helppo', 'keskivaikea': 'Keskivaikea', 'vaikea': 'Vaikea'}
-        meta_para = doc.add_paragraph()
-        meta_para_run = meta_para.add_run(
-            f'Vaikeustaso: {difficulty_map.get(q["difficulty"], q["difficulty"])} | ID: {q["id"]}'
-        )
-        meta_para_run.font.size = Pt(8)
-        meta_para_run.font.color.rgb = RGBColor(160, 174, 192)
-        
-        # Vastausvaihtoehdot
-        for i, option in enumerate(q['options']):
-            option_para = doc.add_paragraph(style='List Bullet')
-            option_para.paragraph_format.left_indent = Inches(0.25)
-            
-            if include_answers and i == q['correct']:
-                opt_run = option_para.add_run(f'{letters[i]}. {option} ✓')
-                opt_run.bold = True
-                opt_run.font.color.rgb = RGBColor(72, 187, 120)
-            else:
-                opt_run = option_para.add_run(f'{letters[i]}. {option}')
-            opt_run.font.size = Pt(10)
-        
-        # Selitys
-        if include_answers:
-            explanation_para = doc.add_paragraph()
-            explanation_para.paragraph_format.left_indent = Inches(0.15)
-            explanation_para.paragraph_format.right_indent = Inches(0.15)
-            
-            exp_header = explanation_para.add_run(f'Oikea vastaus: {letters[q["correct"]]}\n')
-            exp_header.bold = True
-            exp_header.font.size = Pt(9)
-            
-            exp_text = explanation_para.add_run(q['explanation'])
-            exp_text.font.size = Pt(9)
-            exp_text.font.color.rgb = RGBColor(74, 85, 104)
-        
-        # Erotin
-        doc.add_paragraph('_' * 80)
-        
-        # Sivunvaihto joka 5. kysymyksen jälkeen
-        if idx % 5 == 0 and idx < len(questions):
-            doc.add_page_break()
-    
-    # Tallenna muistiin
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer  
-
 @app.route("/admin/merge_categories", methods=['POST'])
 @admin_required
 def admin_merge_categories_route():
@@ -2832,47 +2880,33 @@ def admin_merge_categories_route():
     
     return redirect(url_for('admin_route'))
 
+
+def export_response(chunks, filename, fmt):
+    """Virtaava latausvastaus kysymysviennille (logic/question_export.py)."""
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Type': f'{mimetype}; charset=utf-8',
+        'Content-Disposition': f'attachment; filename={filename}',
+        'X-Accel-Buffering': 'no',
+    })
+
+
 @app.route("/admin/export_questions")
 @admin_required
 def admin_export_questions_route():
-    """Vie kaikki kysymykset JSON-tiedostoon."""
-    try:
-        questions = execute_query("""
-            SELECT id, question, explanation, options, correct, category, difficulty, created_at
-            FROM questions
-            ORDER BY category, id
-        """, fetch='all')
-        
-        questions_list = []
-        for q in questions:
-            questions_list.append({
-                'id': q['id'],
-                'question': q['question'],
-                'explanation': q['explanation'],
-                'options': json.loads(q['options']),
-                'correct': q['correct'],
-                'category': q['category'],
-                'difficulty': q['difficulty'],
-                'created_at': q['created_at'].isoformat() if q['created_at'] else None
-            })
-        
-        json_data = json.dumps(questions_list, ensure_ascii=False, indent=2)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'love_questions_backup_{timestamp}.json'
-        
-        app.logger.info(f"Admin {current_user.username} exported {len(questions_list)} questions")
-        
-        from flask import make_response
-        response = make_response(json_data)
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-        
-        return response
-        
-    except Exception as e:
-        flash(f'Virhe kysymysten viennissä: {str(e)}', 'danger')
-        app.logger.error(f"Export error: {e}")
-        return redirect(url_for('admin_route'))
+    """Vie kaikki kysymykset JSON-tiedostoon (virtaavasti; ?format=ndjson = yksi kysymys per rivi)."""
+    fmt = request.args.get('format', 'json')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'json'
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f'love_questions_backup_{timestamp}.{fmt}'
+
+    app.logger.info(f"Admin {current_user.username} started question export ({fmt})")
+    return export_response(
+        export_questions(db_manager, ('id', 'question', 'explanation', 'options', 'correct', 'category', 'difficulty', 'created_at'), fmt),
+        filename, fmt
+    )
+
 
 @app.route('/admin/edit_user_settings/<int:user_id>', methods=['POST'])
 @login_required
@@ -2897,44 +2931,14 @@ def edit_user_settings(user_id):
 @app.route("/admin/export_pdf", methods=['GET'])
 @admin_required
 def admin_export_pdf_quick():
-    """Vie kaikki kysymykset PDF-tiedostoon."""
+    """Vie kaikki kysymykset PDF-tiedostoon (valmis dokumentti palvellaan välimuistista)."""
     try:
-        questions = execute_query("""
-            SELECT id, question, explanation, options, correct, category, difficulty
-            FROM questions
-            ORDER BY category, id
-        """, fetch='all')
-        
-        if not questions:
+        build = document_build_manager.request('pdf', include_answers=True, sort_by='category')
+        if build is None:
             flash('Ei kysymyksiä vietäväksi.', 'warning')
             return redirect(url_for('admin_route'))
-        
-        questions_list = []
-        for q in questions:
-            questions_list.append({
-                'id': q['id'],
-                'question': q['question'],
-                'options': json.loads(q['options']),
-                'correct': q['correct'],
-                'explanation': q['explanation'],
-                'category': q['category'],
-                'difficulty': q['difficulty']
-            })
-        
-        pdf_buffer = create_pdf_document(questions_list, include_answers=True, duplicate_info=None)
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'LOVe_Kysymykset_{timestamp}.pdf'
-        
-        app.logger.info(f"Admin {current_user.username} exported {len(questions_list)} questions to PDF")
-        
-        from flask import make_response
-        response = make_response(pdf_buffer.getvalue())
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-        
-        return response
-        
+        return document_response(build)
+
     except Exception as e:
         flash(f'Virhe PDF-viennissä: {str(e)}', 'danger')
         app.logger.error(f"PDF export error: {e}")
@@ -2946,44 +2950,14 @@ def admin_export_pdf_quick():
 @app.route("/admin/export_word", methods=['GET'])
 @admin_required
 def admin_export_word_quick():
-    """Vie kaikki kysymykset Word-tiedostoon."""
+    """Vie kaikki kysymykset Word-tiedostoon (valmis dokumentti palvellaan välimuistista)."""
     try:
-        questions = execute_query("""
-            SELECT id, question, explanation, options, correct, category, difficulty
-            FROM questions
-            ORDER BY category, id
-        """, fetch='all')
-        
-        if not questions:
+        build = document_build_manager.request('word', include_answers=True, sort_by='category')
+        if build is None:
             flash('Ei kysymyksiä vietäväksi.', 'warning')
             return redirect(url_for('admin_route'))
-        
-        questions_list = []
-        for q in questions:
-            questions_list.append({
-                'id': q['id'],
-                'question': q['question'],
-                'options': json.loads(q['options']),
-                'correct': q['correct'],
-                'explanation': q['explanation'],
-                'category': q['category'],
-                'difficulty': q['difficulty']
-            })
-        
-        doc_buffer = create_word_document(questions_list, include_answers=True, duplicate_info=None)
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'LOVe_Kysymykset_{timestamp}.docx'
-        
-        app.logger.info(f"Admin {current_user.username} exported {len(questions_list)} questions to Word")
-        
-        from flask import make_response
-        response = make_response(doc_buffer.getvalue())
-        response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-        
-        return response
-        
+        return document_response(build)
+
     except Exception as e:
         flash(f'Virhe Word-viennissä: {str(e)}', 'danger')
         app.logger.error(f"Word export error: {e}")
@@ -2995,50 +2969,23 @@ def admin_export_word_quick():
 @app.route("/admin/export_json", methods=['GET'])
 @admin_required
 def admin_export_json_quick():
-    """Vie kaikki kysymykset JSON-tiedostoon."""
-    try:
-        questions = execute_query("""
-            SELECT id, question, explanation, options, correct, category, difficulty
-            FROM questions
-            ORDER BY category, id
-        """, fetch='all')
-        
-        if not questions:
-            flash('Ei kysymyksiä vietäväksi.', 'warning')
-            return redirect(url_for('admin_route'))
-        
-        questions_list = []
-        for q in questions:
-            questions_list.append({
-                'id': q['id'],
-                'question': q['question'],
-                'options': json.loads(q['options']),
-                'correct': q['correct'],
-                'explanation': q['explanation'],
-                'category': q['category'],
-                'difficulty': q['difficulty']
-            })
-        
-        # Luo JSON response
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'LOVe_Kysymykset_{timestamp}.json'
-        
-        app.logger.info(f"Admin {current_user.username} exported {len(questions_list)} questions to JSON")
-        
-        from flask import make_response
-        response = make_response(json.dumps(questions_list, indent=2, ensure_ascii=False))
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-        
-        return response
-        
-    except Exception as e:
-        flash(f'Virhe JSON-viennissä: {str(e)}', 'danger')
-        app.logger.error(f"JSON export error: {e}")
-        import traceback
-        traceback.print_exc()
+    """Vie kaikki kysymykset JSON-tiedostoon (virtaavasti; ?format=ndjson = yksi kysymys per rivi)."""
+    if not db_manager.get_total_question_count():
+        flash('Ei kysymyksiä vietäväksi.', 'warning')
         return redirect(url_for('admin_route'))
-       
+
+    fmt = request.args.get('format', 'json')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'json'
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f'LOVe_Kysymykset_{timestamp}.{fmt}'
+
+    app.logger.info(f"Admin {current_user.username} started question export to JSON ({fmt})")
+    return export_response(
+        export_questions(db_manager, ('id', 'question', 'options', 'correct', 'explanation', 'category', 'difficulty'), fmt),
+        filename, fmt
+    )
+
 #==============================================================================
 # --- VIRHEKÄSITTELY ---
 #==============================================================================
@@ -2,19 +2,26 @@
 # -*- coding: utf-8 -*-
 # data_access/database_manager.py
 import sqlite3
+import hashlib
 import json
 import os
 import logging
-from datetime import datetime
+import uuid
+from datetime import datetime, timedelta
 from models.models import Question
+from logic.question_fingerprint import FingerprintSet, normalize_question, question_fingerprint
+from logic.question_search import SQLITE_BM25_WEIGHTS, fts5_query, tsquery
+from logic.question_validation import prepare_row, row_hash
 import random
-from difflib import SequenceMatcher
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2.extras import DictCursor, execute_batch, execute_values
 
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
+    # Kysymysten sormenjäljet muistissa (ladataan ensimmäisellä tarkistuksella)
+    _fingerprints = None
+
     def __init__(self, db_path=None):
         self.database_url = os.environ.get('DATABASE_URL')
         self.is_postgres = self.database_url is not None
@@ -64,6 +71,59 @@ class DatabaseManager:
             if conn:
                 conn.close()
 
+    def _cursor(self, conn, name=None):
+        """
+        Palauttaa kursorin, jonka rivit ovat sarakenimellä indeksoitavia.
+        name: PostgreSQL:ssä nimetty (palvelinpuolen) kursori, jolta rivit haetaan erissä.
+        """
+        if self.is_postgres:
+            return conn.cursor(name=name, cursor_factory=DictCursor)
+        return conn.cursor()
+
+    def _fetch_in_chunks(self, query, params=(), chunk_size=10000):
+        """
+        Suorittaa kyselyn ja palauttaa rivit paloina (generaattori).
+        Koko tulosjoukkoa ei ladata kerralla muistiin: PostgreSQL:ssä rivit
+        luetaan nimetyltä palvelinpuolen kursorilta chunk_size kerrallaan,
+        SQLitessä kursori lukee rivejä sitä mukaa kuin niitä haetaan.
+        """
+        query = query.replace('?', self.param_style)
+        conn = self.get_connection()
+        try:
+            cur = self._cursor(conn, name=f"chunks_{uuid.uuid4().hex}")
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+            cur.close()
+        finally:
+            conn.close()
+
+    def _executemany(self, query, params_seq, pre_statements=()):
+        """
+        Suorittaa saman kyselyn usealle parametririville yhdessä transaktiossa.
+        pre_statements ajetaan samassa transaktiossa ennen riviä (esim. DELETE).
+        """
+        query = query.replace('?', self.param_style)
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            for statement, statement_params in pre_statements:
+                cur.execute(statement.replace('?', self.param_style), statement_params)
+            if self.is_postgres:
+                execute_batch(cur, query, params_seq, page_size=1000)
+            else:
+                cur.executemany(query, params_seq)
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
     def init_database(self):
         """Luo kaikki tarvittavat tietokantataulut."""
         id_type = "SERIAL PRIMARY KEY" if self.is_postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"
@@ -151,6 +211,227 @@ class DatabaseManager:
         self._add_column_if_not_exists('questions', 'validated_by', 'INTEGER')
         self._add_column_if_not_exists('questions', 'validated_at', 'TIMESTAMP')
         self._add_column_if_not_exists('questions', 'validation_comment', 'TEXT')
+        self._add_column_if_not_exists('question_attempts', 'selected_option', 'INTEGER')
+        self._create_table_if_not_exists('question_item_stats', """
+            question_id INTEGER PRIMARY KEY,
+            attempts INTEGER NOT NULL,
+            p_value REAL,
+            discrimination REAL,
+            median_time REAL,
+            option_counts TEXT,
+            computed_at TIMESTAMP
+        """)
+        id_type = "SERIAL PRIMARY KEY" if self.is_postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"
+        self._create_table_if_not_exists('study_sessions', f"""
+            id {id_type},
+            user_id INTEGER NOT NULL,
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            session_type TEXT,
+            categories TEXT,
+            questions_answered INTEGER DEFAULT 0,
+            questions_correct INTEGER DEFAULT 0
+        """)
+        self._create_table_if_not_exists('user_features', """
+            user_id INTEGER PRIMARY KEY,
+            answered_questions INTEGER DEFAULT 0,
+            total_attempts INTEGER DEFAULT 0,
+            total_correct INTEGER DEFAULT 0,
+            category_stats TEXT,
+            weakest_category TEXT,
+            weakest_success_rate REAL,
+            due_count INTEGER DEFAULT 0,
+            current_streak INTEGER DEFAULT 0,
+            longest_streak INTEGER DEFAULT 0,
+            last_practice_date TEXT,
+            simulation_count INTEGER DEFAULT 0,
+            updated_at TIMESTAMP
+        """)
+        # Sormenjälki normalisoidusta tekstistä: duplikaattitarkistus yksilöllistä indeksiä vasten
+        self._add_column_if_not_exists('questions', 'fingerprint', 'TEXT')
+        self._backfill_fingerprints()
+        self._create_index_if_not_exists('idx_questions_fingerprint', 'questions', 'fingerprint', unique=True)
+        self._add_column_if_not_exists('user_question_progress', 'memory_stability', 'REAL')
+        self._add_column_if_not_exists('user_question_progress', 'memory_difficulty', 'REAL')
+        self._create_table_if_not_exists('review_log', f"""
+            id {id_type},
+            user_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            reviewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            rating INTEGER NOT NULL,
+            correct {'BOOLEAN' if self.is_postgres else 'INTEGER'} NOT NULL,
+            time_taken REAL,
+            scheduler TEXT
+        """)
+        self._create_table_if_not_exists('memory_model_params', """
+            user_id INTEGER PRIMARY KEY,
+            weights TEXT NOT NULL,
+            log_loss REAL,
+            reviews INTEGER,
+            fitted_at TIMESTAMP
+        """)
+        self._create_table_if_not_exists('review_queues', """
+            user_id INTEGER PRIMARY KEY,
+            queue_date TEXT NOT NULL,
+            question_ids TEXT NOT NULL,
+            answered_ids TEXT NOT NULL,
+            updated_at TIMESTAMP
+        """)
+        # Erääntymispäivä tallennetaan sarakkeeseen, jotta erääntyneiden laskenta käyttää indeksiä
+        self._add_column_if_not_exists('user_question_progress', 'due_date', 'DATE')
+        self._backfill_due_dates()
+        self._create_index_if_not_exists('idx_progress_user_due', 'user_question_progress', 'user_id, due_date')
+        self._add_column_if_not_exists('review_queues', 'policy', "TEXT DEFAULT 'due'")
+        self._create_table_if_not_exists('question_minhash', """
+            question_id INTEGER PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            signature TEXT NOT NULL,
+            updated_at TIMESTAMP
+        """)
+        # Parien samankaltaisuuspisteet tekstitiivisteiden mukaan (hash1 <= hash2)
+        self._create_table_if_not_exists('question_similarity', """
+            hash1 TEXT NOT NULL,
+            hash2 TEXT NOT NULL,
+            score REAL NOT NULL,
+            computed_at TIMESTAMP,
+            PRIMARY KEY (hash1, hash2)
+        """)
+        self._create_index_if_not_exists('idx_question_similarity_score', 'question_similarity', 'score')
+        self._create_index_if_not_exists('idx_question_minhash_hash', 'question_minhash', 'content_hash')
+        self._create_search_index()
+        self._create_table_if_not_exists('import_jobs', """
+            id TEXT PRIMARY KEY,
+            filename TEXT,
+            file_path TEXT,
+            status TEXT NOT NULL,
+            rows_read INTEGER DEFAULT 0,
+            rows_added INTEGER DEFAULT 0,
+            rows_duplicate INTEGER DEFAULT 0,
+            rows_skipped INTEGER DEFAULT 0,
+            errors TEXT,
+            bytes_total INTEGER,
+            bytes_read INTEGER DEFAULT 0,
+            created_by INTEGER,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            mode TEXT DEFAULT 'insert',
+            rows_updated INTEGER DEFAULT 0
+        """)
+        self._add_column_if_not_exists('import_jobs', 'mode', "TEXT DEFAULT 'insert'")
+        self._add_column_if_not_exists('import_jobs', 'rows_updated', 'INTEGER DEFAULT 0')
+
+    def _backfill_due_dates(self):
+        """Laskee due_date-sarakkeen riveille, joilta se puuttuu (last_shown + interval)."""
+        if self.is_postgres:
+            due_expr = "CAST(last_shown + (interval * INTERVAL '1 day') AS DATE)"
+        else:
+            due_expr = "DATE(last_shown, '+' || interval || ' days')"
+        try:
+            self._execute(f"""
+                UPDATE user_question_progress SET due_date = {due_expr}
+                WHERE due_date IS NULL AND last_shown IS NOT NULL
+            """)
+        except Exception as e:
+            logger.error(f"Virhe erääntymispäivien täytössä: {e}")
+
+    def _backfill_fingerprints(self):
+        """
+        Laskee normalisoidun tekstin ja sormenjäljen kysymyksille, joilta se puuttuu.
+        Jo kannassa olevista duplikaateista vain vanhin saa sormenjäljen, jotta
+        yksilöllinen indeksi voidaan luoda.
+        """
+        try:
+            rows = self._execute("SELECT id, question FROM questions WHERE fingerprint IS NULL ORDER BY id", fetch='all') or []
+            if not rows:
+                return
+            taken = {row['fingerprint'] for row in self._execute("SELECT fingerprint FROM questions WHERE fingerprint IS NOT NULL", fetch='all') or []}
+            updates, duplicates = [], 0
+            for row in rows:
+                fingerprint = question_fingerprint(row['question'])
+                if fingerprint in taken:
+                    duplicates += 1
+                    fingerprint = None
+                else:
+                    taken.add(fingerprint)
+                updates.append((normalize_question(row['question']), fingerprint, row['id']))
+            self._executemany("UPDATE questions SET question_normalized = ?, fingerprint = ? WHERE id = ?", updates)
+            if duplicates:
+                logger.warning(f"Sormenjälkien täyttö: {duplicates} kysymystä on jo kannassa toiseen kertaan (ei sormenjälkeä)")
+        except Exception as e:
+            logger.error(f"Virhe sormenjälkien täytössä: {e}")
+
+    def _create_search_index(self):
+        """
+        Tekstihaun indeksi (ks. logic/question_search.py): PostgreSQL:ssä
+        tsvector-sarake ja GIN-indeksi, SQLitessä FTS5-virtuaalitaulu.
+        """
+        if self.is_postgres:
+            self._add_column_if_not_exists('questions', 'search_vector', 'tsvector')
+            self._create_index_if_not_exists('idx_questions_search', 'questions', 'search_vector', method='GIN')
+        else:
+            try:
+                self._execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+                        question, options, explanation,
+                        tokenize = 'unicode61 remove_diacritics 2',
+                        prefix = '3 4'
+                    )
+                """)
+            except Exception as e:
+                logger.error(f"Virhe hakuindeksin luomisessa: {e}")
+                return
+        self._refresh_search_index()
+
+    def _refresh_search_index(self, question_ids=None):
+        """
+        Päivittää kysymysten hakuindeksin rivit. question_ids=None indeksoi
+        kaikki kysymykset, joilta indeksi puuttuu (täyttö ja massalisäys).
+        Vaihtoehdot puretaan JSON:sta, jotta ääkköset indeksoidaan sellaisinaan.
+        """
+        if question_ids is not None and not question_ids:
+            return
+        placeholders = ','.join(['?'] * len(question_ids)) if question_ids else ''
+        params = tuple(question_ids or ())
+        try:
+            if self.is_postgres:
+                where = f"id IN ({placeholders})" if question_ids else "search_vector IS NULL"
+                self._execute(f"""
+                    UPDATE questions SET search_vector =
+                        setweight(to_tsvector('finnish', COALESCE(question, '')), 'A') ||
+                        setweight(to_tsvector('finnish', COALESCE(
+                            (SELECT string_agg(value, ' ') FROM json_array_elements_text(options::json)), '')), 'B') ||
+                        setweight(to_tsvector('finnish', COALESCE(explanation, '')), 'C')
+                    WHERE {where}
+                """, params)
+            else:
+                if question_ids:
+                    self._execute(f"DELETE FROM questions_fts WHERE rowid IN ({placeholders})", params)
+                where = f"id IN ({placeholders})" if question_ids else "id NOT IN (SELECT rowid FROM questions_fts)"
+                self._execute(f"""
+                    INSERT INTO questions_fts (rowid, question, options, explanation)
+                    SELECT id, question,
+                           (SELECT group_concat(value, ' ') FROM json_each(questions.options)),
+                           explanation
+                    FROM questions WHERE {where}
+                """, params)
+        except Exception as e:
+            logger.error(f"Virhe hakuindeksin päivityksessä: {e}")
+
+    def _create_index_if_not_exists(self, index_name, table_name, columns_sql, unique=False, method=None):
+        """Apufunktio indeksin luomiseksi migraatiossa (method esim. 'GIN')."""
+        try:
+            using = f" USING {method}" if method else ""
+            self._execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {index_name} ON {table_name}{using} ({columns_sql})")
+        except Exception as e:
+            logger.error(f"Virhe indeksin '{index_name}' luomisessa: {e}")
+
+    def _create_table_if_not_exists(self, table_name, columns_sql):
+        """Apufunktio taulun luomiseksi migraatiossa, jos sitä ei ole olemassa."""
+        try:
+            self._execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({columns_sql})")
+        except Exception as e:
+            logger.error(f"Virhe taulun '{table_name}' luomisessa: {e}")
 
     # data_access/database_manager.py
 
@@ -428,18 +709,23 @@ class DatabaseManager:
             logger.error(f"Virhe kategorian kysymysten haussa: {e}")
             return []
 
-    def record_question_attempt(self, user_id, question_id, correct, time_taken):
-        """Tallentaa kysymykseen vastaamisen yrityksen."""
+    def record_question_attempt(self, user_id, question_id, correct, time_taken, selected_option=None):
+        """Tallentaa kysymykseen vastaamisen yrityksen (ja valitun vaihtoehdon indeksin)."""
         try:
             self._execute(
-                "INSERT INTO question_attempts (user_id, question_id, correct, time_taken, timestamp) VALUES (?, ?, ?, ?, ?)", 
-                (user_id, question_id, correct, time_taken, datetime.now())
+                "INSERT INTO question_attempts (user_id, question_id, correct, time_taken, timestamp, selected_option) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, question_id, correct, time_taken, datetime.now(), selected_option)
             )
             return True, None
         except Exception as e:
             logger.error(f"Virhe yrityksen tallennuksessa: {e}")
             return False, str(e)
 
+    def update_question_stats(self, question_id, is_correct, time_taken, user_id, selected_option=None):
+        """Tallentaa vastauksen: edistyminen ja yksittäinen yritys."""
+        self.update_question_progress(user_id, question_id, is_correct)
+        return self.record_question_attempt(user_id, question_id, is_correct, time_taken, selected_option)
+
     def update_question_progress(self, user_id, question_id, correct):
         """Päivittää käyttäjän edistymisen kysymyksessä."""
         try:
@@ -449,17 +735,20 @@ class DatabaseManager:
                 fetch='one'
             )
 
+            now = datetime.now()
             if existing:
                 new_times_shown = existing['times_shown'] + 1
                 new_times_correct = existing['times_correct'] + (1 if correct else 0)
+                due_date = (now + timedelta(days=existing['interval'] or 1)).date().isoformat()
                 self._execute(
-                    "UPDATE user_question_progress SET times_shown = ?, times_correct = ?, last_shown = ? WHERE user_id = ? AND question_id = ?", 
-                    (new_times_shown, new_times_correct, datetime.now(), user_id, question_id)
+                    "UPDATE user_question_progress SET times_shown = ?, times_correct = ?, last_shown = ?, due_date = ? WHERE user_id = ? AND question_id = ?", 
+                    (new_times_shown, new_times_correct, now, due_date, user_id, question_id)
                 )
             else:
+                due_date = (now + timedelta(days=1)).date().isoformat()
                 self._execute(
-                    "INSERT INTO user_question_progress (user_id, question_id, times_shown, times_correct, last_shown) VALUES (?, ?, 1, ?, ?)", 
-                    (user_id, question_id, 1 if correct else 0, datetime.now())
+                    "INSERT INTO user_question_progress (user_id, question_id, times_shown, times_correct, last_shown, due_date) VALUES (?, ?, 1, ?, ?, ?)", 
+                    (user_id, question_id, 1 if correct else 0, now, due_date)
                 )
             
             return True, None
@@ -498,23 +787,96 @@ class DatabaseManager:
             logger.error(f"Virhe kysymysten haussa: {e}")
             return []
 
+    def iter_cohort_mistakes(self, chunk_size=5000):
+        """
+        Kaikkien aktiivisten opiskelijoiden kuittaamattomat virheet yhdellä kyselyllä
+        (sama ehto kuin /api/incorrect_questions), opiskelijoittain järjestettynä
+        heikoimmasta onnistumisesta alkaen. Generaattori tuottaa rivipaloja.
+        """
+        yield from self._fetch_in_chunks("""
+            SELECT
+                u.id AS user_id, u.username,
+                q.id AS question_id, q.question, q.options, q.correct, q.explanation, q.category, q.difficulty,
+                p.times_shown, p.times_correct,
+                ROUND((p.times_correct * 100.0) / NULLIF(p.times_shown, 0), 1) AS success_rate
+            FROM users u
+            INNER JOIN user_question_progress p ON p.user_id = u.id
+            INNER JOIN questions q ON q.id = p.question_id
+            WHERE u.role = 'user' AND u.status = 'active'
+                AND p.times_correct < p.times_shown
+                AND (p.mistake_acknowledged IS NULL OR p.mistake_acknowledged = ?)
+            ORDER BY u.id, success_rate ASC NULLS FIRST, p.times_shown DESC
+        """, (False,), chunk_size=chunk_size)
+
+    def get_question_bank_version(self):
+        """
+        Tiiviste kaikkien kysymysten sisällöstä (välimuistien avaimeksi): muuttuu,
+        kun kysymys lisätään, poistetaan tai sitä muokataan. PostgreSQL laskee
+        tiivisteen palvelimella; SQLitessä rivit tiivistetään paloina.
+        """
+        columns = "id, question, explanation, options, correct, category, difficulty"
+        if self.is_postgres:
+            row = self._execute(f"""
+                SELECT md5(COALESCE(string_agg(md5(CAST(({columns}) AS TEXT)), '' ORDER BY id), '')) AS version
+                FROM questions
+            """, fetch='one')
+            return row['version']
+        digest = hashlib.md5()
+        for rows in self._fetch_in_chunks(f"SELECT {columns} FROM questions ORDER BY id"):
+            for row in rows:
+                digest.update(json.dumps(list(row), ensure_ascii=False, default=str).encode('utf-8'))
+        return digest.hexdigest()
+
     def get_total_question_count(self):
         """Palauttaa kysymysten kokonaismäärän."""
         result = self._execute("SELECT COUNT(*) as count FROM questions", fetch='one')
         return result['count'] if result else 0
 
+    def normalize_question(self, question_text):
+        """Normalisoi kysymystekstin duplikaattivertailua varten."""
+        return normalize_question(question_text)
+
+    def _get_fingerprints(self):
+        """Palauttaa muistissa pidettävän sormenjälkijoukon (ladataan tarvittaessa)."""
+        if self._fingerprints is None:
+            rows = self._execute("SELECT id, fingerprint FROM questions WHERE fingerprint IS NOT NULL", fetch='all') or []
+            self._fingerprints = FingerprintSet((row['id'], row['fingerprint']) for row in rows)
+        return self._fingerprints
+
+    def check_question_duplicate(self, question_text, exclude_id=None):
+        """
+        Tarkistaa, onko kannassa jo kysymys samalla sormenjäljellä.
+        Palauttaa (True, kysymysrivi) tai (False, None).
+        """
+        fingerprint = question_fingerprint(question_text)
+        fingerprints = self._get_fingerprints()
+        if fingerprint not in fingerprints:
+            return False, None
+        row = self._execute("SELECT id, question, category FROM questions WHERE fingerprint = ?", (fingerprint,), fetch='one')
+        if not row:
+            # Muisti on vanhentunut (kysymys poistettu toisessa prosessissa)
+            fingerprints.discard(fingerprint)
+            return False, None
+        if row['id'] == exclude_id:
+            return False, None
+        return True, dict(row)
+
     def update_question(self, question_id, question_data):
         """Päivittää kysymyksen tiedot."""
         try:
             options_json = json.dumps(question_data['options'])
+            fingerprint = question_fingerprint(question_data['question'])
             self._execute(
                 """UPDATE questions SET 
-                   question = ?, explanation = ?, options = ?, correct = ?, 
+                   question = ?, question_normalized = ?, fingerprint = ?, explanation = ?, options = ?, correct = ?, 
                    category = ?, difficulty = ? 
                    WHERE id = ?""",
-                (question_data['question'], question_data['explanation'], options_json,
+                (question_data['question'], normalize_question(question_data['question']), fingerprint,
+                 question_data['explanation'], options_json,
                  question_data['correct'], question_data['category'], question_data['difficulty'], question_id)
             )
+            self._fingerprints = None
+            self._refresh_search_index([question_id])
             return True, None
         except Exception as e:
             logger.error(f"Virhe kysymyksen päivityksessä: {e}")
@@ -524,90 +886,622 @@ class DatabaseManager:
         """Lisää uuden kysymyksen."""
         try:
             options_json = json.dumps(question_data['options'])
-            normalized = question_data['question'].lower().strip()
+            fingerprint = question_fingerprint(question_data['question'])
             
             self._execute(
                 """INSERT INTO questions 
-                   (question, question_normalized, explanation, options, correct, category, difficulty, created_at) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                (question_data['question'], normalized, question_data['explanation'], options_json,
+                   (question, question_normalized, fingerprint, explanation, options, correct, category, difficulty, created_at) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (question_data['question'], normalize_question(question_data['question']), fingerprint,
+                 question_data['explanation'], options_json,
                  question_data['correct'], question_data['category'], question_data['difficulty'], datetime.now())
             )
+            self._get_fingerprints().add(fingerprint)
+            row = self._execute("SELECT id FROM questions WHERE fingerprint = ?", (fingerprint,), fetch='one')
+            if row:
+                self._refresh_search_index([row['id']])
             return True, None
         except Exception as e:
             logger.error(f"Virhe kysymyksen lisäämisessä: {e}")
             return False, str(e)
 
-    def bulk_add_questions(self, questions_list):
-        """Lisää useita kysymyksiä kerralla."""
-        stats = {'added': 0, 'skipped': 0, 'errors': []}
-        
-        for q_data in questions_list:
-            try:
-                options_json = json.dumps(q_data['options'])
-                normalized = q_data['question'].lower().strip()
-                
-                existing = self._execute(
-                    "SELECT id FROM questions WHERE question_normalized = ?", 
-                    (normalized,), 
-                    fetch='one'
-                )
-                
-                if existing:
-                    stats['skipped'] += 1
+    QUESTION_INSERT_COLUMNS = ('question', 'question_normalized', 'fingerprint', 'explanation', 'options',
+                               'correct', 'category', 'difficulty', 'created_at')
+
+    def _question_row(self, q_data, fingerprint, created_at):
+        """Muodostaa questions-taulun rivin QUESTION_INSERT_COLUMNS-järjestyksessä."""
+        return (q_data['question'], normalize_question(q_data['question']), fingerprint, q_data['explanation'],
+                json.dumps(q_data['options']), q_data['correct'], q_data['category'], q_data['difficulty'], created_at)
+
+    def _insert_rows(self, table_name, columns, rows):
+        """
+        Lisää rivit yhdessä transaktiossa: PostgreSQL:ssä execute_values
+        (monirivinen INSERT, 1000 riviä per lause), SQLitessä executemany.
+        """
+        column_sql = ', '.join(columns)
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            if self.is_postgres:
+                execute_values(cur, f"INSERT INTO {table_name} ({column_sql}) VALUES %s", rows, page_size=1000)
+            else:
+                cur.executemany(f"INSERT INTO {table_name} ({column_sql}) VALUES ({', '.join(['?'] * len(columns))})", rows)
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def insert_questions_batch(self, questions_list, row_fallback=False):
+        """
+        Lisää valmiiksi tarkistetut kysymykset yhdessä transaktiossa. Kannassa jo
+        olevat (sormenjälki) ja erän sisäiset duplikaatit ohitetaan.
+        row_fallback=False: joko kaikki lisätään tai ei mitään.
+        row_fallback=True: epäonnistunut erä lisätään rivi kerrallaan, jotta
+        virheraportti kertoo epäonnistuneet rivit.
+        Palauttaa (True, {'added', 'duplicates', 'failed'}) tai (False, virhe);
+        failed: [(rivin indeksi questions_listissä, virhe)].
+        """
+        return self.insert_prepared_questions([prepare_row(q_data) for q_data in questions_list], row_fallback)
+
+    def insert_prepared_questions(self, prepared, row_fallback=False):
+        """
+        Kuten insert_questions_batch, mutta rivit ovat jo tallennusmuodossa
+        (logic/question_validation.prepare_row): [(sormenjälki, sarakkeet ilman created_at)].
+        Kuivaharjoituksen tarkistama erä tallennetaan näin ilman uutta jäsennystä.
+        """
+        fingerprints = self._get_fingerprints()
+        rows, indexes, seen, duplicates = [], [], set(), 0
+        now = datetime.now()
+        for index, (fingerprint, values) in enumerate(prepared):
+            if fingerprint in fingerprints or fingerprint in seen:
+                duplicates += 1
+                continue
+            seen.add(fingerprint)
+            rows.append(values + (now,))
+            indexes.append(index)
+        failed = []
+        try:
+            if rows:
+                self._insert_rows('questions', self.QUESTION_INSERT_COLUMNS, rows)
+        except Exception as e:
+            self._fingerprints = None
+            if not row_fallback:
+                logger.error(f"Virhe kysymyserän lisäämisessä: {e}")
+                return False, str(e)
+            logger.error(f"Virhe kysymyserän lisäämisessä, lisätään rivit yksitellen: {e}")
+            for index, row in zip(indexes, rows):
+                try:
+                    self._insert_rows('questions', self.QUESTION_INSERT_COLUMNS, [row])
+                except Exception as row_error:
+                    failed.append((index, str(row_error)))
+        else:
+            for fingerprint in seen:
+                fingerprints.add(fingerprint)
+        added = len(rows) - len(failed)
+        if added:
+            self._refresh_search_index()
+        return True, {'added': added, 'duplicates': duplicates, 'failed': failed}
+
+    QUESTION_UPDATE_COLUMNS = ('question', 'question_normalized', 'fingerprint', 'explanation', 'options',
+                               'correct', 'category', 'difficulty')
+
+    def _fetch_questions_by(self, column, values, chunk_size=500):
+        """Hakee kysymysrivit, joiden column on annetuissa arvoissa (IN-listat paloina)."""
+        values = list(values)
+        rows = []
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            rows.extend(self._execute(f"""
+                SELECT id, fingerprint, question, explanation, options, correct, category, difficulty
+                FROM questions WHERE {column} IN ({','.join(['?'] * len(chunk))})
+            """, tuple(chunk), fetch='all') or [])
+        return rows
+
+    def upsert_questions_batch(self, questions_list):
+        """
+        Tuonnin upsert-tila: rivi kohdistetaan id:n perusteella tai, jos id puuttuu
+        tai sitä ei ole kannassa, sormenjäljellä. Vain rivit, joiden sisältötiiviste
+        (logic/question_validation.row_hash) on muuttunut, päivitetään; uudet lisätään.
+        Kannasta haetaan vain erän rivit (id- ja sormenjälkilistat), ja kirjoitukset
+        tehdään yhdessä transaktiossa joukkolauseina.
+        Palauttaa (True, {'added', 'updated', 'unchanged', 'conflicts'}) tai (False, virhe);
+        conflicts: rivit, joiden uusi teksti on jo toisella kysymyksellä.
+        """
+        prepared = [(q_data, *prepare_row(q_data)) for q_data in questions_list]
+        by_id = {row['id']: row for row in self._fetch_questions_by('id', {q['id'] for q in questions_list if 'id' in q})}
+        by_fingerprint = {row['fingerprint']: row for row in self._fetch_questions_by('fingerprint', {fp for _, fp, _ in prepared})}
+
+        inserts, updates, conflicts = [], [], []
+        seen_fingerprints, updated_ids, unchanged = set(), set(), 0
+        now = datetime.now()
+        for q_data, fingerprint, values in prepared:
+            target = by_id.get(q_data.get('id')) or by_fingerprint.get(fingerprint)
+            if target is None:
+                if fingerprint in seen_fingerprints:
+                    unchanged += 1
                     continue
-                
-                self._execute(
-                    """INSERT INTO questions 
-                       (question, question_normalized, explanation, options, correct, category, difficulty, created_at) 
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (q_data['question'], normalized, q_data['explanation'], options_json, 
-                     q_data['correct'], q_data['category'], q_data['difficulty'], datetime.now())
-                )
-                stats['added'] += 1
-                
+                seen_fingerprints.add(fingerprint)
+                inserts.append(values + (now,))
+                continue
+            owner = by_fingerprint.get(fingerprint)
+            if (owner is not None and owner['id'] != target['id']) or fingerprint in seen_fingerprints:
+                conflicts.append(f"'{q_data['question'][:30]}' (id {target['id']}): sama teksti on jo toisella rivillä")
+                continue
+            seen_fingerprints.add(fingerprint)
+            if target['id'] in updated_ids or row_hash(q_data) == row_hash(target):
+                unchanged += 1
+                continue
+            updates.append(values + (target['id'],))
+            updated_ids.add(target['id'])
+
+        if inserts or updates:
+            conn = self.get_connection()
+            try:
+                cur = conn.cursor()
+                self._update_rows(cur, 'questions', self.QUESTION_UPDATE_COLUMNS, updates)
+                if inserts:
+                    columns = self.QUESTION_INSERT_COLUMNS
+                    if self.is_postgres:
+                        execute_values(cur, f"INSERT INTO questions ({', '.join(columns)}) VALUES %s", inserts, page_size=1000)
+                    else:
+                        cur.executemany(f"INSERT INTO questions ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})", inserts)
+                conn.commit()
+                cur.close()
             except Exception as e:
-                stats['skipped'] += 1
-                stats['errors'].append(f"Virhe kysymyksessä '{q_data.get('question', 'N/A')[:30]}': {str(e)}")
-                logger.error(f"Bulk add error: {e}")
-        
-        return True, stats
-
-    def find_similar_questions(self, threshold=0.95):
-        """Etsii samankaltaiset kysymykset."""
-        try:
-            all_questions = self._execute("SELECT id, question, category FROM questions ORDER BY id", fetch='all')
-            if not all_questions:
-                return []
-            
-            similar_pairs = []
-            questions_list = list(all_questions)
-            
-            for i, q1 in enumerate(questions_list):
-                for q2 in questions_list[i+1:]:
-                    similarity = SequenceMatcher(None, q1['question'].lower(), q2['question'].lower()).ratio()
-                    if similarity >= threshold:
-                        similar_pairs.append({
-                            'id1': q1['id'],
-                            'question1': q1['question'],
-                            'category1': q1['category'],
-                            'id2': q2['id'],
-                            'question2': q2['question'],
-                            'category2': q2['category'],
-                            'similarity': round(similarity * 100, 1)
-                        })
-            
-            return similar_pairs
-        except Exception as e:
-            logger.error(f"Virhe samankaltaisuushaussa: {e}")
-            return []
+                conn.rollback()
+                logger.error(f"Virhe kysymysten upsert-erässä: {e}")
+                return False, str(e)
+            finally:
+                conn.close()
+                self._fingerprints = None
+            if updated_ids:
+                self._refresh_search_index(list(updated_ids))
+            if inserts:
+                self._refresh_search_index()
+        return True, {'added': len(inserts), 'updated': len(updates), 'unchanged': unchanged, 'conflicts': conflicts}
+
+    def _update_rows(self, cur, table_name, columns, rows):
+        """
+        Päivittää rivit id:n perusteella annetulla kursorilla (rivin viimeinen arvo on id):
+        PostgreSQL:ssä yksi UPDATE ... FROM (VALUES ...) per 1000 riviä, SQLitessä executemany.
+        """
+        if not rows:
+            return
+        if self.is_postgres:
+            assignments = ', '.join(f"{column} = v.{column}" for column in columns)
+            execute_values(cur, f"""
+                UPDATE {table_name} AS t SET {assignments}
+                FROM (VALUES %s) AS v ({', '.join(columns)}, id)
+                WHERE t.id = v.id
+            """, rows, page_size=1000)
+        else:
+            assignments = ', '.join(f"{column} = ?" for column in columns)
+            cur.executemany(f"UPDATE {table_name} SET {assignments} WHERE id = ?", rows)
+
+    def search_questions(self, query, limit=20, offset=0, statuses=None):
+        """
+        Hakee kysymyksiä tekstihaulla relevanssijärjestyksessä.
+        statuses: sallitut tilat (esim. ('validated', 'approved')), None = kaikki.
+        Palauttaa (rivit, osumien kokonaismäärä).
+        """
+        status_filter, status_params = "", ()
+        if statuses:
+            status_filter = f" AND q.status IN ({','.join(['?'] * len(statuses))})"
+            status_params = tuple(statuses)
+
+        if self.is_postgres:
+            match = tsquery(query)
+            source = "questions q"
+            where = "q.search_vector @@ to_tsquery('finnish', ?)"
+            rank = "ts_rank_cd(q.search_vector, to_tsquery('finnish', ?))"
+            rank_params = (match,)
+        else:
+            match = fts5_query(query)
+            source = "questions_fts JOIN questions q ON q.id = questions_fts.rowid"
+            where = "questions_fts MATCH ?"
+            rank = f"-bm25(questions_fts, {', '.join(str(w) for w in SQLITE_BM25_WEIGHTS)})"
+            rank_params = ()
+        if match is None:
+            return [], 0
+
+        try:
+            total = self._execute(
+                f"SELECT COUNT(*) as count FROM {source} WHERE {where}{status_filter}",
+                (match, *status_params), fetch='one'
+            )
+            rows = self._execute(f"""
+                SELECT q.id, q.question, q.explanation, q.category, q.difficulty, q.status, {rank} as rank
+                FROM {source}
+                WHERE {where}{status_filter}
+                ORDER BY rank DESC, q.id
+                LIMIT ? OFFSET ?
+            """, (*rank_params, match, *status_params, limit, offset), fetch='all') or []
+            return [dict(row) for row in rows], (total['count'] if total else 0)
+        except Exception as e:
+            logger.error(f"Virhe kysymyshaussa: {e}")
+            return [], 0
+
+    IMPORT_JOB_FIELDS = ('status', 'rows_read', 'rows_added', 'rows_updated', 'rows_duplicate', 'rows_skipped', 'errors',
+                         'bytes_read', 'finished_at')
+
+    def create_import_job(self, job_id, filename, file_path, bytes_total, created_by, mode='insert'):
+        """Luo tuontityön tietueen tilassa 'queued'. mode: 'insert' tai 'upsert'."""
+        try:
+            now = datetime.now()
+            self._execute("""
+                INSERT INTO import_jobs (id, filename, file_path, status, errors, bytes_total, created_by, created_at, updated_at, mode)
+                VALUES (?, ?, ?, 'queued', '[]', ?, ?, ?, ?, ?)
+            """, (job_id, filename, file_path, bytes_total, created_by, now, now, mode))
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe tuontityön luomisessa: {e}")
+            return False, str(e)
+
+    def update_import_job(self, job_id, **fields):
+        """Päivittää tuontityön kentät (IMPORT_JOB_FIELDS); errors tallennetaan JSON-listana."""
+        unknown = set(fields) - set(self.IMPORT_JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"Tuntemattomat kentät: {', '.join(sorted(unknown))}")
+        if 'errors' in fields:
+            fields['errors'] = json.dumps(fields['errors'], ensure_ascii=False)
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        try:
+            self._execute(f"UPDATE import_jobs SET {assignments}, updated_at = ? WHERE id = ?",
+                          (*fields.values(), datetime.now(), job_id))
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe tuontityön päivityksessä: {e}")
+            return False, str(e)
+
+    def _import_job_dict(self, row):
+        job = dict(row)
+        job['errors'] = json.loads(job['errors'] or '[]')
+        return job
+
+    def get_import_job(self, job_id):
+        """Hakee tuontityön tai None."""
+        row = self._execute("SELECT * FROM import_jobs WHERE id = ?", (job_id,), fetch='one')
+        return self._import_job_dict(row) if row else None
+
+    def get_import_jobs(self, limit=10, statuses=None):
+        """Hakee viimeisimmät tuontityöt (valinnaisesti vain annetuissa tiloissa)."""
+        status_filter, params = "", ()
+        if statuses:
+            status_filter = f"WHERE status IN ({','.join(['?'] * len(statuses))})"
+            params = tuple(statuses)
+        rows = self._execute(f"SELECT * FROM import_jobs {status_filter} ORDER BY created_at DESC LIMIT ?",
+                             (*params, limit), fetch='all') or []
+        return [self._import_job_dict(row) for row in rows]
+
+    def get_minhash_hashes(self):
+        """Hakee MinHash-indeksin kysymys-ID:t ja tekstitiivisteet."""
+        return self._execute("SELECT question_id, content_hash FROM question_minhash", fetch='all') or []
+
+    def get_minhash_stamp(self):
+        """Muutosleima MinHash-indeksille: (rivimäärä, viimeisin päivitys)."""
+        row = self._execute("SELECT COUNT(*) as count, MAX(updated_at) as latest FROM question_minhash", fetch='one')
+        return (row['count'], str(row['latest'])) if row else (0, None)
+
+    def upsert_minhash_signatures(self, rows):
+        """Tallentaa (question_id, content_hash, signature, updated_at) -rivit yhdessä transaktiossa."""
+        try:
+            if self.is_postgres:
+                query = """
+                    INSERT INTO question_minhash (question_id, content_hash, signature, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(question_id) DO UPDATE SET
+                        content_hash = EXCLUDED.content_hash,
+                        signature = EXCLUDED.signature,
+                        updated_at = EXCLUDED.updated_at
+                """
+            else:
+                query = "INSERT OR REPLACE INTO question_minhash (question_id, content_hash, signature, updated_at) VALUES (?, ?, ?, ?)"
+            self._executemany(query, rows)
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe MinHash-allekirjoitusten tallennuksessa: {e}")
+            return False, str(e)
+
+    def delete_minhash_signatures(self, question_ids):
+        """Poistaa kysymysten MinHash-allekirjoitukset."""
+        try:
+            self._executemany("DELETE FROM question_minhash WHERE question_id = ?", [(qid,) for qid in question_ids])
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe MinHash-allekirjoitusten poistossa: {e}")
+            return False, str(e)
+
+    def get_similarity_scores_for(self, keys, chunk_size=250):
+        """
+        Hakee tallennetut pisteet annetuille (hash1, hash2) -avaimille paloina.
+        Avainehdot yhdistetään OR:lla, jolloin molemmat kannat hakevat parit
+        pääavainindeksistä (SQLite skannaa taulun rivivertailun (a, b) IN (...) kanssa).
+        Palauttaa {(hash1, hash2): score}.
+        """
+        keys = list(keys)
+        scores = {}
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            rows = self._execute(f"""
+                SELECT hash1, hash2, score FROM question_similarity
+                WHERE {' OR '.join(['(hash1 = ? AND hash2 = ?)'] * len(chunk))}
+            """, tuple(value for key in chunk for value in key), fetch='all') or []
+            scores.update(((row['hash1'], row['hash2']), row['score']) for row in rows)
+        return scores
+
+    def upsert_similarity_scores(self, rows):
+        """Tallentaa (hash1, hash2, score, computed_at) -rivit yhdessä transaktiossa."""
+        try:
+            if self.is_postgres:
+                query = """
+                    INSERT INTO question_similarity (hash1, hash2, score, computed_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(hash1, hash2) DO UPDATE SET
+                        score = EXCLUDED.score,
+                        computed_at = EXCLUDED.computed_at
+                """
+            else:
+                query = "INSERT OR REPLACE INTO question_similarity (hash1, hash2, score, computed_at) VALUES (?, ?, ?, ?)"
+            self._executemany(query, rows)
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe samankaltaisuuspisteiden tallennuksessa: {e}")
+            return False, str(e)
+
+    def get_similar_question_pairs(self, threshold):
+        """
+        Hakee kysymysparit, joiden tallennetut pisteet ovat vähintään threshold (0-1).
+        Pisteet yhdistetään nykyisiin kysymyksiin tekstitiivisteen kautta, joten
+        muuttuneiden tai poistettujen kysymysten vanhat pisteet eivät tule mukaan.
+        """
+        rows = self._execute("""
+            SELECT s.score,
+                   q1.id as id1, q1.question as question1, q1.category as category1,
+                   q2.id as id2, q2.question as question2, q2.category as category2
+            FROM question_similarity s
+            JOIN question_minhash m1 ON m1.content_hash = s.hash1
+            JOIN question_minhash m2 ON m2.content_hash = s.hash2
+            JOIN questions q1 ON q1.id = m1.question_id
+            JOIN questions q2 ON q2.id = m2.question_id
+            WHERE s.score >= ? AND m1.question_id <> m2.question_id
+              AND (s.hash1 <> s.hash2 OR m1.question_id < m2.question_id)
+        """, (threshold,), fetch='all') or []
+
+        pairs = []
+        for row in rows:
+            first, second = ('1', '2') if row['id1'] < row['id2'] else ('2', '1')
+            pairs.append({
+                'id1': row['id' + first], 'question1': row['question' + first], 'category1': row['category' + first],
+                'id2': row['id' + second], 'question2': row['question' + second], 'category2': row['category' + second],
+                'similarity': round(row['score'] * 100, 1),
+            })
+        return sorted(pairs, key=lambda p: (p['id1'], p['id2']))
+
+    def prune_similarity_scores(self):
+        """Poistaa pisteet, joiden tekstiä ei enää ole yhdelläkään kysymyksellä."""
+        try:
+            self._execute("""
+                DELETE FROM question_similarity
+                WHERE hash1 NOT IN (SELECT content_hash FROM question_minhash)
+                   OR hash2 NOT IN (SELECT content_hash FROM question_minhash)
+            """)
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe samankaltaisuuspisteiden siivouksessa: {e}")
+            return False, str(e)
+
+    def replace_question_item_stats(self, rows):
+        """Korvaa koko question_item_stats-taulun sisällön yhdessä transaktiossa."""
+        try:
+            self._executemany(
+                """INSERT INTO question_item_stats
+                   (question_id, attempts, p_value, discrimination, median_time, option_counts, computed_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                rows,
+                pre_statements=[("DELETE FROM question_item_stats", ())]
+            )
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe osioanalyysin tallennuksessa: {e}")
+            return False, str(e)
+
+    def get_question_item_stats(self, question_ids=None):
+        """Hakee osioanalyysin tulokset sanakirjana kysymys-ID:n mukaan (question_ids: rajaus, None = kaikki)."""
+        try:
+            if question_ids is None:
+                rows = self._execute("SELECT * FROM question_item_stats", fetch='all') or []
+            elif not question_ids:
+                return {}
+            else:
+                placeholders = ','.join(['?'] * len(question_ids))
+                rows = self._execute(f"SELECT * FROM question_item_stats WHERE question_id IN ({placeholders})",
+                                     tuple(question_ids), fetch='all') or []
+            stats = {}
+            for row in rows:
+                row_dict = dict(row)
+                row_dict['option_counts'] = json.loads(row_dict['option_counts']) if row_dict.get('option_counts') else []
+                stats[row_dict['question_id']] = row_dict
+            return stats
+        except Exception as e:
+            logger.error(f"Virhe osioanalyysin haussa: {e}")
+            return {}
+
+    USER_FEATURE_COLUMNS = (
+        'user_id', 'answered_questions', 'total_attempts', 'total_correct', 'category_stats',
+        'weakest_category', 'weakest_success_rate', 'due_count', 'current_streak',
+        'longest_streak', 'last_practice_date', 'simulation_count', 'updated_at',
+    )
+
+    def upsert_user_features(self, features_list):
+        """Tallentaa käyttäjäpiirteet (lisää tai korvaa) yhdessä transaktiossa."""
+        try:
+            columns = self.USER_FEATURE_COLUMNS
+            placeholders = ', '.join(['?'] * len(columns))
+            if self.is_postgres:
+                updates = ', '.join(f"{c} = EXCLUDED.{c}" for c in columns if c != 'user_id')
+                query = f"""
+                    INSERT INTO user_features ({', '.join(columns)}) VALUES ({placeholders})
+                    ON CONFLICT(user_id) DO UPDATE SET {updates}
+                """
+            else:
+                query = f"INSERT OR REPLACE INTO user_features ({', '.join(columns)}) VALUES ({placeholders})"
+
+            now = datetime.now()
+            rows = []
+            for features in features_list:
+                row = dict(features, updated_at=now, category_stats=json.dumps(features['category_stats'], ensure_ascii=False))
+                rows.append(tuple(row[c] for c in columns))
+            self._executemany(query, rows)
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe käyttäjäpiirteiden tallennuksessa: {e}")
+            return False, str(e)
+
+    def get_user_features(self, user_id):
+        """Hakee käyttäjän esilasketut piirteet tai None."""
+        try:
+            row = self._execute("SELECT * FROM user_features WHERE user_id = ?", (user_id,), fetch='one')
+            if not row:
+                return None
+            features = dict(row)
+            features['category_stats'] = json.loads(features['category_stats']) if features.get('category_stats') else {}
+            return features
+        except Exception as e:
+            logger.error(f"Virhe käyttäjäpiirteiden haussa: {e}")
+            return None
+
+    def get_memory_state(self, user_id, question_id):
+        """Hakee kortin muistimallin tilan (stabiilius, vaikeus) ja SM-2-välin."""
+        try:
+            row = self._execute("""
+                SELECT memory_stability, memory_difficulty, interval FROM user_question_progress
+                WHERE user_id = ? AND question_id = ?
+            """, (user_id, question_id), fetch='one')
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Virhe muistitilan haussa: {e}")
+            return None
+
+    def append_review_log(self, user_id, question_id, rating, correct, time_taken, scheduler):
+        """Lisää rivin kertauslokiin (lokia ei koskaan päivitetä)."""
+        try:
+            self._execute("""
+                INSERT INTO review_log (user_id, question_id, reviewed_at, rating, correct, time_taken, scheduler)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, question_id, datetime.now(), rating, correct, time_taken, scheduler))
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe kertauslokin kirjoituksessa: {e}")
+            return False, str(e)
+
+    def backfill_review_log(self, slow_seconds, fast_seconds):
+        """Täyttää tyhjän kertauslokin question_attempts-historiasta. Palauttaa (success, rivimäärä tai virhe)."""
+        try:
+            existing = self._execute("SELECT COUNT(*) as count FROM review_log", fetch='one')
+            if existing and existing['count'] > 0:
+                return False, "Kertausloki ei ole tyhjä"
+            self._execute("""
+                INSERT INTO review_log (user_id, question_id, reviewed_at, rating, correct, time_taken, scheduler)
+                SELECT user_id, question_id, timestamp,
+                       CASE WHEN NOT correct THEN 1 WHEN time_taken > ? THEN 2 WHEN time_taken < ? THEN 4 ELSE 3 END,
+                       correct, time_taken, 'sm2'
+                FROM question_attempts ORDER BY id
+            """, (slow_seconds, fast_seconds))
+            count = self._execute("SELECT COUNT(*) as count FROM review_log", fetch='one')
+            return True, count['count'] if count else 0
+        except Exception as e:
+            logger.error(f"Virhe kertauslokin täytössä: {e}")
+            return False, str(e)
+
+    def get_memory_model_params(self, user_id):
+        """Hakee käyttäjän sovitetut muistimallin painot tai None."""
+        try:
+            row = self._execute("SELECT * FROM memory_model_params WHERE user_id = ?", (user_id,), fetch='one')
+            if not row:
+                return None
+            params = dict(row)
+            params['weights'] = json.loads(params['weights'])
+            return params
+        except Exception as e:
+            logger.error(f"Virhe muistimallin painojen haussa: {e}")
+            return None
+
+    def upsert_memory_model_params(self, rows):
+        """Tallentaa käyttäjien painot (user_id, weights, log_loss, reviews, fitted_at)."""
+        try:
+            if self.is_postgres:
+                query = """
+                    INSERT INTO memory_model_params (user_id, weights, log_loss, reviews, fitted_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        weights = EXCLUDED.weights, log_loss = EXCLUDED.log_loss,
+                        reviews = EXCLUDED.reviews, fitted_at = EXCLUDED.fitted_at
+                """
+            else:
+                query = """
+                    INSERT OR REPLACE INTO memory_model_params (user_id, weights, log_loss, reviews, fitted_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """
+            self._executemany(query, rows)
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe muistimallin painojen tallennuksessa: {e}")
+            return False, str(e)
+
+    def get_review_queue(self, user_id):
+        """Hakee käyttäjän kertausjonon tai None."""
+        try:
+            row = self._execute("SELECT * FROM review_queues WHERE user_id = ?", (user_id,), fetch='one')
+            if not row:
+                return None
+            return {
+                'queue_date': row['queue_date'],
+                'question_ids': json.loads(row['question_ids']),
+                'answered_ids': json.loads(row['answered_ids']),
+                'policy': row.get('policy') or 'due',
+            }
+        except Exception as e:
+            logger.error(f"Virhe kertausjonon haussa: {e}")
+            return None
+
+    def save_review_queue(self, user_id, queue_date, question_ids, answered_ids, policy='due'):
+        """Tallentaa tai korvaa käyttäjän kertausjonon."""
+        try:
+            if self.is_postgres:
+                query = """
+                    INSERT INTO review_queues (user_id, queue_date, question_ids, answered_ids, policy, updated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        queue_date = EXCLUDED.queue_date,
+                        question_ids = EXCLUDED.question_ids,
+                        answered_ids = EXCLUDED.answered_ids,
+                        policy = EXCLUDED.policy,
+                        updated_at = EXCLUDED.updated_at
+                """
+            else:
+                query = """
+                    INSERT OR REPLACE INTO review_queues (user_id, queue_date, question_ids, answered_ids, policy, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """
+            self._execute(query, (user_id, queue_date, json.dumps(question_ids), json.dumps(answered_ids), policy, datetime.now()))
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe kertausjonon tallennuksessa: {e}")
+            return False, str(e)
 
     def delete_question(self, question_id):
         """Poistaa kysymyksen ja siihen liittyvät tiedot."""
         try:
             self._execute("DELETE FROM user_question_progress WHERE question_id = ?", (question_id,))
             self._execute("DELETE FROM question_attempts WHERE question_id = ?", (question_id,))
+            self._execute("DELETE FROM question_minhash WHERE question_id = ?", (question_id,))
+            if not self.is_postgres:
+                self._execute("DELETE FROM questions_fts WHERE rowid = ?", (question_id,))
             self._execute("DELETE FROM questions WHERE id = ?", (question_id,))
+            self._fingerprints = None
             return True, None
         except Exception as e:
             logger.error(f"Virhe kysymyksen poistossa: {e}")
@@ -621,7 +1515,12 @@ class DatabaseManager:
             
             self._execute("DELETE FROM question_attempts")
             self._execute("DELETE FROM user_question_progress")
+            self._execute("DELETE FROM question_minhash")
+            self._execute("DELETE FROM question_similarity")
+            if not self.is_postgres:
+                self._execute("DELETE FROM questions_fts")
             self._execute("DELETE FROM questions")
+            self._fingerprints = None
             
             return True, {'deleted_count': count}
         except Exception as e:
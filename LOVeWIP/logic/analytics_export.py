@@ -0,0 +1,231 @@
+"""
+Analytics Export - Vastaushistorian sarakepohjainen vienti analytiikkaa varten
+
+Virtaa question_attempts-, user_question_progress- ja distractor_attempts-taulut
+paloittain levylle kuukausiosioihin (NumPy .npz tai Parquet, jos pyarrow on asennettu).
+Vienti on inkrementaalinen: manifest.json muistaa mihin asti kukin taulu on viety,
+joten seuraava ajo kirjoittaa vain uudet rivit uusiksi osatiedostoiksi.
+
+Käyttö:
+    python -m logic.analytics_export [vientihakemisto]
+"""
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Taulukohtaiset vientimääritykset: kysely, vesileiman sarake ja sarakkeiden tyypit.
+# Tyyppi 'dict' = merkkijono sanakirjakoodattuna, 'datetime' = datetime64[us].
+EXPORT_TABLES = {
+    'question_attempts': {
+        'query': """
+            SELECT qa.id, qa.user_id, qa.question_id, qa.correct, qa.time_taken,
+                   qa.timestamp, qa.selected_option, q.category
+            FROM question_attempts qa
+            LEFT JOIN questions q ON q.id = qa.question_id
+            WHERE qa.id > ?
+            ORDER BY qa.id
+        """,
+        'watermark': 'id',
+        'partition_by': 'timestamp',
+        'columns': [
+            ('id', np.int64), ('user_id', np.int32), ('question_id', np.int32),
+            ('correct', np.bool_), ('time_taken', np.float32), ('timestamp', 'datetime'),
+            ('selected_option', np.int8), ('category', 'dict'),
+        ],
+    },
+    'distractor_attempts': {
+        'query': """
+            SELECT id, user_id, distractor_scenario, user_choice, correct_choice,
+                   is_correct, response_time, created_at
+            FROM distractor_attempts
+            WHERE id > ?
+            ORDER BY id
+        """,
+        'watermark': 'id',
+        'partition_by': 'created_at',
+        'columns': [
+            ('id', np.int64), ('user_id', np.int32), ('distractor_scenario', 'dict'),
+            ('user_choice', np.int8), ('correct_choice', np.int8), ('is_correct', np.bool_),
+            ('response_time', np.float32), ('created_at', 'datetime'),
+        ],
+    },
+    # Edistymisrivit ovat muuttuvaa tilaa: uudempi osa korvaa saman (user_id, question_id) -parin.
+    'user_question_progress': {
+        'query': """
+            SELECT user_id, question_id, times_shown, times_correct, last_shown,
+                   ease_factor, interval, mistake_acknowledged
+            FROM user_question_progress
+            WHERE last_shown IS NOT NULL AND last_shown > ?
+            ORDER BY last_shown
+        """,
+        'watermark': 'last_shown',
+        'partition_by': 'last_shown',
+        'columns': [
+            ('user_id', np.int32), ('question_id', np.int32), ('times_shown', np.int32),
+            ('times_correct', np.int32), ('last_shown', 'datetime'), ('ease_factor', np.float32),
+            ('interval', np.int32), ('mistake_acknowledged', np.bool_),
+        ],
+    },
+}
+
+INITIAL_WATERMARKS = {'id': 0, 'last_shown': '1970-01-01 00:00:00'}
+
+
+def _to_datetime64(value):
+    """Muuntaa tietokannan aikaleiman (datetime tai merkkijono) datetime64-arvoksi."""
+    if value is None:
+        return np.datetime64('NaT')
+    if isinstance(value, datetime):
+        return np.datetime64(value.replace(tzinfo=None), 'us')
+    return np.datetime64(str(value)[:26].replace(' ', 'T'), 'us')
+
+
+def _build_columns(rows, columns):
+    """Rakentaa riveistä tyypitetyt sarakkeet. Palauttaa {nimi: taulukko} ja sanakirjat."""
+    arrays, dictionaries = {}, {}
+    for position, (name, dtype) in enumerate(columns):
+        values = [row[position] for row in rows]
+        if dtype == 'datetime':
+            arrays[name] = np.array([_to_datetime64(v) for v in values], dtype='datetime64[us]')
+        elif dtype == 'dict':
+            labels, codes = np.unique(np.array(['' if v is None else str(v) for v in values]), return_inverse=True)
+            arrays[name] = codes.astype(np.int32)
+            dictionaries[name] = labels
+        elif dtype is np.bool_:
+            arrays[name] = np.array([bool(v) for v in values], dtype=np.bool_)
+        elif np.issubdtype(dtype, np.integer):
+            arrays[name] = np.array([-1 if v is None else v for v in values], dtype=dtype)
+        else:
+            arrays[name] = np.array([np.nan if v is None else v for v in values], dtype=dtype)
+    return arrays, dictionaries
+
+
+class AnalyticsExporter:
+    """Inkrementaalinen sarakepohjainen vienti kuukausiosioihin."""
+
+    CHUNK_SIZE = 50000
+
+    def __init__(self, db_manager, export_dir=None, use_parquet=None):
+        self.db_manager = db_manager
+        self.export_dir = export_dir or os.environ.get('ANALYTICS_EXPORT_DIR', 'exports')
+        self.use_parquet = (pa is not None) if use_parquet is None else (use_parquet and pa is not None)
+        self.manifest_path = os.path.join(self.export_dir, 'manifest.json')
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {'format': 'parquet' if self.use_parquet else 'npz', 'tables': {}}
+
+    def _save_manifest(self, manifest):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _write_part(self, table, month, arrays, dictionaries, mask):
+        """Kirjoittaa yhden osatiedoston kuukausiosioon ja palauttaa sen polun."""
+        month_dir = os.path.join(self.export_dir, table, month)
+        os.makedirs(month_dir, exist_ok=True)
+        part_number = len([f for f in os.listdir(month_dir) if f.startswith('part-')])
+        extension = 'parquet' if self.use_parquet else 'npz'
+        path = os.path.join(month_dir, f'part-{part_number:05d}.{extension}')
+
+        if self.use_parquet:
+            fields = {}
+            for name, array in arrays.items():
+                if name in dictionaries:
+                    fields[name] = pa.DictionaryArray.from_arrays(array[mask], dictionaries[name].tolist())
+                else:
+                    fields[name] = pa.array(array[mask])
+            pq.write_table(pa.table(fields), path)
+        else:
+            payload = {name: array[mask] for name, array in arrays.items()}
+            for name, labels in dictionaries.items():
+                payload[f'{name}__dict'] = labels
+            np.savez_compressed(path, **payload)
+        return path
+
+    def export_table(self, table, manifest):
+        """Vie yhden taulun uudet rivit. Päivittää manifestin jokaisen palan jälkeen."""
+        spec = EXPORT_TABLES[table]
+        state = manifest['tables'].setdefault(table, {
+            'watermark': INITIAL_WATERMARKS[spec['watermark']],
+            'rows': 0,
+            'partitions': [],
+        })
+        watermark_index = [name for name, _ in spec['columns']].index(spec['watermark'])
+        exported = 0
+
+        for rows in self.db_manager._fetch_in_chunks(spec['query'], (state['watermark'],), chunk_size=self.CHUNK_SIZE):
+            arrays, dictionaries = _build_columns(rows, spec['columns'])
+            months = arrays[spec['partition_by']].astype('datetime64[M]').astype(str)
+            for month in np.unique(months):
+                self._write_part(table, month, arrays, dictionaries, months == month)
+                if month not in state['partitions']:
+                    state['partitions'].append(month)
+
+            last_value = rows[-1][watermark_index]
+            state['watermark'] = last_value if spec['watermark'] == 'id' else str(last_value)
+            state['rows'] += len(rows)
+            exported += len(rows)
+            state['exported_at'] = datetime.now().isoformat()
+            state['partitions'].sort()
+            self._save_manifest(manifest)
+
+        return exported
+
+    def run(self, tables=None):
+        """Vie kaikki (tai annetut) taulut. Palauttaa {taulu: uusien rivien määrä}."""
+        os.makedirs(self.export_dir, exist_ok=True)
+        manifest = self._load_manifest()
+        results = {}
+        for table in tables or EXPORT_TABLES:
+            try:
+                results[table] = self.export_table(table, manifest)
+            except Exception as e:
+                logger.error(f"Virhe taulun {table} viennissä: {e}")
+                results[table] = None
+        logger.info(f"Analytiikkavienti valmis: {results}")
+        return results
+
+
+def load_partition(export_dir, table, month):
+    """
+    Lukee yhden kuukausiosion (.npz) takaisin sanakirjaksi taulukoita.
+    Sanakirjakoodatut sarakkeet puretaan merkkijonoiksi.
+    """
+    month_dir = os.path.join(export_dir, table, month)
+    parts = sorted(f for f in os.listdir(month_dir) if f.endswith('.npz'))
+    columns = {}
+    for part in parts:
+        with np.load(os.path.join(month_dir, part)) as data:
+            for name in data.files:
+                if name.endswith('__dict'):
+                    continue
+                values = data[name]
+                if f'{name}__dict' in data.files:
+                    values = data[f'{name}__dict'][values]
+                columns.setdefault(name, []).append(values)
+    return {name: np.concatenate(chunks) for name, chunks in columns.items()}
+
+
+if __name__ == '__main__':
+    from data_access.database_manager import DatabaseManager
+
+    logging.basicConfig(level=logging.INFO)
+    exporter = AnalyticsExporter(DatabaseManager(), export_dir=sys.argv[1] if len(sys.argv) > 1 else None)
+    print(exporter.run())
@@ -0,0 +1,91 @@
+"""
+Bulk Insert Benchmark - Kysymysten massalisäyksen läpäisykyky
+
+Vertaa kahta tapaa lisätä sama määrä kysymyksiä:
+  - row_by_row: aiempi toteutus, jossa jokaiselle riville tehdään
+    duplikaattitarkistus (SELECT) ja INSERT omalla yhteydellään
+  - set_based: DatabaseManager.insert_questions_batch (sama kuin tiedostotuonnissa),
+    joka tarkistaa duplikaatit muistissa ja lisää rivit yhdessä transaktiossa
+
+Testikysymykset merkitään kategorialla BENCHMARK_CATEGORY ja poistetaan
+jokaisen ajon jälkeen. Ajetaan DATABASE_URL-ympäristömuuttujan kantaan.
+
+Käyttö:
+    python -m logic.bulk_insert_benchmark [--rows 2000]
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime
+
+from logic.question_fingerprint import question_fingerprint
+
+BENCHMARK_CATEGORY = '__benchmark__'
+
+
+def generate_questions(count):
+    """Tuottaa count toisistaan eroavaa testikysymystä."""
+    run = uuid.uuid4().hex[:8]
+    return [{
+        'question': f"Testikysymys {run} numero {i}: kuinka monta tablettia annetaan?",
+        'explanation': "Vertailuajon kysymys.",
+        'options': [f"{i} tablettia", f"{i + 1} tablettia", f"{i + 2} tablettia"],
+        'correct': 0,
+        'category': BENCHMARK_CATEGORY,
+        'difficulty': 'helppo',
+    } for i in range(count)]
+
+
+def insert_row_by_row(db_manager, questions):
+    """Aiempi toteutus: SELECT + INSERT jokaiselle riville omalla yhteydellä."""
+    added = 0
+    for q_data in questions:
+        fingerprint = question_fingerprint(q_data['question'])
+        if db_manager._execute("SELECT id FROM questions WHERE fingerprint = ?", (fingerprint,), fetch='one'):
+            continue
+        db_manager._execute(
+            f"INSERT INTO questions ({', '.join(db_manager.QUESTION_INSERT_COLUMNS)}) VALUES ({', '.join(['?'] * 9)})",
+            db_manager._question_row(q_data, fingerprint, datetime.now())
+        )
+        added += 1
+    return added
+
+
+def insert_set_based(db_manager, questions):
+    _, stats = db_manager.insert_questions_batch(questions, row_fallback=True)
+    return stats['added']
+
+
+def cleanup(db_manager):
+    db_manager._execute("DELETE FROM questions WHERE category = ?", (BENCHMARK_CATEGORY,))
+    db_manager._fingerprints = None
+    if not db_manager.is_postgres:
+        db_manager._execute("DELETE FROM questions_fts WHERE rowid NOT IN (SELECT id FROM questions)")
+
+
+def benchmark(db_manager, rows=2000):
+    """Palauttaa kummallekin tavalle lisätyt rivit, keston ja rivit sekunnissa."""
+    results = {}
+    for name, insert in (('row_by_row', insert_row_by_row), ('set_based', insert_set_based)):
+        questions = generate_questions(rows)
+        db_manager._fingerprints = None
+        started = time.perf_counter()
+        try:
+            added = insert(db_manager, questions)
+            seconds = time.perf_counter() - started
+        finally:
+            cleanup(db_manager)
+        results[name] = {'rows': added, 'seconds': round(seconds, 3), 'rows_per_second': round(added / seconds, 1)}
+    return results
+
+
+if __name__ == '__main__':
+    from data_access.database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Vertaa kysymysten massalisäyksen tapoja.")
+    parser.add_argument('--rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    print("Tapa         rivit   sekuntia   riviä/s")
+    for name, row in benchmark(DatabaseManager(), args.rows).items():
+        print(f"{name:<11} {row['rows']:>6} {row['seconds']:>10} {row['rows_per_second']:>9}")
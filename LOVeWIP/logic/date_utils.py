@@ -0,0 +1,18 @@
+"""
+Date Utils - Tietokannan päivämääräarvojen yhteiset muunnokset
+
+PostgreSQL palauttaa DATE/TIMESTAMP-sarakkeet date- ja datetime-olioina,
+SQLite merkkijonoina; to_date() yhtenäistää molemmat date-olioksi.
+"""
+from datetime import date, datetime
+
+
+def to_date(value):
+    """Muuntaa tietokannan päivämäärän (date, datetime tai merkkijono) date-olioksi."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
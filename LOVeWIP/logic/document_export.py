@@ -0,0 +1,494 @@
+"""
+Document Export - Kysymyspankin PDF- ja Word-dokumentit
+
+Dokumentin rakentaminen (ReportLab / python-docx) on hidasta ja CPU-sidonnaista,
+joten DocumentBuildManager ajaa sen prosessipoolissa pyynnön ulkopuolella ja
+tallentaa valmiin tiedoston levylle (DOCUMENT_CACHE_DIR). Välimuistin avain on
+(muoto, suodattimet, include_answers, järjestys, duplikaattihuomautus,
+kysymyspankin versio), joten uusi lataus samoilla valinnoilla palvellaan
+suoraan tiedostosta, ja mikä tahansa kysymysmuutos vaihtaa avaimen.
+Pankin versio on tiiviste kaikkien kysymysten sisällöstä
+(DatabaseManager.get_question_bank_version).
+
+Kesken olevien rakennusten tila on prosessikohtainen (yksi gunicorn-työprosessi,
+ks. Procfile); valmiit tiedostot säilyvät uudelleenkäynnistyksen yli.
+Levylle jätetään enintään DOCUMENT_CACHE_MAX_FILES uusinta dokumenttia.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+# ReportLab (PDF-generointi)
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib.enums import TA_CENTER
+
+# python-docx (Word-dokumentit)
+from docx import Document
+from docx.shared import Inches, Pt, RGBColor
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from logic.study_packets import option_letter
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_CACHE_DIR = os.environ.get('DOCUMENT_CACHE_DIR', os.path.join('uploads', 'documents'))
+DOCUMENT_CACHE_MAX_FILES = 20
+DOCUMENT_WORKERS = 2
+MAX_FAILED_BUILDS = 20  # Epäonnistuneiden virheet säilytetään tilakyselyä varten
+DOCUMENT_FORMATS = {
+    'pdf': ('pdf', 'application/pdf'),
+    'word': ('docx', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+}
+BUILD_ID_PATTERN = re.compile(r'^(pdf|word)-[0-9a-f]{24}$')
+SORT_ORDERS = {
+    'id': 'id ASC',
+    'id_desc': 'id DESC',
+    'category': 'category ASC, id ASC',
+    'difficulty': "CASE difficulty WHEN 'helppo' THEN 1 WHEN 'keskivaikea' THEN 2 WHEN 'vaikea' THEN 3 END, id ASC",
+    'alphabetical': 'question ASC',
+}
+
+
+def create_pdf_document(questions, include_answers, duplicate_info=None):
+    """Luo ammattimaisen PDF-dokumentin kysymyksistä."""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, 
+                            topMargin=0.75*inch, 
+                            bottomMargin=0.75*inch,
+                            leftMargin=0.75*inch,
+                            rightMargin=0.75*inch)
+    
+    # Tyylit
+    styles = getSampleStyleSheet()
+    
+    # Otsikkotyyli
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=colors.HexColor('#5A67D8'),
+        spaceAfter=30,
+        alignment=TA_CENTER,
+        fontName='Helvetica-Bold'
+    )
+    
+    # Alaotsikkotyyli
+    subtitle_style = ParagraphStyle(
+        'Subtitle',
+        parent=styles['Normal'],
+        fontSize=12,
+        textColor=colors.HexColor('#718096'),
+        spaceAfter=20,
+        alignment=TA_CENTER
+    )
+    
+    # Kysymystyyli
+    question_style = ParagraphStyle(
+        'Question',
+        parent=styles['Normal'],
+        fontSize=11,
+        fontName='Helvetica-Bold',
+        spaceAfter=8,
+        textColor=colors.HexColor('#2D3748')
+    )
+    
+    # Vastausvaihtoehtotyyli
+    option_style = ParagraphStyle(
+        'Option',
+        parent=styles['Normal'],
+        fontSize=10,
+        leftIndent=20,
+        spaceAfter=4
+    )
+    
+    # Selitystyyli
+    explanation_style = ParagraphStyle(
+        'Explanation',
+        parent=styles['Normal'],
+        fontSize=9,
+        textColor=colors.HexColor('#4A5568'),
+        leftIndent=10,
+        rightIndent=10,
+        spaceAfter=6,
+        borderWidth=1,
+        borderColor=colors.HexColor('#E2E8F0'),
+        borderPadding=8,
+        backColor=colors.HexColor('#F7FAFC')
+    )
+    
+    # Metatietotyyli
+    meta_style = ParagraphStyle(
+        'Meta',
+        parent=styles['Normal'],
+        fontSize=8,
+        textColor=colors.HexColor('#A0AEC0'),
+        spaceAfter=12
+    )
+    
+    # Rakenna dokumentti
+    story = []
+    
+    # Otsikko
+    story.append(Paragraph("LOVe Enhanced", title_style))
+    story.append(Paragraph("Kysymyspankki", subtitle_style))
+    story.append(Paragraph(f"Luotu: {datetime.now().strftime('%d.%m.%Y %H:%M')}", meta_style))
+    story.append(Paragraph(f"Kysymyksiä yhteensä: {len(questions)}", meta_style))
+    
+    if duplicate_info:
+        warning_style = ParagraphStyle('Warning', parent=styles['Normal'], fontSize=10, 
+                                       textColor=colors.HexColor('#F59E0B'))
+        story.append(Paragraph(duplicate_info, warning_style))
+    
+    story.append(Spacer(1, 0.3*inch))
+    
+    # Sisällysluettelo
+    story.append(Paragraph("Sisällysluettelo", styles['Heading2']))
+    
+    category_counts = {}
+    for q in questions:
+        cat = q['category']
+        category_counts[cat] = category_counts.get(cat, 0) + 1
+    
+    toc_data = [['Kategoria', 'Kysymyksiä']]
+    for cat, count in sorted(category_counts.items()):
+        toc_data.append([cat.title(), str(count)])
+    
+    toc_table = Table(toc_data, colWidths=[4*inch, 1.5*inch])
+    toc_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#5A67D8')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F7FAFC')),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E2E8F0')),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F7FAFC')])
+    ]))
+    
+    story.append(toc_table)
+    story.append(PageBreak())
+    
+    # Kysymykset
+    current_category = None
+    
+    for idx, q in enumerate(questions, 1):
+        # Kategorian otsikko
+        if q['category'] != current_category:
+            current_category = q['category']
+            story.append(Spacer(1, 0.2*inch))
+            story.append(Paragraph(f"Kategoria: {current_category.title()}", styles['Heading2']))
+            story.append(Spacer(1, 0.1*inch))
+        
+        # Kysymyksen numero ja teksti
+        question_text = f"<b>{idx}.</b> {q['question']}"
+        story.append(Paragraph(question_text, question_style))
+        
+        # Metatiedot
+        difficulty_map = {'helppo': 'Helppo', 'keskivaikea': 'Keskivaikea', 'vaikea': 'Vaikea'}
+        meta_text = f"Vaikeustaso: {difficulty_map.get(q['difficulty'], q['difficulty'])} | ID: {q['id']}"
+        story.append(Paragraph(meta_text, meta_style))
+        
+        # Vastausvaihtoehdot
+        for i, option in enumerate(q['options']):
+            if include_answers and i == q['correct']:
+                option_text = f"<b>{option_letter(i)}. {option} ✓</b>"
+                option_para = Paragraph(option_text, option_style)
+            else:
+                option_text = f"{option_letter(i)}. {option}"
+                option_para = Paragraph(option_text, option_style)
+            story.append(option_para)
+        
+        story.append(Spacer(1, 0.1*inch))
+        
+        # Selitys (jos vastaukset sisällytetään)
+        if include_answers:
+            correct_answer = option_letter(q['correct'])
+            explanation_text = f"<b>Oikea vastaus: {correct_answer}</b><br/>{q['explanation']}"
+            story.append(Paragraph(explanation_text, explanation_style))
+        
+        story.append(Spacer(1, 0.15*inch))
+        
+        # Sivunvaihto joka 5. kysymyksen jälkeen (vain jos ei ole viimeinen)
+        if idx % 5 == 0 and idx < len(questions):
+            story.append(PageBreak())
+    
+    # Rakenna PDF
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
+
+
+def create_word_document(questions, include_answers, duplicate_info=None):
+    """Luo ammattimaisen Word-dokumentin kysymyksistä."""
+    doc = Document()
+    
+    # Aseta marginaalit
+    sections = doc.sections
+    for section in sections:
+        section.top_margin = Inches(0.75)
+        section.bottom_margin = Inches(0.75)
+        section.left_margin = Inches(0.75)
+        section.right_margin = Inches(0.75)
+    
+    # Otsikko
+    title = doc.add_heading('LOVe Enhanced', 0)
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    title_run = title.runs[0]
+    title_run.font.color.rgb = RGBColor(90, 103, 216)
+    
+    subtitle = doc.add_heading('Kysymyspankki', level=2)
+    subtitle.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    
+    # Metatiedot
+    meta = doc.add_paragraph()
+    meta.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    meta_run = meta.add_run(f'Luotu: {datetime.now().strftime("%d.%m.%Y %H:%M")}\n')
+    meta_run.font.size = Pt(10)
+    meta_run.font.color.rgb = RGBColor(160, 174, 192)
+    
+    meta_run2 = meta.add_run(f'Kysymyksiä yhteensä: {len(questions)}')
+    meta_run2.font.size = Pt(10)
+    meta_run2.font.color.rgb = RGBColor(160, 174, 192)
+    
+    if duplicate_info:
+        warning = doc.add_paragraph(duplicate_info)
+        warning_run = warning.runs[0]
+        warning_run.font.color.rgb = RGBColor(245, 158, 11)
+        warning_run.font.bold = True
+    
+    doc.add_paragraph()  # Tyhjä rivi
+    
+    # Sisällysluettelo
+    doc.add_heading('Sisällysluettelo', level=1)
+    
+    category_counts = {}
+    for q in questions:
+        cat = q['category']
+        category_counts[cat] = category_counts.get(cat, 0) + 1
+    
+    # Luo taulukko sisällysluettelosta
+    table = doc.add_table(rows=1, cols=2)
+    table.style = 'Light Grid Accent 1'
+    
+    hdr_cells = table.rows[0].cells
+    hdr_cells[0].text = 'Kategoria'
+    hdr_cells[1].text = 'Kysymyksiä'
+    
+    for cat, count in sorted(category_counts.items()):
+        row_cells = table.add_row().cells
+        row_cells[0].text = cat.title()
+        row_cells[1].text = str(count)
+    
+    doc.add_page_break()
+    
+    # Kysymykset
+    current_category = None
+    
+    for idx, q in enumerate(questions, 1):
+        # Kategorian otsikko
+        if q['category'] != current_category:
+            current_category = q['category']
+            doc.add_paragraph()  # Tyhjä rivi
+            cat_heading = doc.add_heading(f'Kategoria: {current_category.title()}', level=1)
+            cat_heading.runs[0].font.color.rgb = RGBColor(90, 103, 216)
+        
+        # Kysymys
+        question_para = doc.add_paragraph()
+        q_run = question_para.add_run(f'{idx}. ')
+        q_run.bold = True
+        q_run.font.size = Pt(11)
+        
+        q_text_run = question_para.add_run(q['question'])
+        q_text_run.font.size = Pt(11)
+        
+        # Metatiedot
+        difficulty_map = {'helppo': 'Helppo', 'keskivaikea': 'Keskivaikea', 'vaikea': 'Vaikea'}
+        meta_para = doc.add_paragraph()
+        meta_para_run = meta_para.add_run(
+            f'Vaikeustaso: {difficulty_map.get(q["difficulty"], q["difficulty"])} | ID: {q["id"]}'
+        )
+        meta_para_run.font.size = Pt(8)
+        meta_para_run.font.color.rgb = RGBColor(160, 174, 192)
+        
+        # Vastausvaihtoehdot
+        for i, option in enumerate(q['options']):
+            option_para = doc.add_paragraph(style='List Bullet')
+            option_para.paragraph_format.left_indent = Inches(0.25)
+            
+            if include_answers and i == q['correct']:
+                opt_run = option_para.add_run(f'{option_letter(i)}. {option} ✓')
+                opt_run.bold = True
+                opt_run.font.color.rgb = RGBColor(72, 187, 120)
+            else:
+                opt_run = option_para.add_run(f'{option_letter(i)}. {option}')
+            opt_run.font.size = Pt(10)
+        
+        # Selitys
+        if include_answers:
+            explanation_para = doc.add_paragraph()
+            explanation_para.paragraph_format.left_indent = Inches(0.15)
+            explanation_para.paragraph_format.right_indent = Inches(0.15)
+            
+            exp_header = explanation_para.add_run(f'Oikea vastaus: {option_letter(q["correct"])}\n')
+            exp_header.bold = True
+            exp_header.font.size = Pt(9)
+            
+            exp_text = explanation_para.add_run(q['explanation'])
+            exp_text.font.size = Pt(9)
+            exp_text.font.color.rgb = RGBColor(74, 85, 104)
+        
+        # Erotin
+        doc.add_paragraph('_' * 80)
+        
+        # Sivunvaihto joka 5. kysymyksen jälkeen
+        if idx % 5 == 0 and idx < len(questions):
+            doc.add_page_break()
+    
+    # Tallenna muistiin
+    buffer = BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def build_document(fmt, questions, include_answers, duplicate_info, path):
+    """
+    Prosessipoolin työ: rakentaa dokumentin ja kirjoittaa sen tiedostoon.
+    Kirjoitus tehdään väliaikaiseen tiedostoon ja siirretään paikalleen, joten
+    keskeneräistä tiedostoa ei koskaan palvella.
+    """
+    create = create_pdf_document if fmt == 'pdf' else create_word_document
+    buffer = create(questions, include_answers, duplicate_info)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, path)
+    return len(questions)
+
+
+class DocumentBuildManager:
+    """Rakentaa dokumentit prosessipoolissa ja palvelee toistuvat lataukset levyvälimuistista."""
+
+    def __init__(self, db_manager, cache_dir=DOCUMENT_CACHE_DIR, processes=DOCUMENT_WORKERS):
+        self.db_manager = db_manager
+        self.cache_dir = cache_dir
+        self.processes = processes
+        self._pool = None
+        self._builds = {}  # Vain kesken olevat rakennukset
+        self._errors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fetch_questions(self, categories=(), difficulties=(), sort_by='id'):
+        """Hakee dokumentin kysymykset suodattimilla ja järjestyksellä."""
+        query = "SELECT id, question, explanation, options, correct, category, difficulty FROM questions WHERE 1=1"
+        params = []
+        if categories:
+            query += f" AND category IN ({','.join('?' * len(categories))})"
+            params.extend(categories)
+        if difficulties:
+            query += f" AND difficulty IN ({','.join('?' * len(difficulties))})"
+            params.extend(difficulties)
+        query += f" ORDER BY {SORT_ORDERS.get(sort_by, SORT_ORDERS['id'])}"
+        rows = self.db_manager._execute(query, tuple(params), fetch='all') or []
+        return [dict(row, options=json.loads(row['options'])) for row in rows]
+
+    def build_key(self, fmt, include_answers, sort_by, categories, difficulties, duplicate_info):
+        """Välimuistiavain valinnoista ja kysymyspankin versiosta."""
+        spec = [fmt, bool(include_answers), sort_by, sorted(categories), sorted(difficulties), duplicate_info,
+                self.db_manager.get_question_bank_version()]
+        return hashlib.sha1(json.dumps(spec, ensure_ascii=False).encode('utf-8')).hexdigest()[:24]
+
+    def _path(self, build_id, fmt):
+        return os.path.join(self.cache_dir, f"{build_id}.{DOCUMENT_FORMATS[fmt][0]}")
+
+    def request(self, fmt='pdf', include_answers=True, sort_by='id', categories=(), difficulties=(), duplicate_info=None):
+        """
+        Palauttaa rakennuksen tilan (ks. status) tai None, jos suodattimilla ei ole kysymyksiä.
+        Valmis välimuistitiedosto palautetaan heti; muuten rakennus käynnistetään
+        (tai liitytään jo käynnissä olevaan samaan rakennukseen).
+        """
+        build_id = f"{fmt}-{self.build_key(fmt, include_answers, sort_by, categories, difficulties, duplicate_info)}"
+        path = self._path(build_id, fmt)
+        if os.path.exists(path):
+            os.utime(path)  # Käytetty tiedosto säilyy karsinnassa
+            return self.status(build_id)
+
+        with self._lock:
+            if build_id in self._builds:
+                return self.status(build_id)
+            questions = self.fetch_questions(categories, difficulties, sort_by)
+            if not questions:
+                return None
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if self._pool is None:
+                # spawn: web-prosessin haarauttaminen säikeiden ollessa käynnissä voi periä lukittuja lukkoja
+                self._pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'))
+            self._errors.pop(build_id, None)
+            future = self._pool.submit(build_document, fmt, questions, include_answers, duplicate_info, path)
+            self._builds[build_id] = {'future': future, 'fmt': fmt, 'count': len(questions), 'started_at': datetime.now()}
+        future.add_done_callback(lambda done: self._finished(build_id, done))
+        logger.info(f"Dokumentin rakennus {build_id} aloitettu ({len(questions)} kysymystä)")
+        return self.status(build_id)
+
+    def _finished(self, build_id, future):
+        """Poistaa valmistuneen rakennuksen seurannasta; virhe säilytetään tilakyselyä varten."""
+        with self._lock:
+            build = self._builds.pop(build_id)
+            error = future.exception()
+            if error is not None:
+                self._errors[build_id] = str(error)
+                while len(self._errors) > MAX_FAILED_BUILDS:
+                    self._errors.popitem(last=False)
+        if error is not None:
+            logger.error(f"Virhe dokumentin {build_id} rakentamisessa: {error}")
+            return
+        seconds = (datetime.now() - build['started_at']).total_seconds()
+        logger.info(f"Dokumentti {build_id} valmis ({seconds:.1f} s)")
+        self._prune()
+
+    def _prune(self):
+        """Poistaa vanhimmat välimuistitiedostot, kun niitä on yli DOCUMENT_CACHE_MAX_FILES."""
+        try:
+            files = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                     if not name.endswith('.tmp')]
+            files.sort(key=os.path.getmtime, reverse=True)
+            for path in files[DOCUMENT_CACHE_MAX_FILES:]:
+                os.remove(path)
+        except OSError as e:
+            logger.error(f"Virhe dokumenttivälimuistin karsinnassa: {e}")
+
+    def status(self, build_id):
+        """Tila: {'id', 'status': building | ready | error, 'format', 'questions', 'error'} tai None."""
+        if not BUILD_ID_PATTERN.match(build_id):
+            return None
+        fmt = build_id.split('-', 1)[0]
+        build = self._builds.get(build_id)
+        result = {'id': build_id, 'format': fmt, 'questions': build['count'] if build else None, 'error': None}
+        if build is not None:
+            return dict(result, status='building')
+        if build_id in self._errors:
+            return dict(result, status='error', error=self._errors[build_id])
+        if os.path.exists(self._path(build_id, fmt)):
+            return dict(result, status='ready')
+        return None
+
+    def file(self, build_id):
+        """Valmiin dokumentin (polku, mimetype, tiedostopääte) tai None."""
+        state = self.status(build_id)
+        if state is None or state['status'] != 'ready':
+            return None
+        extension, mimetype = DOCUMENT_FORMATS[state['format']]
+        return self._path(build_id, state['format']), mimetype, extension
@@ -0,0 +1,269 @@
+"""
+Duplicate Index - MinHash/LSH-indeksi lähes identtisille kysymyksille
+
+Jokaiselle kysymykselle lasketaan normalisoidun (logic/question_fingerprint.py)
+tekstin merkkishinglejen MinHash-allekirjoitus (NUM_PERM lukua), joka
+tallennetaan question_minhash-tauluun yhdessä tekstin tiivisteen kanssa. Allekirjoitus jaetaan BANDS
+kaistaan; kysymykset, joilla on sama kaista jossakin kohdassa, ovat
+ehdokaspareja. Vain ehdokkaille ajetaan tarkka SequenceMatcher-vertailu,
+joten kaikkien parien O(n²)-vertailua ei tarvita.
+
+Indeksi päivittyy inkrementaalisesti: index_question() laskee yhden
+kysymyksen uudelleen, ja sync() laskee vain puuttuvat tai muuttuneet
+(tiiviste ei täsmää) ja poistaa poistettujen kysymysten rivit.
+
+Lasketut parien pisteet tallennetaan question_similarity-tauluun
+tekstitiivisteiden mukaan. Uusi haku laskee vain ne ehdokasparit, joiden
+jompikumpi teksti on muuttunut, ja kynnyksen mukainen haku on indeksoitu
+väliskannaus tallennetuista pisteistä. Pisteet lasketaan aina kynnyksellä
+SCORE_FLOOR, joten ne kelpaavat mille tahansa vähintään yhtä suurelle kynnykselle.
+
+Yksittäisen tekstin haku (find_similar_to, esim. kysymystä lisättäessä)
+käyttää muistissa pidettävää käänteisindeksiä (kaista, avain) -> kysymykset,
+joka rakennetaan uudelleen vain, kun indeksitaulu on muuttunut.
+
+Kaistoja 32 x 4 riviä: pari löytyy ehdokkaaksi ~99 % todennäköisyydellä, kun
+shinglejen Jaccard-samankaltaisuus on yli 0.6 (SequenceMatcher 0.9+ pareilla
+se on käytännössä aina).
+
+Käyttö:
+    python -m logic.duplicate_index [--threshold 95]
+"""
+import argparse
+import hashlib
+import logging
+import zlib
+from datetime import datetime
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from logic.question_fingerprint import normalize_question
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+BANDS = 32
+ROWS_PER_BAND = NUM_PERM // BANDS
+SCORE_FLOOR = 0.5  # Pienin kynnys, jolle tallennetut pisteet ovat tarkkoja (lomakkeen minimi)
+MERSENNE_PRIME = np.uint64(4294967291)  # Suurin alkuluku < 2^32: allekirjoitukset mahtuvat uint32:een
+
+_rng = np.random.default_rng(20240611)
+_PERM_A = _rng.integers(1, int(MERSENNE_PRIME), NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, int(MERSENNE_PRIME), NUM_PERM, dtype=np.uint64)
+_BAND_MIX = _rng.integers(1, 2 ** 63, ROWS_PER_BAND, dtype=np.uint64)
+
+
+def content_hash(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def shingle_hashes(normalized):
+    """Merkkishinglejen 32-bittiset tiivisteet (lyhyt teksti on yksi shingle)."""
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def minhash_signature(normalized):
+    """MinHash-allekirjoitus: jokaisen permutaation (a*x + b) mod p minimi shingleistä."""
+    hashes = shingle_hashes(normalized)
+    # a < 2^32 ja x < 2^32, joten tulo mahtuu uint64:ään
+    permuted = (hashes[:, None] * _PERM_A[None, :] + _PERM_B[None, :]) % MERSENNE_PRIME
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def band_keys(signatures):
+    """Kaistojen avaimet muodossa (n, BANDS): kunkin kaistan rivit sekoitettuna yhdeksi luvuksi."""
+    bands = signatures.reshape(len(signatures), BANDS, ROWS_PER_BAND).astype(np.uint64)
+    return (bands * _BAND_MIX).sum(axis=2)
+
+
+def candidate_pairs(signatures):
+    """Indeksiparit (i < j), joilla ainakin yksi kaista on sama."""
+    if len(signatures) < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+    keys = band_keys(signatures)
+    pairs = []
+    for band in range(BANDS):
+        order = np.argsort(keys[:, band], kind='stable')
+        sorted_keys = keys[order, band]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+        sizes = np.diff(np.concatenate((starts, [len(sorted_keys)])))
+        for start, size in zip(starts[sizes > 1], sizes[sizes > 1]):
+            members = np.sort(order[start:start + size])
+            i, j = np.triu_indices(size, k=1)
+            pairs.append(np.stack((members[i], members[j]), axis=1))
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def similarity(text1, text2, threshold=0.0):
+    """SequenceMatcher-suhde (0-1) pienillä kirjaimilla; halvat ylärajat karsivat ensin."""
+    matcher = SequenceMatcher(None, text1.lower(), text2.lower())
+    if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+        return 0.0
+    return matcher.ratio()
+
+
+def pair_key(hash1, hash2):
+    """Parin avain question_similarity-tauluun (tiivisteet järjestyksessä)."""
+    return (hash1, hash2) if hash1 <= hash2 else (hash2, hash1)
+
+
+def _encode(signature):
+    return signature.astype('<u4').tobytes().hex()
+
+
+def _decode(value):
+    return np.frombuffer(bytes.fromhex(value), dtype='<u4').astype(np.uint32)
+
+
+class DuplicateIndex:
+    """Pysyvä MinHash/LSH-indeksi question_minhash-taulussa."""
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self._inverted = None  # (leima, rivit, {(kaista, avain): [rivi-indeksit]})
+
+    def _signature_row(self, question_id, question_text):
+        normalized = normalize_question(question_text)
+        return (question_id, content_hash(normalized), _encode(minhash_signature(normalized)), datetime.now())
+
+    def index_question(self, question_id, question_text):
+        """Laskee yhden kysymyksen allekirjoituksen uudelleen (lisäys tai muokkaus)."""
+        success, error = self.db_manager.upsert_minhash_signatures([self._signature_row(question_id, question_text)])
+        if not success:
+            logger.error(f"Virhe kysymyksen {question_id} MinHash-indeksoinnissa: {error}")
+        return success
+
+    def sync(self):
+        """
+        Päivittää indeksin vastaamaan questions-taulua: laskee vain uudet ja
+        muuttuneet kysymykset ja poistaa poistettujen rivit. Palauttaa (lisätyt/päivitetyt, poistetut).
+        """
+        questions = self.db_manager._execute("SELECT id, question FROM questions", fetch='all') or []
+        stored = {row['question_id']: row['content_hash'] for row in self.db_manager.get_minhash_hashes()}
+
+        changed = []
+        for row in questions:
+            normalized = normalize_question(row['question'])
+            if stored.get(row['id']) != content_hash(normalized):
+                changed.append(self._signature_row(row['id'], row['question']))
+        removed = set(stored) - {row['id'] for row in questions}
+
+        if changed:
+            self.db_manager.upsert_minhash_signatures(changed)
+        if removed:
+            self.db_manager.delete_minhash_signatures(sorted(removed))
+        if changed or removed:
+            logger.info(f"MinHash-indeksi päivitetty: {len(changed)} laskettu, {len(removed)} poistettu")
+        return len(changed), len(removed)
+
+    def _load(self):
+        """Lataa allekirjoitukset ja kysymystekstit samassa järjestyksessä."""
+        rows = self.db_manager._execute("""
+            SELECT q.id, q.question, q.category, m.content_hash, m.signature
+            FROM questions q JOIN question_minhash m ON m.question_id = q.id
+            ORDER BY q.id
+        """, fetch='all') or []
+        signatures = np.array([_decode(row['signature']) for row in rows]).reshape(len(rows), NUM_PERM)
+        return rows, signatures
+
+    def split_cached(self, rows, pairs):
+        """
+        Jakaa ehdokasparit jo laskettuihin ja laskemattomiin.
+        Palauttaa ([(id1, id2, pisteet)], [(i, j)]), missä i ja j ovat rows-indeksejä.
+        """
+        pairs = pairs.tolist()
+        keys = [pair_key(rows[i]['content_hash'], rows[j]['content_hash']) for i, j in pairs]
+        stored = self.db_manager.get_similarity_scores_for(set(keys))
+        cached, missing = [], []
+        for (i, j), key in zip(pairs, keys):
+            score = stored.get(key)
+            if score is None:
+                missing.append((i, j))
+            else:
+                cached.append((rows[i]['id'], rows[j]['id'], score))
+        return cached, missing
+
+    def store_scores(self, scored):
+        """Tallentaa lasketut pisteet: scored = [(hash1, hash2, pisteet)]."""
+        now = datetime.now()
+        rows = {pair_key(hash1, hash2): score for hash1, hash2, score in scored}
+        success, error = self.db_manager.upsert_similarity_scores(
+            [(hash1, hash2, score, now) for (hash1, hash2), score in rows.items()]
+        )
+        if not success:
+            logger.error(f"Virhe samankaltaisuuspisteiden tallennuksessa: {error}")
+        return success
+
+    def find_similar_pairs(self, threshold=0.95):
+        """
+        Etsii kysymysparit, joiden samankaltaisuus on vähintään threshold (0-1, >= SCORE_FLOOR).
+        Laskee vain puuttuvat parit ja hakee tuloksen tallennetuista pisteistä.
+        """
+        started = datetime.now()
+        self.sync()
+        self.db_manager.prune_similarity_scores()
+        rows, signatures = self._load()
+
+        pairs = candidate_pairs(signatures)
+        cached, missing = self.split_cached(rows, pairs)
+        scored = [
+            (rows[i]['content_hash'], rows[j]['content_hash'], round(similarity(rows[i]['question'], rows[j]['question'], SCORE_FLOOR), 4))
+            for i, j in missing
+        ]
+        if scored:
+            self.store_scores(scored)
+        similar = self.db_manager.get_similar_question_pairs(threshold)
+
+        seconds = (datetime.now() - started).total_seconds()
+        logger.info(f"Duplikaattihaku: {len(rows)} kysymystä, {len(pairs)} ehdokasparia ({len(missing)} laskettu), {len(similar)} osumaa, {seconds:.2f} s")
+        return similar
+
+    def _inverted_index(self):
+        """Palauttaa (rivit, käänteisindeksi); rakennetaan uudelleen, jos indeksitaulu on muuttunut."""
+        stamp = self.db_manager.get_minhash_stamp()
+        if self._inverted is None or self._inverted[0] != stamp:
+            rows, signatures = self._load()
+            buckets = {}
+            for i, keys in enumerate(band_keys(signatures).tolist()):
+                for band, key in enumerate(keys):
+                    buckets.setdefault((band, key), []).append(i)
+            self._inverted = (stamp, rows, buckets)
+        return self._inverted[1], self._inverted[2]
+
+    def find_similar_to(self, question_text, threshold=0.9, exclude_id=None):
+        """Etsii annetun tekstin lähes identtiset kysymykset (esim. ennen lisäystä)."""
+        rows, buckets = self._inverted_index()
+        query_keys = band_keys(minhash_signature(normalize_question(question_text))[None, :])[0].tolist()
+        candidates = set()
+        for band, key in enumerate(query_keys):
+            candidates.update(buckets.get((band, key), ()))
+
+        matches = []
+        for i in candidates:
+            row = rows[i]
+            if row['id'] == exclude_id:
+                continue
+            score = similarity(question_text, row['question'], threshold)
+            if score >= threshold:
+                matches.append({'id': row['id'], 'question': row['question'], 'category': row['category'],
+                                'similarity': round(score * 100, 1)})
+        return sorted(matches, key=lambda m: -m['similarity'])
+
+if __name__ == '__main__':
+    from data_access.database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Päivitä MinHash-indeksi ja listaa lähes identtiset kysymykset.")
+    parser.add_argument('--threshold', type=float, default=95, help="Samankaltaisuuskynnys prosentteina")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for pair in DuplicateIndex(DatabaseManager()).find_similar_pairs(args.threshold / 100):
+        print(f"{pair['similarity']:>5}%  #{pair['id1']} ~ #{pair['id2']}  {pair['question1'][:60]}")
@@ -0,0 +1,185 @@
+"""
+Duplicate Scan - Duplikaattihaun taustatyö
+
+MinHash-indeksin (logic/duplicate_index.py) ehdokasparien tarkka
+vertailu ajetaan prosessipoolissa CHUNK_PAIRS kokoisina paloina. Taustasäie
+toimii vain koordinaattorina: se lähettää palat pooliin, tallentaa valmiiden
+palojen pisteet ja tarkistaa peruutuksen tulosten välissä. Työn tila
+(edistyminen ja tähän mennessä löydetyt parit) pidetään muistissa, josta
+tilareitti palauttaa sen selaimen kyselyille.
+
+Pooli käynnistetään spawn-kontekstilla: web-prosessista haarautuminen
+(fork) säikeiden ollessa käynnissä voi jättää lapsiprosessiin lukittuja
+lukkoja. Poolissa on kerrallaan enintään IN_FLIGHT_PER_WORKER palaa työprosessia
+kohden, joten peruutus ei jää odottamaan koko jonoa. Jo lasketut parit
+luetaan question_similarity-taulusta (DuplicateIndex.split_cached), joten
+laskettavaksi jäävät vain parit, joiden teksti on muuttunut.
+Jokaisen valmistuneen palan pisteet tallennetaan heti, joten perutunkin haun
+työ säilyy. Muistiin kerätään parit, joiden samankaltaisuus on vähintään
+SCORE_FLOOR, joten kynnysarvon muutos suodattaa jo lasketut pisteet eikä
+käynnistä uutta laskentaa.
+
+Työt ovat prosessikohtaisia (yksi gunicorn-työprosessi, ks. Procfile).
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+from logic.duplicate_index import SCORE_FLOOR, candidate_pairs, similarity
+
+logger = logging.getLogger(__name__)
+
+CHUNK_PAIRS = 2000
+SCAN_WORKERS = None  # None = prosessorien määrä
+IN_FLIGHT_PER_WORKER = 2
+MAX_FINISHED_JOBS = 5
+
+
+def verify_chunk(chunk):
+    """Laskee palan parien (teksti1, teksti2) pisteet samassa järjestyksessä."""
+    return [round(similarity(text1, text2, SCORE_FLOOR), 4) for text1, text2 in chunk]
+
+
+class DuplicateScanJob:
+    """Yhden duplikaattihaun tila."""
+
+    def __init__(self, stamp):
+        self.id = uuid.uuid4().hex[:12]
+        self.stamp = stamp
+        self.status = 'running'
+        self.total = 0
+        self.done = 0
+        self.scores = []
+        self.questions = {}
+        self.error = None
+        self.started_at = datetime.now()
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status != 'running'
+
+    def progress(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'done': self.done,
+            'total': self.total,
+            'found': len(self.scores),
+            'error': self.error,
+        }
+
+    def pairs(self, threshold, start=0, end=None):
+        """
+        Kynnyksen ylittävät parit tulosmuodossa pisteindekseiltä start..end.
+        Pisteitä vain lisätään listan loppuun, joten indeksi kelpaa tilakyselyn jatkokohdaksi (since).
+        """
+        result = []
+        for id1, id2, score in self.scores[start:end]:
+            if score < threshold:
+                continue
+            q1, q2 = self.questions[id1], self.questions[id2]
+            result.append({
+                'id1': id1, 'question1': q1['question'], 'category1': q1['category'],
+                'id2': id2, 'question2': q2['question'], 'category2': q2['category'],
+                'similarity': round(score * 100, 1),
+            })
+        return result
+
+
+class DuplicateScanManager:
+    """Käynnistää, seuraa ja peruu duplikaattihakuja."""
+
+    def __init__(self, duplicate_index, processes=SCAN_WORKERS):
+        self.duplicate_index = duplicate_index
+        self.processes = processes
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Käynnistää haun tai palauttaa olemassa olevan: käynnissä olevan työn tai
+        valmiin työn, jonka jälkeen indeksi ei ole muuttunut (kynnyksen vaihto).
+        """
+        self.duplicate_index.sync()
+        self.duplicate_index.db_manager.prune_similarity_scores()
+        stamp = self.duplicate_index.db_manager.get_minhash_stamp()
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status == 'running' or (job.status == 'done' and job.stamp == stamp):
+                    return job
+            job = DuplicateScanJob(stamp)
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.finished]
+            for old in sorted(finished, key=lambda j: j.started_at)[:-MAX_FINISHED_JOBS or None]:
+                del self._jobs[old.id]
+        threading.Thread(target=self._run, args=(job,), daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def _run(self, job):
+        try:
+            rows, signatures = self.duplicate_index._load()
+            job.questions = {row['id']: {'question': row['question'], 'category': row['category']} for row in rows}
+            pairs = candidate_pairs(signatures)
+            cached, missing = self.duplicate_index.split_cached(rows, pairs)
+            job.total = len(pairs)
+            job.scores.extend(score for score in cached if score[2] >= SCORE_FLOOR)
+            job.done = len(cached)
+
+            if missing:
+                self._verify(job, rows, missing)
+
+            job.status = 'cancelled' if job.cancel_event.is_set() else 'done'
+        except Exception as e:
+            logger.error(f"Virhe duplikaattihaussa: {e}")
+            job.status, job.error = 'error', str(e)
+        finally:
+            job.finished_at = datetime.now()
+            seconds = (job.finished_at - job.started_at).total_seconds()
+            logger.info(f"Duplikaattihaku {job.id}: {job.status}, {job.done}/{job.total} paria, {len(job.scores)} yli {SCORE_FLOOR}, {seconds:.1f} s")
+
+    def _verify(self, job, rows, missing):
+        """Laskee puuttuvat parit poolissa; säie tallentaa pisteet palan valmistuttua."""
+        chunks = (missing[start:start + CHUNK_PAIRS] for start in range(0, len(missing), CHUNK_PAIRS))
+        window = (self.processes or os.cpu_count() or 1) * IN_FLIGHT_PER_WORKER
+        pending = {}
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+            while True:
+                while len(pending) < window and not job.cancel_event.is_set():
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    texts = [(rows[i]['question'], rows[j]['question']) for i, j in chunk]
+                    pending[pool.submit(verify_chunk, texts)] = chunk
+                if not pending:
+                    break
+                completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    chunk = pending.pop(future)
+                    scores = future.result()
+                    self.duplicate_index.store_scores(
+                        [(rows[i]['content_hash'], rows[j]['content_hash'], score) for (i, j), score in zip(chunk, scores)]
+                    )
+                    job.scores.extend(
+                        (rows[i]['id'], rows[j]['id'], score) for (i, j), score in zip(chunk, scores) if score >= SCORE_FLOOR
+                    )
+                    job.done += len(chunk)
+                if job.cancel_event.is_set():
+                    for future in pending:
+                        future.cancel()
+                    break
@@ -0,0 +1,285 @@
+"""
+Feature Store - Käyttäjäkohtaiset esilasketut piirteet suosituksia varten
+
+Pitää user_features-taulussa jokaiselle käyttäjälle valmiiksi lasketut
+tiedot: kategoriakohtaiset onnistumisprosentit, heikoimman kategorian,
+erääntyvien kertausten määrän, harjoitteluputken ja simulaatioiden määrän.
+Vastaukset päivittävät rivin inkrementaalisesti (yksi luku + yksi kirjoitus),
+joten suositukset ovat pelkkiä hakuja. Täysi uudelleenlaskenta tehdään
+kaikille käyttäjille kerralla koostekyselyillä.
+
+Käyttö:
+    python -m logic.feature_store
+"""
+import logging
+from datetime import datetime, date, timedelta
+
+from logic.date_utils import to_date
+
+logger = logging.getLogger(__name__)
+
+WEAK_MIN_ATTEMPTS = 5  # Näin monta vastausta kategoriassa ennen kuin sitä voidaan pitää heikkona
+
+
+def calculate_streaks(practice_dates, today=None):
+    """
+    Laskee nykyisen ja pisimmän harjoitteluputken.
+    practice_dates: harjoittelupäivät laskevassa järjestyksessä ilman toistoja.
+    """
+    if not practice_dates:
+        return {'current_streak': 0, 'longest_streak': 0}
+
+    today = today or date.today()
+    current_streak = 0
+    if (today - practice_dates[0]).days <= 1:
+        current_streak = 1
+        for i in range(len(practice_dates) - 1):
+            if (practice_dates[i] - practice_dates[i + 1]).days == 1:
+                current_streak += 1
+            else:
+                break
+
+    longest_streak = 1
+    temp_streak = 1
+    for i in range(len(practice_dates) - 1):
+        if (practice_dates[i] - practice_dates[i + 1]).days == 1:
+            temp_streak += 1
+        else:
+            temp_streak = 1
+        longest_streak = max(longest_streak, temp_streak)
+
+    return {'current_streak': current_streak, 'longest_streak': longest_streak}
+
+
+def is_due(last_shown, interval, now=None):
+    """Onko kysymys erääntynyt kertaukseen (sama ehto kuin erääntyvien haussa)."""
+    if last_shown is None:
+        return False
+    shown_on = to_date(last_shown)
+    return shown_on + timedelta(days=interval or 1) <= (now or date.today())
+
+
+def _weakest_category(category_stats):
+    """Palauttaa (kategoria, onnistumisprosentti) heikoimmalle riittävästi harjoitellulle kategorialle."""
+    candidates = [
+        (corrects / attempts, category)
+        for category, (attempts, corrects) in category_stats.items()
+        if attempts >= WEAK_MIN_ATTEMPTS
+    ]
+    if not candidates:
+        return None, None
+    rate, category = min(candidates)
+    return category, rate
+
+
+class FeatureStore:
+    """Käyttäjäkohtaisten suosituspiirteiden tallennus ja inkrementaalinen ylläpito."""
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    # --- Täysi laskenta ---
+
+    def _date_expr(self):
+        return "CAST(timestamp AS DATE)" if self.db_manager.is_postgres else "DATE(timestamp)"
+
+    def _build_row(self, user_id, category_rows, due_count, practice_dates, simulation_count, today):
+        category_stats = {}
+        answered = 0
+        for row in category_rows:
+            category_stats[row['category']] = [int(row['attempts'] or 0), int(row['corrects'] or 0)]
+            answered += int(row['answered'] or 0)
+        weakest, weakest_rate = _weakest_category(category_stats)
+        streak = calculate_streaks(practice_dates, today)
+        return {
+            'user_id': user_id,
+            'answered_questions': answered,
+            'total_attempts': sum(a for a, _ in category_stats.values()),
+            'total_correct': sum(c for _, c in category_stats.values()),
+            'category_stats': category_stats,
+            'weakest_category': weakest,
+            'weakest_success_rate': weakest_rate,
+            'due_count': int(due_count or 0),
+            'current_streak': streak['current_streak'],
+            'longest_streak': streak['longest_streak'],
+            'last_practice_date': practice_dates[0].isoformat() if practice_dates else None,
+            'simulation_count': int(simulation_count or 0),
+        }
+
+    def compute_user(self, user_id):
+        """Laskee yhden käyttäjän piirteet tietokannasta."""
+        category_rows = self.db_manager._execute("""
+            SELECT q.category, COUNT(*) as answered,
+                   SUM(p.times_shown) as attempts, SUM(p.times_correct) as corrects
+            FROM user_question_progress p
+            JOIN questions q ON q.id = p.question_id
+            WHERE p.user_id = ? AND p.times_shown > 0
+            GROUP BY q.category
+        """, (user_id,), fetch='all') or []
+
+        due_row = self.db_manager._execute("""
+            SELECT COUNT(*) as count FROM user_question_progress
+            WHERE user_id = ? AND due_date <= ?
+        """, (user_id, date.today().isoformat()), fetch='one')
+
+        date_rows = self.db_manager._execute(f"""
+            SELECT DISTINCT {self._date_expr()} as practice_date
+            FROM question_attempts WHERE user_id = ?
+            ORDER BY practice_date DESC
+        """, (user_id,), fetch='all') or []
+
+        sim_row = self.db_manager._execute(
+            "SELECT COUNT(*) as count FROM study_sessions WHERE user_id = ? AND session_type = 'simulation'",
+            (user_id,), fetch='one'
+        )
+
+        return self._build_row(
+            user_id, category_rows,
+            due_row['count'] if due_row else 0,
+            [to_date(r['practice_date']) for r in date_rows],
+            sim_row['count'] if sim_row else 0,
+            date.today(),
+        )
+
+    def refresh_user(self, user_id):
+        """Laskee käyttäjän piirteet uudelleen ja tallentaa ne."""
+        features = self.compute_user(user_id)
+        success, error = self.db_manager.upsert_user_features([features])
+        if not success:
+            logger.error(f"Virhe käyttäjän {user_id} piirteiden tallennuksessa: {error}")
+        return features
+
+    def refresh_all(self):
+        """
+        Laskee kaikkien käyttäjien piirteet neljällä koostekyselyllä
+        ja kirjoittaa ne yhdessä transaktiossa.
+        """
+        started = datetime.now()
+        today = date.today()
+        try:
+            category_rows = self.db_manager._execute("""
+                SELECT p.user_id, q.category, COUNT(*) as answered,
+                       SUM(p.times_shown) as attempts, SUM(p.times_correct) as corrects
+                FROM user_question_progress p
+                JOIN questions q ON q.id = p.question_id
+                WHERE p.times_shown > 0
+                GROUP BY p.user_id, q.category
+            """, fetch='all') or []
+            due_rows = self.db_manager._execute("""
+                SELECT user_id, COUNT(*) as count FROM user_question_progress
+                WHERE due_date <= ? GROUP BY user_id
+            """, (today.isoformat(),), fetch='all') or []
+            date_rows = self.db_manager._execute(f"""
+                SELECT DISTINCT user_id, {self._date_expr()} as practice_date
+                FROM question_attempts
+            """, fetch='all') or []
+            sim_rows = self.db_manager._execute("""
+                SELECT user_id, COUNT(*) as count FROM study_sessions
+                WHERE session_type = 'simulation' GROUP BY user_id
+            """, fetch='all') or []
+            user_rows = self.db_manager._execute("SELECT id FROM users", fetch='all') or []
+        except Exception as e:
+            logger.error(f"Virhe piirteiden koostekyselyissä: {e}")
+            return False, str(e)
+
+        categories_by_user, dates_by_user = {}, {}
+        for row in category_rows:
+            categories_by_user.setdefault(row['user_id'], []).append(row)
+        for row in date_rows:
+            dates_by_user.setdefault(row['user_id'], []).append(to_date(row['practice_date']))
+        due_by_user = {row['user_id']: row['count'] for row in due_rows}
+        sims_by_user = {row['user_id']: row['count'] for row in sim_rows}
+
+        features = []
+        for row in user_rows:
+            user_id = row['id']
+            practice_dates = sorted(dates_by_user.get(user_id, []), reverse=True)
+            features.append(self._build_row(
+                user_id, categories_by_user.get(user_id, []), due_by_user.get(user_id, 0),
+                practice_dates, sims_by_user.get(user_id, 0), today
+            ))
+
+        success, error = self.db_manager.upsert_user_features(features)
+        if not success:
+            return False, error
+
+        seconds = (datetime.now() - started).total_seconds()
+        logger.info(f"Käyttäjäpiirteet päivitetty: {len(features)} käyttäjää, {seconds:.2f} s")
+        return True, {'users': len(features), 'seconds': round(seconds, 2)}
+
+    # --- Haku ja inkrementaalinen päivitys ---
+
+    def _load(self, user_id):
+        """Hakee tallennetut piirteet. Vanhentuneet (edelliseltä päivältä) palautetaan None:na."""
+        features = self.db_manager.get_user_features(user_id)
+        if not features or to_date(features.get('updated_at')) != date.today():
+            return None
+        return features
+
+    def get(self, user_id):
+        """
+        Palauttaa käyttäjän piirteet. Jos rivi puuttuu tai on edelliseltä päivältä
+        (putki ja erääntyneet ovat voineet muuttua), se lasketaan uudelleen.
+        """
+        features = self._load(user_id) or self.refresh_user(user_id)
+        attempts = features['total_attempts']
+        features['avg_success_rate'] = features['total_correct'] / attempts if attempts else 0
+        features['categories'] = [
+            {'category': category, 'name': category, 'attempts': a, 'success_rate': c / a if a else 0}
+            for category, (a, c) in features['category_stats'].items()
+        ]
+        return features
+
+    def on_attempt(self, user_id, category, is_correct, was_new, was_due):
+        """
+        Päivittää piirteet yhden vastauksen perusteella. Kutsutaan vastauksen
+        tallennuksen jälkeen: puuttuva tai vanhentunut rivi lasketaan kokonaan uudelleen.
+        """
+        try:
+            features = self._load(user_id)
+            if features is None:
+                self.refresh_user(user_id)
+                return
+
+            stats = features['category_stats'].setdefault(category, [0, 0])
+            stats[0] += 1
+            stats[1] += 1 if is_correct else 0
+            features['total_attempts'] += 1
+            features['total_correct'] += 1 if is_correct else 0
+            features['answered_questions'] += 1 if was_new else 0
+            if was_due:
+                features['due_count'] = max(0, features['due_count'] - 1)
+            features['weakest_category'], features['weakest_success_rate'] = _weakest_category(features['category_stats'])
+
+            today = date.today()
+            last_practice = to_date(features.get('last_practice_date'))
+            if last_practice != today:
+                if last_practice == today - timedelta(days=1):
+                    features['current_streak'] += 1
+                else:
+                    features['current_streak'] = 1
+                features['longest_streak'] = max(features['longest_streak'], features['current_streak'])
+                features['last_practice_date'] = today.isoformat()
+
+            self.db_manager.upsert_user_features([features])
+        except Exception as e:
+            logger.error(f"Virhe käyttäjän {user_id} piirteiden päivityksessä: {e}")
+
+    def on_simulation(self, user_id):
+        """Kasvattaa suoritettujen simulaatioiden määrää."""
+        try:
+            features = self._load(user_id)
+            if features is None:
+                self.refresh_user(user_id)
+                return
+            features['simulation_count'] += 1
+            self.db_manager.upsert_user_features([features])
+        except Exception as e:
+            logger.error(f"Virhe käyttäjän {user_id} simulaatiomäärän päivityksessä: {e}")
+
+
+if __name__ == '__main__':
+    from data_access.database_manager import DatabaseManager
+
+    logging.basicConfig(level=logging.INFO)
+    print(FeatureStore(DatabaseManager()).refresh_all())
@@ -0,0 +1,192 @@
+"""
+Import Jobs - Kysymystuonnit taustatöinä
+
+Ladattu tiedosto tallennetaan levylle (IMPORT_UPLOAD_DIR) ja tuonti ajetaan
+taustasäikeessä logic/question_import.py:n QuestionImporterilla, joten
+pyyntö palaa heti eikä gunicornin --timeout 120 katkaise suurta tuontia.
+
+Työn tila tallennetaan import_jobs-tauluun jokaisen erän jälkeen (luetut,
+lisätyt, päivitetyt, duplikaatit, ohitetut rivit, virheet, luetut tavut), josta
+ylläpitäjän sivu seuraa sitä. Tilat:
+
+  queued -> running -> done | cancelled | error
+  running -> interrupted (työprosessi käynnistyi uudelleen kesken tuonnin)
+
+Kun sovellus käynnistyy, keskeytyneet työt jatketaan viimeisestä kirjatusta
+rivistä (resume_unfinished). Perutun, keskeytyneen tai virheeseen päättyneen
+työn voi myös jatkaa käsin. Tiedosto poistetaan, kun työ on valmis.
+
+Käynnissä olevat työt ovat prosessikohtaisia (yksi gunicorn-työprosessi, ks. Procfile).
+"""
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from logic.question_import import ImportFormatError
+
+logger = logging.getLogger(__name__)
+
+IMPORT_UPLOAD_DIR = os.environ.get('IMPORT_UPLOAD_DIR', os.path.join('uploads', 'imports'))
+FINISHED_STATES = ('done', 'cancelled', 'error')
+RESUMABLE_STATES = ('cancelled', 'error', 'interrupted')
+
+
+def job_stats(job):
+    """Tietueen laskurit QuestionImporterin tilastomuodossa."""
+    return {
+        'read': job['rows_read'] or 0,
+        'added': job['rows_added'] or 0,
+        'updated': job['rows_updated'] or 0,
+        'duplicates': job['rows_duplicate'] or 0,
+        'skipped': job['rows_skipped'] or 0,
+        'errors': job['errors'],
+    }
+
+
+def job_progress(job):
+    """Tietue JSON-vastaukseksi edistymisprosentin kanssa."""
+    progress = {key: job[key] for key in (
+        'id', 'filename', 'status', 'mode', 'rows_read', 'rows_added', 'rows_updated', 'rows_duplicate', 'rows_skipped',
+        'errors', 'bytes_read', 'bytes_total',
+    )}
+    total = job['bytes_total'] or 0
+    progress['percent'] = 100 if job['status'] == 'done' else (round(100 * (job['bytes_read'] or 0) / total, 1) if total else 0)
+    for key in ('created_at', 'updated_at', 'finished_at'):
+        progress[key] = str(job[key]) if job[key] else None
+    return progress
+
+
+class ImportJobManager:
+    """Käynnistää, seuraa, peruu ja jatkaa tuontitöitä."""
+
+    def __init__(self, db_manager, importer, upload_dir=IMPORT_UPLOAD_DIR, after_import=None):
+        self.db_manager = db_manager
+        self.importer = importer
+        self.upload_dir = upload_dir
+        self.after_import = after_import  # Kutsutaan, kun työ lisäsi tai päivitti kysymyksiä (esim. MinHash-indeksin päivitys)
+        self._cancel_events = {}
+        self._lock = threading.Lock()
+
+    def submit(self, file_storage, user_id, mode='insert'):
+        """
+        Tallentaa ladatun tiedoston ja käynnistää tuonnin. Palauttaa (True, työ) tai (False, virhe).
+        mode: 'insert' (kannassa olevat ohitetaan) tai 'upsert' (muuttuneet päivitetään).
+        """
+        job_id = uuid.uuid4().hex[:12]
+        extension = os.path.splitext(file_storage.filename)[1].lower()
+        path = os.path.join(self.upload_dir, f"{job_id}{extension}")
+        try:
+            os.makedirs(self.upload_dir, exist_ok=True)
+            file_storage.save(path)
+        except OSError as e:
+            logger.error(f"Virhe tuontitiedoston tallennuksessa: {e}")
+            return False, str(e)
+
+        success, error = self.db_manager.create_import_job(job_id, file_storage.filename, path, os.path.getsize(path), user_id, mode)
+        if not success:
+            os.remove(path)
+            return False, error
+        self._start(job_id)
+        return True, self.db_manager.get_import_job(job_id)
+
+    def get(self, job_id):
+        return self.db_manager.get_import_job(job_id)
+
+    def is_running(self, job_id):
+        return job_id in self._cancel_events
+
+    def cancel(self, job_id):
+        """Peruu työn: käynnissä oleva lopettaa seuraavan rivin kohdalla, jonossa oleva heti."""
+        event = self._cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+            return True
+        job = self.get(job_id)
+        if job and job['status'] in ('queued', 'interrupted'):
+            self.db_manager.update_import_job(job_id, status='cancelled', finished_at=datetime.now())
+            return True
+        return False
+
+    def resume(self, job_id):
+        """Jatkaa perutun, keskeytyneen tai virheeseen päättyneen työn viimeisestä kirjatusta rivistä."""
+        job = self.get(job_id)
+        if job is None or self.is_running(job_id) or job['status'] not in RESUMABLE_STATES:
+            return False
+        if not job['file_path'] or not os.path.exists(job['file_path']):
+            self.db_manager.update_import_job(job_id, status='error', errors=job['errors'] + ["Tuontitiedosto puuttuu, työtä ei voi jatkaa"])
+            return False
+        self._start(job_id)
+        return True
+
+    def resume_unfinished(self):
+        """Sovelluksen käynnistyessä: jatkaa työt, jotka jäivät kesken tai jonoon."""
+        resumed = 0
+        try:
+            unfinished = self.db_manager.get_import_jobs(limit=100, statuses=('queued', 'running'))
+        except Exception as e:
+            logger.error(f"Virhe keskeytyneiden tuontitöiden haussa: {e}")
+            return 0
+        for job in unfinished:
+            if self.is_running(job['id']):
+                continue
+            self.db_manager.update_import_job(job['id'], status='interrupted')
+            if self.resume(job['id']):
+                resumed += 1
+        if resumed:
+            logger.info(f"Jatkettiin {resumed} keskeytynyttä tuontityötä")
+        return resumed
+
+    def _start(self, job_id):
+        with self._lock:
+            if job_id in self._cancel_events:
+                return
+            event = threading.Event()
+            self._cancel_events[job_id] = event
+        threading.Thread(target=self._run, args=(job_id, event), daemon=True).start()
+
+    def _save_progress(self, job_id, stats, **fields):
+        self.db_manager.update_import_job(
+            job_id,
+            rows_read=stats['read'], rows_added=stats['added'], rows_updated=stats['updated'], rows_duplicate=stats['duplicates'],
+            rows_skipped=stats['skipped'], errors=stats['errors'], bytes_read=stats.get('bytes', 0),
+            **fields
+        )
+
+    def _run(self, job_id, cancel_event):
+        job = self.get(job_id)
+        stats = dict(job_stats(job), bytes=job['bytes_read'] or 0)
+        written_before = stats['added'] + stats['updated']
+        status = 'error'
+
+        def progress(current):
+            # Kopio viimeksi kirjatusta tilasta: virheen sattuessa kantaan ei kirjata tallentamattomia rivejä
+            nonlocal stats
+            stats = dict(current, errors=list(current['errors']))
+            self._save_progress(job_id, stats)
+
+        try:
+            self.db_manager.update_import_job(job_id, status='running', finished_at=None)
+            with open(job['file_path'], 'rb') as f:
+                stats = self.importer.import_stream(f, progress=progress, stats=stats, cancelled=cancel_event.is_set,
+                                                    mode=job['mode'] or 'insert')
+            status = 'cancelled' if cancel_event.is_set() else 'done'
+        except ImportFormatError as e:
+            stats['errors'] = stats['errors'] + [f"Virheellinen tiedosto: {e}"]
+        except Exception as e:
+            logger.error(f"Virhe tuontityössä {job_id}: {e}")
+            stats['errors'] = stats['errors'] + [f"Odottamaton virhe: {e}"]
+        finally:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+            self._save_progress(job_id, stats, status=status, finished_at=datetime.now())
+            if status == 'done' and os.path.exists(job['file_path']):
+                os.remove(job['file_path'])
+            logger.info(f"Tuontityö {job_id}: {status}, {stats['read']} riviä, {stats['added']} lisätty, {stats['updated']} päivitetty")
+
+        if stats['added'] + stats['updated'] > written_before and self.after_import:
+            try:
+                self.after_import()
+            except Exception as e:
+                logger.error(f"Virhe tuonnin jälkikäsittelyssä: {e}")
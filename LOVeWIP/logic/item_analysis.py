@@ -0,0 +1,147 @@
+"""
+Item Analysis - Kysymyspankin osioanalyysi (psykometriikka)
+
+Lataa kaikki vastausyritykset NumPy-taulukoihin ja laskee vektoroidusti
+jokaiselle kysymykselle:
+  - p-arvo (oikein vastanneiden osuus)
+  - point-biserial -erottelukyky käyttäjän muuhun osaamiseen nähden
+  - vastausajan mediaani
+  - vastausvaihtoehtojen valintafrekvenssit (kun yritykseen on tallennettu valinta)
+"""
+import json
+import logging
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def compute_item_statistics(user_ids, question_ids, correct, time_taken, selected_option):
+    """
+    Laskee osiotunnusluvut yritystaulukoista.
+
+    Kaikki parametrit ovat samanpituisia 1D-taulukoita (yksi alkio per yritys).
+    selected_option on -1, jos valintaa ei ole tallennettu.
+    Palauttaa sanakirjan taulukoita kysymys-ID:n mukaan järjestettynä.
+    """
+    q_ids, q_idx = np.unique(question_ids, return_inverse=True)
+    _, u_idx = np.unique(user_ids, return_inverse=True)
+    n_questions = len(q_ids)
+    x = correct.astype(np.float64)
+
+    # Käyttäjän "muu osaaminen": onnistumisprosentti ilman tätä yritystä (korjattu item-total)
+    user_n = np.bincount(u_idx).astype(np.float64)
+    user_sum = np.bincount(u_idx, weights=x)
+    rest_n = user_n[u_idx] - 1
+    valid = rest_n > 0
+    y = np.divide(user_sum[u_idx] - x, rest_n, out=np.zeros_like(x), where=valid)
+
+    attempts = np.bincount(q_idx, minlength=n_questions)
+    p_value = np.bincount(q_idx, weights=x, minlength=n_questions) / attempts
+
+    # Point-biserial = Pearsonin korrelaatio (x binäärinen), lasketaan summista per kysymys
+    vq = q_idx[valid]
+    n = np.bincount(vq, minlength=n_questions).astype(np.float64)
+    sx = np.bincount(vq, weights=x[valid], minlength=n_questions)
+    sy = np.bincount(vq, weights=y[valid], minlength=n_questions)
+    syy = np.bincount(vq, weights=y[valid] ** 2, minlength=n_questions)
+    sxy = np.bincount(vq, weights=x[valid] * y[valid], minlength=n_questions)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = n * sxy - sx * sy
+        var_x = n * sx - sx ** 2
+        var_y = n * syy - sy ** 2
+        discrimination = cov / np.sqrt(var_x * var_y)
+    discrimination[~np.isfinite(discrimination)] = np.nan
+
+    # Mediaanivastausaika: lajittelu (kysymys, aika) ja ryhmän keskialkiot
+    times = np.where(np.isfinite(time_taken), time_taken, np.inf)
+    order = np.lexsort((times, q_idx))
+    sorted_times = times[order]
+    timed = np.bincount(q_idx, weights=np.isfinite(time_taken), minlength=n_questions).astype(np.int64)
+    starts = np.concatenate(([0], np.cumsum(attempts)[:-1]))
+    has_time = timed > 0
+    lo = starts + np.maximum(timed - 1, 0) // 2
+    hi = starts + timed // 2
+    hi = np.where(has_time, hi, lo)
+    median_time = np.where(has_time, (sorted_times[lo] + sorted_times[hi]) / 2, np.nan)
+
+    # Vaihtoehtojen valintafrekvenssit
+    chosen = selected_option >= 0
+    n_options = int(selected_option[chosen].max()) + 1 if chosen.any() else 0
+    if n_options:
+        flat = q_idx[chosen] * n_options + selected_option[chosen].astype(np.int64)
+        option_counts = np.bincount(flat, minlength=n_questions * n_options).reshape(n_questions, n_options)
+    else:
+        option_counts = np.zeros((n_questions, 0), dtype=np.int64)
+
+    return {
+        'question_id': q_ids,
+        'attempts': attempts,
+        'p_value': p_value,
+        'discrimination': discrimination,
+        'median_time': median_time,
+        'option_counts': option_counts,
+    }
+
+
+class ItemAnalysisManager:
+    """Ajaa osioanalyysin ja tallentaa tulokset question_item_stats-tauluun."""
+
+    CHUNK_SIZE = 50000
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def load_attempts(self):
+        """Lataa question_attempts-taulun NumPy-taulukoihin paloittain."""
+        query = "SELECT user_id, question_id, correct, time_taken, selected_option FROM question_attempts"
+        chunks = []
+        for rows in self.db_manager._fetch_in_chunks(query, chunk_size=self.CHUNK_SIZE):
+            chunks.append(np.array(
+                [(r[0], r[1], 1 if r[2] else 0, r[3], -1 if r[4] is None else r[4]) for r in rows],
+                dtype=np.float64
+            ))
+        if not chunks:
+            return None
+        data = np.concatenate(chunks)
+        return {
+            'user_ids': data[:, 0].astype(np.int64),
+            'question_ids': data[:, 1].astype(np.int64),
+            'correct': data[:, 2].astype(np.int8),
+            'time_taken': data[:, 3],
+            'selected_option': data[:, 4].astype(np.int64),
+        }
+
+    def run(self):
+        """Laskee tunnusluvut kaikille kysymyksille ja korvaa aiemmat tulokset."""
+        started = datetime.now()
+        attempts = self.load_attempts()
+        if attempts is None:
+            return True, {'questions': 0, 'attempts': 0, 'seconds': 0.0}
+
+        stats = compute_item_statistics(**attempts)
+        computed_at = datetime.now()
+
+        def _num(value):
+            return None if np.isnan(value) else round(float(value), 4)
+
+        rows = []
+        for i, question_id in enumerate(stats['question_id']):
+            rows.append((
+                int(question_id),
+                int(stats['attempts'][i]),
+                _num(stats['p_value'][i]),
+                _num(stats['discrimination'][i]),
+                _num(stats['median_time'][i]),
+                json.dumps(stats['option_counts'][i].tolist()),
+                computed_at,
+            ))
+
+        success, error = self.db_manager.replace_question_item_stats(rows)
+        if not success:
+            return False, error
+
+        seconds = (datetime.now() - started).total_seconds()
+        logger.info(f"Osioanalyysi valmis: {len(rows)} kysymystä, {len(attempts['correct'])} yritystä, {seconds:.2f} s")
+        return True, {'questions': len(rows), 'attempts': int(len(attempts['correct'])), 'seconds': round(seconds, 2)}
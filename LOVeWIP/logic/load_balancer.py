@@ -0,0 +1,217 @@
+"""
+Load Balancer - Kertausten erääntymisten tasaus
+
+SM-2 antaa kokonaislukuvälejä, joten yhdessä opiskelevan ryhmän kortit
+erääntyvät samoina päivinä ja kertausnäkymään tulee kuormapiikkejä. Tämä
+moduuli siirtää uuden erääntymispäivän sallitun ikkunan sisällä:
+
+  - fuzz: deterministinen satunnaissiirto (hash käyttäjästä, kysymyksestä
+    ja päivästä), joten sama vastaus antaa aina saman päivän
+  - user / global: ikkunasta valitaan päivä, jolla käyttäjällä (tai koko
+    palvelussa) on vähiten erääntyviä; tasatilanteessa lähimpänä fuzz-päivää
+
+Päiväkohtainen kuormahistogrammi ladataan kerran päivässä (user_id, due_date)
+-indeksistä ja päivitetään sen jälkeen inkrementaalisesti jokaisen
+kertauksen yhteydessä. Kortin interval-sarake pysyy puhtaana SM-2-välinä,
+siirto näkyy vain due_date-sarakkeessa.
+
+Tila valitaan ympäristömuuttujalla SR_LOAD_BALANCE (off, fuzz, user, global).
+
+Käyttö (vertailuajo):
+    python -m logic.load_balancer [--users 200] [--cards 60] [--days 90]
+"""
+import argparse
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+
+from logic.date_utils import to_date
+
+logger = logging.getLogger(__name__)
+
+SR_LOAD_BALANCE = os.environ.get('SR_LOAD_BALANCE', 'off').lower()
+LOAD_BALANCE_MODES = ('off', 'fuzz', 'user', 'global')
+
+# (alku, loppu, kerroin): ikkunan puolileveys kasvaa välin pituuden mukana
+FUZZ_RANGES = ((2.5, 7.0, 0.15), (7.0, 20.0, 0.1), (20.0, float('inf'), 0.05))
+MAX_CACHED_USERS = 10000
+GLOBAL_SCOPE = 0
+
+
+def fuzz_window(interval):
+    """Palauttaa sallitun välin (min, max) päivinä. Alle 2.5 päivän välejä ei siirretä."""
+    if interval < FUZZ_RANGES[0][0]:
+        return interval, interval
+    delta = 1.0 + sum(factor * max(min(interval, end) - start, 0.0) for start, end, factor in FUZZ_RANGES)
+    low = max(2, int(round(interval - delta)))
+    return low, max(low, int(round(interval + delta)))
+
+
+def _unit_hash(*parts):
+    """Prosessista riippumaton tasajakautunut luku väliltä [0, 1)."""
+    digest = hashlib.sha1(':'.join(str(p) for p in parts).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+
+def fuzzed_interval(interval, user_id, question_id, review_date):
+    """Deterministinen siirto fuzz-ikkunan sisällä."""
+    low, high = fuzz_window(interval)
+    return low + int(_unit_hash(user_id, question_id, review_date.toordinal()) * (high - low + 1))
+
+
+def balanced_interval(interval, load_of, user_id, question_id, review_date):
+    """
+    Valitsee ikkunasta vähiten kuormitetun päivän.
+    load_of(offset) palauttaa erääntyvien määrän päivälle review_date + offset.
+    """
+    low, high = fuzz_window(interval)
+    if low == high:
+        return low
+    target = fuzzed_interval(interval, user_id, question_id, review_date)
+    return min(range(low, high + 1), key=lambda offset: (load_of(offset), abs(offset - target)))
+
+
+class DayLoadHistogram:
+    """Erääntyvien korttien määrä päivittäin (avaimena päivän järjestysluku)."""
+
+    def __init__(self, counts=None, loaded_on=None):
+        self.counts = dict(counts or {})
+        self.loaded_on = loaded_on
+
+    def load(self, day):
+        return self.counts.get(day, 0)
+
+    def move(self, old_day, new_day):
+        """Siirtää yhden kortin päivältä toiselle (old_day=None: uusi kortti)."""
+        if old_day is not None and self.counts.get(old_day, 0) > 0:
+            self.counts[old_day] -= 1
+        self.counts[new_day] = self.counts.get(new_day, 0) + 1
+
+    def series(self, start, days):
+        return np.array([self.counts.get(start + offset, 0) for offset in range(days)])
+
+
+def peak_to_mean(loads):
+    """Huippupäivän kuorma suhteessa keskiarvoon (1.0 = täysin tasainen)."""
+    loads = np.asarray(loads, dtype=np.float64)
+    return float(loads.max() / loads.mean()) if len(loads) and loads.mean() > 0 else 0.0
+
+
+class DueLoadBalancer:
+    """Valitsee uuden erääntymispäivän ja pitää kuormahistogrammit ajan tasalla."""
+
+    def __init__(self, db_manager, mode=None):
+        self.db_manager = db_manager
+        self.mode = (mode or SR_LOAD_BALANCE) if (mode or SR_LOAD_BALANCE) in LOAD_BALANCE_MODES else 'off'
+        self._histograms = OrderedDict()
+
+    def _load_histogram(self, scope, today):
+        """Lukee tulevien päivien erääntymiset indeksistä (scope = käyttäjä tai GLOBAL_SCOPE)."""
+        user_filter = "" if scope == GLOBAL_SCOPE else " AND user_id = ?"
+        params = (today.isoformat(),) + (() if scope == GLOBAL_SCOPE else (scope,))
+        rows = self.db_manager._execute(f"""
+            SELECT due_date, COUNT(*) as count FROM user_question_progress
+            WHERE due_date > ?{user_filter}
+            GROUP BY due_date
+        """, params, fetch='all') or []
+        return DayLoadHistogram({to_date(row['due_date']).toordinal(): row['count'] for row in rows}, today)
+
+    def histogram(self, user_id, today=None):
+        """Palauttaa käyttäjän (tai globaalin) histogrammin; edellisen päivän histogrammi ladataan uudelleen."""
+        today = today or date.today()
+        scope = GLOBAL_SCOPE if self.mode == 'global' else user_id
+        histogram = self._histograms.get(scope)
+        if histogram is None or histogram.loaded_on != today:
+            histogram = self._load_histogram(scope, today)
+            self._histograms[scope] = histogram
+            if len(self._histograms) > MAX_CACHED_USERS:
+                self._histograms.popitem(last=False)
+        self._histograms.move_to_end(scope)
+        return histogram
+
+    def schedule(self, user_id, question_id, interval, previous_due=None, today=None):
+        """
+        Palauttaa päivien määrän tästä päivästä uuteen erääntymiseen.
+        previous_due: kortin edellinen erääntymispäivä, joka poistetaan histogrammista.
+        """
+        today = today or date.today()
+        if self.mode == 'off':
+            return interval
+        if self.mode == 'fuzz':
+            return fuzzed_interval(interval, user_id, question_id, today)
+
+        try:
+            histogram = self.histogram(user_id, today)
+            base = today.toordinal()
+            offset = balanced_interval(interval, lambda o: histogram.load(base + o), user_id, question_id, today)
+            previous = to_date(previous_due)
+            histogram.move(previous.toordinal() if previous and previous > today else None, base + offset)
+            return offset
+        except Exception as e:
+            logger.error(f"Virhe kuormantasauksessa: {e}")
+            return fuzzed_interval(interval, user_id, question_id, today)
+
+
+def benchmark(users=200, cards=60, days=90, accuracy=0.85, seed=0):
+    """
+    Simuloi yhdessä opiskelevan ryhmän kertauksia jokaisella tilalla ja
+    vertaa päivittäisen kuorman huippu/keskiarvo-suhdetta. Ryhmä opettelee
+    samat kortit samana päivänä (päivä 0), ja kuormaa mitataan sen jälkeen.
+    """
+    from logic.spaced_repetition import SM2_INITIAL_EASE, sm2_next_review
+
+    start = date.today()
+    results = {}
+    for mode in LOAD_BALANCE_MODES:
+        rng = np.random.default_rng(seed)
+        n = users * cards
+        user_ids = np.repeat(np.arange(1, users + 1), cards)
+        question_ids = np.tile(np.arange(1, cards + 1), users)
+        times_shown = np.zeros(n, dtype=np.int64)
+        interval = np.ones(n, dtype=np.int64)
+        ease = np.full(n, SM2_INITIAL_EASE)
+        due = np.zeros(n, dtype=np.int64)
+        histogram = DayLoadHistogram()
+        daily = np.zeros(days, dtype=np.int64)
+
+        for day in range(days):
+            idx = np.flatnonzero(due == day)
+            daily[day] = len(idx)
+            if not len(idx):
+                continue
+            correct = rng.random(len(idx)) < accuracy
+            new_interval, ease[idx] = sm2_next_review(times_shown[idx], interval[idx], ease[idx], np.where(correct, 5, 2))
+            times_shown[idx] += 1
+            interval[idx] = new_interval
+            review_date = start + timedelta(days=day)
+            for i, card in enumerate(idx):
+                ivl, u, q = int(new_interval[i]), int(user_ids[card]), int(question_ids[card])
+                if mode == 'off':
+                    offset = ivl
+                elif mode == 'fuzz':
+                    offset = fuzzed_interval(ivl, u, q, review_date)
+                else:
+                    scope = u if mode == 'user' else GLOBAL_SCOPE
+                    offset = balanced_interval(ivl, lambda o: histogram.load((scope, day + o)), u, q, review_date)
+                    histogram.move(None, (scope, day + offset))
+                due[card] = day + offset
+
+        steady = daily[1:]
+        results[mode] = {'peak': int(steady.max()), 'mean': round(float(steady.mean()), 1), 'peak_to_mean': round(peak_to_mean(steady), 2)}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Vertaa erääntymisten kuormantasauksen tiloja.")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--cards', type=int, default=60)
+    parser.add_argument('--days', type=int, default=90)
+    args = parser.parse_args()
+
+    print("Tila     huippu  keskiarvo  huippu/keskiarvo")
+    for mode, row in benchmark(args.users, args.cards, args.days).items():
+        print(f"{mode:<7} {row['peak']:>7} {row['mean']:>10} {row['peak_to_mean']:>17}")
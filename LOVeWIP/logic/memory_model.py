@@ -0,0 +1,388 @@
+"""
+Memory Model - FSRS-tyylinen muistimalli (stabiilius / palautettavuus)
+
+Jokaisella kortilla on muistin stabiilius S (päivinä) ja vaikeus D (1-10).
+Palautettavuus ajan t kuluttua on R(t, S) = (1 + F * t / S) ^ DECAY, jolloin
+R(S, S) = 0.9. Kertauksen jälkeen S ja D päivitetään arvosanan (1-4) mukaan.
+Kaavat ja oletuspainot noudattavat FSRS-4.5:tä (17 painoa).
+
+Käyttäjäkohtaiset painot sovitetaan review_log-taulun historiasta:
+tappiofunktio on ennustetun palautettavuuden ja toteutuneen vastauksen
+ristientropia, ja sitä minimoidaan Adamilla. Gradientti lasketaan
+keskeisdifferensseinä siten, että kaikki häiritetyt painovektorit ajetaan
+yhtenä NumPy-eränä. Kaikkien käyttäjien sovitus ajetaan prosessipoolissa.
+
+Käyttö:
+    python -m logic.memory_model backfill    # täytä review_log vastaushistoriasta
+    python -m logic.memory_model fit         # sovita kaikkien käyttäjien painot
+    python -m logic.memory_model benchmark   # vertaa ennusteita pidätettyihin kertauksiin
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DECAY = -0.5
+FACTOR = 19 / 81
+DESIRED_RETENTION = 0.9
+MAX_INTERVAL = 365
+
+# Arvosanat: 1 = unohti, 2 = vaikea, 3 = hyvä, 4 = helppo
+RATING_AGAIN, RATING_HARD, RATING_GOOD, RATING_EASY = 1, 2, 3, 4
+FAST_ANSWER_SECONDS = 10
+SLOW_ANSWER_SECONDS = 60
+
+DEFAULT_WEIGHTS = np.array([
+    0.4872, 1.4003, 3.7145, 13.8206,  # alkustabiilius arvosanoittain
+    5.1618, 1.2298,                   # alkuvaikeus
+    0.8975, 0.031,                    # vaikeuden muutos ja paluu keskiarvoon
+    1.6474, 0.1367, 1.0461,           # stabiilius onnistuneen kertauksen jälkeen
+    2.1072, 0.0793, 0.3246, 1.587,    # stabiilius unohduksen jälkeen
+    0.2272, 2.8755,                   # vaikea-sakko ja helppo-bonus
+])
+WEIGHT_LOWER = np.array([0.1, 0.1, 0.1, 0.1, 1.0, 0.1, 0.1, 0.0, 0.0, 0.0, 0.01, 0.1, 0.01, 0.01, 0.01, 0.0, 1.0])
+WEIGHT_UPPER = np.array([100, 100, 100, 100, 10.0, 4.0, 4.0, 0.75, 4.5, 0.8, 3.5, 5.0, 0.5, 2.5, 5.0, 1.0, 6.0])
+
+MIN_REVIEWS_TO_FIT = 50
+PRIOR_REVIEWS = 200  # Vähäisellä historialla painot pysyvät lähellä oletuksia
+# Painot sovitetaan erillisessä prosessissa (CLI), joten web-prosessin välimuisti vanhenee
+WEIGHTS_CACHE_SECONDS = 10 * 60
+WEIGHTS_CACHE_MAX_USERS = 10000
+
+
+def rating_from_answer(is_correct, time_taken):
+    """Muuntaa vastauksen (oikein/väärin + vastausaika) arvosanaksi 1-4."""
+    if not is_correct:
+        return RATING_AGAIN
+    if time_taken and time_taken > SLOW_ANSWER_SECONDS:
+        return RATING_HARD
+    if time_taken and time_taken < FAST_ANSWER_SECONDS:
+        return RATING_EASY
+    return RATING_GOOD
+
+
+def retrievability(elapsed_days, stability):
+    return (1 + FACTOR * elapsed_days / stability) ** DECAY
+
+
+def next_interval(stability, retention=DESIRED_RETENTION):
+    """Kertausväli päivinä, jolla palautettavuus laskee tavoitetasolle."""
+    days = stability / FACTOR * (retention ** (1 / DECAY) - 1)
+    return np.clip(np.round(days), 1, MAX_INTERVAL).astype(np.int64)
+
+
+def initial_state(w, rating):
+    """
+    Ensimmäisen kertauksen tila. w: painot (P, 17), rating: (n,).
+    Palauttaa S ja D muodossa (P, n).
+    """
+    stability = w[:, rating - 1]
+    difficulty = np.clip(w[:, 4:5] - (rating - 3) * w[:, 5:6], 1, 10)
+    return stability, difficulty
+
+
+def update_state(w, stability, difficulty, rating, elapsed_days):
+    """
+    Päivittää tilan kertauksen jälkeen. Palauttaa (S, D, R), jossa R on
+    kertaushetken ennustettu palautettavuus.
+    """
+    R = retrievability(elapsed_days, stability)
+    col = lambda i: w[:, i:i + 1]
+
+    new_difficulty = difficulty - col(6) * (rating - 3)
+    new_difficulty = np.clip(col(7) * col(4) + (1 - col(7)) * new_difficulty, 1, 10)
+
+    hard = np.where(rating == RATING_HARD, col(15), 1.0)
+    easy = np.where(rating == RATING_EASY, col(16), 1.0)
+    recall_stability = stability * (
+        1 + np.exp(col(8)) * (11 - difficulty) * stability ** -col(9)
+        * (np.exp(col(10) * (1 - R)) - 1) * hard * easy
+    )
+    forget_stability = np.minimum(
+        stability,
+        col(11) * difficulty ** -col(12) * ((stability + 1) ** col(13) - 1) * np.exp(col(14) * (1 - R)),
+    )
+    new_stability = np.where(rating == RATING_AGAIN, forget_stability, recall_stability)
+    return np.maximum(new_stability, 0.01), new_difficulty, R
+
+
+def build_review_matrix(card_ids, ratings, elapsed_days):
+    """
+    Pakkaa kortin sisällä aikajärjestetyt kertaukset matriisiksi (kortti x kertausnumero).
+    Palauttaa sanakirjan, jossa 'scored' = ennustettavien kertausten alkuperäiset indeksit
+    siinä järjestyksessä, jossa predict_recall ne palauttaa.
+    """
+    n_cards = int(card_ids.max()) + 1 if len(card_ids) else 0
+    lengths = np.bincount(card_ids, minlength=n_cards)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    position = np.arange(len(card_ids)) - starts[card_ids]
+    width = int(lengths.max()) if n_cards else 0
+
+    rating_matrix = np.zeros((n_cards, width), dtype=np.int64)
+    elapsed_matrix = np.zeros((n_cards, width))
+    index_matrix = np.full((n_cards, width), -1, dtype=np.int64)
+    rating_matrix[card_ids, position] = ratings
+    elapsed_matrix[card_ids, position] = elapsed_days
+    index_matrix[card_ids, position] = np.arange(len(card_ids))
+
+    scored = [index_matrix[lengths > step, step] for step in range(1, width)]
+    return {
+        'lengths': lengths,
+        'ratings': rating_matrix,
+        'elapsed': elapsed_matrix,
+        'scored': np.concatenate(scored) if scored else np.zeros(0, dtype=np.int64),
+    }
+
+
+def predict_recall(w, matrix):
+    """Ennustettu palautettavuus jokaiselle ei-ensimmäiselle kertaukselle, muoto (P, n_scored)."""
+    lengths = matrix['lengths']
+    stability, difficulty = initial_state(w, matrix['ratings'][:, 0])
+    predictions = []
+    for step in range(1, matrix['ratings'].shape[1]):
+        active = lengths > step
+        s, d, r = update_state(
+            w, stability[:, active], difficulty[:, active],
+            matrix['ratings'][active, step], matrix['elapsed'][active, step],
+        )
+        stability[:, active] = s
+        difficulty[:, active] = d
+        predictions.append(r)
+    if not predictions:
+        return np.zeros((len(w), 0))
+    return np.concatenate(predictions, axis=1)
+
+
+def log_loss(predictions, outcomes, mask=None):
+    p = np.clip(predictions, 1e-4, 1 - 1e-4)
+    losses = -(outcomes * np.log(p) + (1 - outcomes) * np.log(1 - p))
+    if mask is not None:
+        losses = losses[..., mask]
+    return losses.mean(axis=-1) if losses.shape[-1] else np.zeros(losses.shape[:-1])
+
+
+def fit_weights(matrix, outcomes, mask=None, iterations=120, learning_rate=0.03, step=1e-3):
+    """
+    Sovittaa painot minimoimalla ristientropian Adamilla. Painot optimoidaan
+    normalisoidussa avaruudessa [0, 1], ja kaikki 2 * 17 häiritettyä
+    painovektoria lasketaan samassa erässä.
+    """
+    span = WEIGHT_UPPER - WEIGHT_LOWER
+    z = (DEFAULT_WEIGHTS - WEIGHT_LOWER) / span
+    z_default = z.copy()
+    n = int(mask.sum()) if mask is not None else len(outcomes)
+    prior = PRIOR_REVIEWS / (PRIOR_REVIEWS + n)
+    k = len(z)
+    offsets = np.vstack([np.zeros(k), np.eye(k) * step, -np.eye(k) * step])
+
+    m = np.zeros(k)
+    v = np.zeros(k)
+    for t in range(1, iterations + 1):
+        batch = np.clip(z + offsets, 0, 1)
+        losses = log_loss(predict_recall(WEIGHT_LOWER + batch * span, matrix), outcomes, mask)
+        losses = losses + prior * ((batch - z_default) ** 2).sum(axis=1)
+        grad = (losses[1:k + 1] - losses[k + 1:]) / (2 * step)
+        m = 0.9 * m + 0.1 * grad
+        v = 0.999 * v + 0.001 * grad ** 2
+        z = np.clip(z - learning_rate * (m / (1 - 0.9 ** t)) / (np.sqrt(v / (1 - 0.999 ** t)) + 1e-8), 0, 1)
+
+    return WEIGHT_LOWER + z * span
+
+
+def prepare_user_reviews(question_ids, ratings, reviewed_days):
+    """Korttinumerot ja edellisestä kertauksesta kuluneet päivät (kertaukset järjestettynä korteittain)."""
+    boundaries = np.diff(question_ids) != 0
+    card_ids = np.concatenate(([0], np.cumsum(boundaries)))
+    elapsed = np.concatenate(([0.0], np.diff(reviewed_days)))
+    elapsed[np.concatenate(([True], boundaries))] = 0.0
+    return card_ids, np.maximum(elapsed, 0.0)
+
+
+def fit_user(task):
+    """Prosessipoolin työ: sovittaa yhden käyttäjän painot. Palauttaa tulosrivin."""
+    user_id, question_ids, ratings, reviewed_days = task
+    card_ids, elapsed = prepare_user_reviews(question_ids, ratings, reviewed_days)
+    matrix = build_review_matrix(card_ids, ratings, elapsed)
+    outcomes = (ratings[matrix['scored']] > RATING_AGAIN).astype(np.float64)
+    weights = fit_weights(matrix, outcomes)
+    loss = float(log_loss(predict_recall(weights[None, :], matrix), outcomes)[0])
+    return user_id, weights.tolist(), loss, len(ratings)
+
+
+def benchmark_user(task, holdout=0.2):
+    """
+    Sovittaa painot kertauksille ennen aikarajaa ja arvioi ennusteet rajan jälkeisille.
+    Palauttaa pidätettyjen kertausten ennusteet eri malleilla sekä toteumat.
+    """
+    user_id, question_ids, ratings, reviewed_days = task
+    card_ids, elapsed = prepare_user_reviews(question_ids, ratings, reviewed_days)
+    matrix = build_review_matrix(card_ids, ratings, elapsed)
+    scored = matrix['scored']
+    outcomes = (ratings[scored] > RATING_AGAIN).astype(np.float64)
+    cutoff = np.quantile(reviewed_days, 1 - holdout)
+    test = reviewed_days[scored] >= cutoff
+    if not test.any() or test.all():
+        return None
+
+    fitted = fit_weights(matrix, outcomes, mask=~test)
+    return {
+        'outcomes': outcomes[test],
+        'fitted': predict_recall(fitted[None, :], matrix)[0, test],
+        'default': predict_recall(DEFAULT_WEIGHTS[None, :], matrix)[0, test],
+        'baseline': np.full(int(test.sum()), outcomes[~test].mean()),
+    }
+
+
+class MemoryModelManager:
+    """Muistimallin tila, kertausloki ja käyttäjäkohtaisten painojen sovitus."""
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self._weights_cache = OrderedDict()  # user_id -> (haettu, painot), LRU
+
+    def get_weights(self, user_id):
+        """
+        Käyttäjän sovitetut painot tai oletuspainot. Välimuistista luetaan enintään
+        WEIGHTS_CACHE_SECONDS vanhoja, joten CLI:n sovittamat painot tulevat käyttöön
+        ilman uudelleenkäynnistystä. Välimuistissa on enintään WEIGHTS_CACHE_MAX_USERS käyttäjää.
+        """
+        now = time.monotonic()
+        cached = self._weights_cache.get(user_id)
+        if cached is not None and now - cached[0] <= WEIGHTS_CACHE_SECONDS:
+            self._weights_cache.move_to_end(user_id)
+            return cached[1]
+        params = self.db_manager.get_memory_model_params(user_id)
+        weights = np.array(params['weights']) if params else DEFAULT_WEIGHTS
+        self._weights_cache[user_id] = (now, weights)
+        self._weights_cache.move_to_end(user_id)
+        while len(self._weights_cache) > WEIGHTS_CACHE_MAX_USERS:
+            self._weights_cache.popitem(last=False)
+        return weights
+
+    def next_state(self, user_id, question_id, last_shown, rating):
+        """
+        Laskee kortin uuden stabiiliuden ja vaikeuden kertauksen jälkeen.
+        last_shown on edellinen näyttökerta (ennen tätä vastausta) tai None.
+        """
+        w = self.get_weights(user_id)[None, :]
+        rating_arr = np.array([rating])
+        state = self.db_manager.get_memory_state(user_id, question_id)
+        if last_shown is None or not state:
+            stability, difficulty = initial_state(w, rating_arr)
+        else:
+            # Ennen muistimallia kertautuneille korteille stabiiliudeksi SM-2-väli (R = 0.9 välin lopussa)
+            previous_stability = state.get('memory_stability') or float(state.get('interval') or 1)
+            previous_difficulty = state.get('memory_difficulty') or float(w[0, 4])
+            previous = last_shown if isinstance(last_shown, datetime) else datetime.fromisoformat(str(last_shown)[:19])
+            elapsed = max((datetime.now() - previous.replace(tzinfo=None)).total_seconds() / 86400, 0.0)
+            stability, difficulty, _ = update_state(
+                w, np.array([[previous_stability]]), np.array([[previous_difficulty]]),
+                rating_arr, np.array([elapsed]),
+            )
+        return float(stability[0, 0]), float(difficulty[0, 0])
+
+    def log_review(self, user_id, question_id, rating, is_correct, time_taken, scheduler):
+        success, error = self.db_manager.append_review_log(user_id, question_id, rating, is_correct, time_taken, scheduler)
+        if not success:
+            logger.error(f"Virhe kertauslokin kirjoituksessa: {error}")
+
+    def _load_user_tasks(self, min_reviews=MIN_REVIEWS_TO_FIT):
+        """Lataa kertauslokin käyttäjäkohtaisiksi taulukoiksi (järjestys: kortti, aika)."""
+        query = """
+            SELECT user_id, question_id, rating, reviewed_at FROM review_log
+            ORDER BY user_id, question_id, reviewed_at, id
+        """
+        chunks = []
+        for rows in self.db_manager._fetch_in_chunks(query, chunk_size=50000):
+            user_ids = np.array([r[0] for r in rows], dtype=np.int64)
+            question_ids = np.array([r[1] for r in rows], dtype=np.int64)
+            ratings = np.array([r[2] for r in rows], dtype=np.int64)
+            stamps = np.array([str(r[3])[:19].replace(' ', 'T') for r in rows], dtype='datetime64[s]')
+            chunks.append((user_ids, question_ids, ratings, stamps.astype(np.int64) / 86400.0))
+        if not chunks:
+            return []
+
+        user_ids, question_ids, ratings, days = (np.concatenate(c) for c in zip(*chunks))
+        tasks = []
+        bounds = np.flatnonzero(np.diff(user_ids)) + 1
+        for start, end in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(user_ids)]))):
+            if end - start >= min_reviews:
+                tasks.append((int(user_ids[start]), question_ids[start:end], ratings[start:end], days[start:end]))
+        return tasks
+
+    def fit_all(self, processes=None):
+        """Sovittaa painot kaikille käyttäjille, joilla on riittävästi historiaa."""
+        started = datetime.now()
+        try:
+            tasks = self._load_user_tasks()
+        except Exception as e:
+            logger.error(f"Virhe kertauslokin latauksessa: {e}")
+            return False, str(e)
+
+        if processes == 1 or len(tasks) <= 1:
+            results = [fit_user(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                results = list(pool.map(fit_user, tasks))
+
+        fitted_at = datetime.now()
+        rows = [(user_id, json.dumps(weights), loss, reviews, fitted_at) for user_id, weights, loss, reviews in results]
+        success, error = self.db_manager.upsert_memory_model_params(rows)
+        if not success:
+            return False, error
+        self._weights_cache.clear()
+
+        seconds = (datetime.now() - started).total_seconds()
+        logger.info(f"Muistimallin painot sovitettu: {len(rows)} käyttäjää, {seconds:.1f} s")
+        return True, {'users': len(rows), 'seconds': round(seconds, 1)}
+
+    def benchmark(self, holdout=0.2, processes=None):
+        """
+        Vertaa ennustettua palautettavuutta pidätettyihin (viimeisimpiin) kertauksiin:
+        käyttäjäkohtaisesti sovitetut painot, oletuspainot ja vakioennuste
+        (käyttäjän aiempi onnistumisprosentti).
+        """
+        tasks = self._load_user_tasks()
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = [r for r in pool.map(benchmark_user, tasks, [holdout] * len(tasks)) if r is not None]
+        if not results:
+            return {}
+
+        outcomes = np.concatenate([r['outcomes'] for r in results])
+        report = {'users': len(results), 'reviews': int(len(outcomes))}
+        for model in ('fitted', 'default', 'baseline'):
+            predictions = np.concatenate([r[model] for r in results])
+            report[model] = {
+                'log_loss': round(float(log_loss(predictions, outcomes)), 4),
+                'rmse': round(float(np.sqrt(np.mean((predictions - outcomes) ** 2))), 4),
+            }
+        return report
+
+
+if __name__ == '__main__':
+    from data_access.database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="FSRS-tyylisen muistimallin työkalut.")
+    parser.add_argument('command', choices=['backfill', 'fit', 'benchmark'])
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--holdout', type=float, default=0.2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = DatabaseManager()
+    manager = MemoryModelManager(db)
+    if args.command == 'backfill':
+        print(db.backfill_review_log(SLOW_ANSWER_SECONDS, FAST_ANSWER_SECONDS))
+    elif args.command == 'fit':
+        print(manager.fit_all(args.processes))
+    else:
+        report = manager.benchmark(args.holdout, args.processes)
+        print(json.dumps(report, indent=2))
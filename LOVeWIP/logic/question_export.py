@@ -0,0 +1,59 @@
+"""
+Question Export - Kysymyspankin virtaava JSON-vienti
+
+Kysymyksiä ei ladata kerralla muistiin eikä koko tiedostoa muodosteta yhdeksi
+merkkijonoksi: rivit luetaan DatabaseManager._fetch_in_chunks-generaattorilla
+(PostgreSQL:ssä nimetty palvelinpuolen kursori) EXPORT_CHUNK_SIZE rivin erissä,
+ja jokainen erä kirjoitetaan vastaukseen heti. Avaava '[' lähtee ennen
+ensimmäistä kyselyä, joten lataus alkaa selaimessa välittömästi.
+
+Muodot:
+  - json: sama JSON-lista (indent=2) kuin aiemmin json.dumps(lista, indent=2)
+  - ndjson: yksi kysymys per rivi; luetaan takaisin bulk-latauksella (.ndjson)
+"""
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 500
+EXPORT_FORMATS = ('json', 'ndjson')
+
+
+def question_record(row, fields):
+    """Kannan rivi vientimuotoon: options JSON-listaksi, created_at ISO-muotoon."""
+    record = {}
+    for field in fields:
+        value = row[field]
+        if field == 'options':
+            value = json.loads(value)
+        elif field == 'created_at' and hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        record[field] = value
+    return record
+
+
+def export_questions(db_manager, fields, fmt='json'):
+    """
+    Generaattori, joka tuottaa viennin tekstipaloina (yksi pala per luettu erä).
+    fields: vietävät sarakkeet tulostusjärjestyksessä.
+    """
+    query = f"SELECT {', '.join(fields)} FROM questions ORDER BY category, id"
+    count = 0
+    if fmt == 'json':
+        yield '['
+    for rows in db_manager._fetch_in_chunks(query, chunk_size=EXPORT_CHUNK_SIZE):
+        parts = []
+        for row in rows:
+            record = question_record(row, fields)
+            if fmt == 'ndjson':
+                parts.append(json.dumps(record, ensure_ascii=False) + '\n')
+            else:
+                # Sama muotoilu kuin json.dumps(lista, indent=2): alkiot sisennetään kahdella välilyönnillä
+                body = json.dumps(record, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+                parts.append(('\n  ' if count == 0 else ',\n  ') + body)
+            count += 1
+        yield ''.join(parts)
+    if fmt == 'json':
+        yield '\n]' if count else ']'
+    logger.info(f"Kysymysvienti ({fmt}): {count} kysymystä")
@@ -0,0 +1,51 @@
+"""
+Question Fingerprint - Kysymystekstin normalisointi ja sormenjälki
+
+Normalisointi on Unicode-tietoinen: NFKD-hajotus, diakriittisten merkkien
+poisto (ä -> a, ö -> o, å -> a, é -> e), casefold, välimerkit välilyönneiksi
+ja välilyöntien yhdistäminen. Näin "Mikä on annos?" ja "mika  on ANNOS"
+tuottavat saman sormenjäljen.
+
+Sormenjälki (SHA-1 normalisoidusta tekstistä) tallennetaan questions.fingerprint-
+sarakkeeseen, jolla on yksilöllinen indeksi. FingerprintSet pitää samat
+sormenjäljet muistissa, joten tarkistus ennen lisäystä on O(1). Tietokannan
+yksilöllinen indeksi on lopullinen varmistus, jos muisti on vanhentunut.
+"""
+import hashlib
+import re
+import unicodedata
+
+
+def normalize_question(text):
+    """Normalisoi kysymystekstin vertailua varten."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    without_marks = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    folded = without_marks.casefold()
+    return ' '.join(re.sub(r'[\W_]+', ' ', folded).split())
+
+
+def question_fingerprint(text):
+    """Normalisoidun tekstin SHA-1-tiiviste (40 heksamerkkiä)."""
+    return hashlib.sha1(normalize_question(text).encode('utf-8')).hexdigest()
+
+
+class FingerprintSet:
+    """Muistissa pidettävä sormenjälki -> kysymys-ID -hakemisto."""
+
+    def __init__(self, rows=()):
+        self._ids = {fingerprint: question_id for question_id, fingerprint in rows if fingerprint}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self._ids
+
+    def get(self, fingerprint):
+        return self._ids.get(fingerprint)
+
+    def add(self, fingerprint, question_id=None):
+        self._ids[fingerprint] = question_id
+
+    def discard(self, fingerprint):
+        self._ids.pop(fingerprint, None)
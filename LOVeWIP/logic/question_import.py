@@ -0,0 +1,440 @@
+"""
+Question Import - Kysymysten virtaava tuonti tiedostosta
+
+Ladattua tiedostoa ei lueta kokonaan muistiin: tiedostovirrasta luetaan
+CHUNK_SIZE merkin paloja, JSON-taulukon alkiot puretaan yksi kerrallaan
+(json.JSONDecoder.raw_decode) ja NDJSON-tiedostosta rivi kerrallaan. Rivit
+tarkistetaan (logic/question_validation.clean_item) ja lisätään BATCH_SIZE kokoisina
+erinä, joista jokainen on oma transaktionsa (DatabaseManager.insert_questions_batch).
+
+Muistissa on kerrallaan yksi pala, yksi erä ja enintään MAX_ERRORS
+virheilmoitusta, joten muistinkäyttö ei riipu tiedoston koosta.
+Edistyminen raportoidaan jokaisen erän jälkeen progress-funktiolle.
+
+Muoto tunnistetaan ensimmäisestä merkistä: '[' = JSON-taulukko, '{' = NDJSON.
+
+Keskeytetty tuonti voidaan jatkaa antamalla edellisen ajon tilastot:
+jo luetut rivit ohitetaan. Erä ja tilastot kirjataan samassa kohdassa, ja
+sormenjälkitarkistus ohittaa uudelleen luetut jo lisätyt rivit, joten
+jatkaminen ei tuota kaksoiskappaleita.
+
+Upsert-tilassa (mode='upsert') erät kirjoitetaan DatabaseManager.upsert_questions_batch:lla:
+viedyn tiedoston muokatut rivit päivitetään id:n (tai sormenjäljen) perusteella,
+muuttumattomat lasketaan duplikaateiksi ja uudet lisätään.
+
+Kuivaharjoitus (DryRunValidator) tarkistaa tiedoston kirjoittamatta mitään:
+rivit tarkistetaan DRY_RUN_CHUNK_ROWS kokoisina paloina (suurissa tiedostoissa
+prosessipoolissa, logic/question_validation.validate_chunk) ja sormenjälkiä
+verrataan tiedoston sisällä ja kantaan. Tuloksena on rakenteinen raportti ja
+token, jolla valmiiksi normalisoidut rivit tallennetaan (commit) ilman uutta
+jäsennystä. Palat tarkistetaan sitä mukaa kuin ne luetaan, ja tarkistetut
+rivit kirjoitetaan tokenin mukaan nimettyyn tiedostoon (DRY_RUN_DIR), joka
+säilyy DRY_RUN_TTL_SECONDS ajan.
+"""
+import codecs
+import json
+import logging
+import multiprocessing
+import os
+import re
+import secrets
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from logic.question_validation import clean_item, make_issue, validate_chunk
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 500
+MAX_ERRORS = 100
+IMPORT_MODES = ('insert', 'upsert')
+DRY_RUN_CHUNK_ROWS = 1000
+DRY_RUN_PARALLEL_MIN_ROWS = 20000  # Pienemmissä poolin käynnistys maksaa enemmän kuin säästää
+DRY_RUN_MAX_ISSUES = 200
+DRY_RUN_TTL_SECONDS = 30 * 60
+DRY_RUN_MAX_PENDING = 5
+DRY_RUN_DIR = os.environ.get('DRY_RUN_DIR', os.path.join('uploads', 'dry_runs'))
+DRY_RUN_TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_-]{16,64}')
+
+
+class ImportFormatError(ValueError):
+    """Tiedosto ei ole JSON-taulukko eikä NDJSON, tai sen rakenne on rikki."""
+
+
+class _CountingReader:
+    """Lukee tavuvirtaa paloina, purkaa UTF-8:n ja laskee luetut tavut."""
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+
+    def read(self):
+        """Palauttaa seuraavan tekstipalan; tyhjä merkkijono = virta loppui."""
+        while True:
+            data = self.stream.read(self.chunk_size)
+            self.bytes_read += len(data)
+            text = self._decoder.decode(data, final=not data)
+            if text or not data:
+                return text
+
+
+def iter_json_array(reader, first=''):
+    """Purkaa JSON-taulukon alkiot yksi kerrallaan. Tuottaa (indeksi, alkio)."""
+    decoder = json.JSONDecoder()
+    buffer, position, eof = first, 0, False
+    expect = '['  # '[' alussa, sitten arvo, ',' tai ']'
+    index = 0
+
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        if position >= len(buffer):
+            if eof:
+                raise ImportFormatError("JSON-taulukko päättyi kesken")
+            chunk = reader.read()
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+
+        char = buffer[position]
+        if expect == '[':
+            if char != '[':
+                raise ImportFormatError("JSON-tiedoston tulee sisältää lista kysymyksiä.")
+            position += 1
+            expect = 'value_or_end'
+        elif char == ']' and expect in ('value_or_end', 'comma_or_end'):
+            return
+        elif expect == 'comma_or_end':
+            if char != ',':
+                raise ImportFormatError(f"Odotettiin pilkkua alkion {index} jälkeen")
+            position += 1
+            expect = 'value'
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ImportFormatError(f"Virheellinen JSON alkiossa {index}: {e.msg}") from e
+                # Alkio jatkuu seuraavaan palaan
+                chunk = reader.read()
+                eof = not chunk
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            yield index, item
+            index += 1
+            position = end
+            expect = 'comma_or_end'
+
+
+def iter_ndjson(reader, first=''):
+    """Purkaa NDJSON-rivit. Tuottaa (rivinumero, alkio tai None, virhe tai None)."""
+    buffer, position, line_no, eof = first, 0, 0, False
+    while True:
+        newline = buffer.find('\n', position)
+        if newline < 0 and not eof:
+            chunk = reader.read()
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        end = len(buffer) if newline < 0 else newline
+        line = buffer[position:end]
+        position = end + 1
+        line_no += 1
+        if line.strip():
+            try:
+                yield line_no, json.loads(line), None
+            except json.JSONDecodeError as e:
+                yield line_no, None, f"virheellinen JSON: {e.msg}"
+        if newline < 0:
+            return
+
+
+def iter_items(reader):
+    """Tunnistaa muodon ensimmäisestä merkistä. Tuottaa (sijainti, alkio tai None, virhe tai None)."""
+    head = ''
+    while not head.strip():
+        chunk = reader.read()
+        if not chunk:
+            return
+        head += chunk
+    stripped = head.lstrip()
+    if stripped.startswith('['):
+        for index, item in iter_json_array(reader, head):
+            yield index, item, None
+    elif stripped.startswith('{'):
+        yield from iter_ndjson(reader, head)
+    else:
+        raise ImportFormatError("Tiedoston tulee olla JSON-lista tai NDJSON (yksi kysymys per rivi).")
+
+
+class QuestionImporter:
+    """Tuo kysymykset tiedostovirrasta erissä."""
+
+    def __init__(self, db_manager, batch_size=BATCH_SIZE):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+
+    def import_stream(self, stream, progress=None, stats=None, cancelled=None, mode='insert'):
+        """
+        Tuo kysymykset binäärivirrasta (esim. request.files['json_file'].stream).
+        progress(stats) kutsutaan jokaisen erän jälkeen. Palauttaa tilastot samoilla
+        added, duplicates, skipped, errors sekä read (luetut rivit), updated ja bytes.
+        mode: 'insert' ohittaa kannassa olevat, 'upsert' päivittää muuttuneet.
+        stats: edellisen ajon tilastot, kun keskeytynyttä tuontia jatketaan.
+        cancelled(): kun palauttaa True, kesken oleva erä tallennetaan ja tuonti lopetetaan.
+        Virheellinen tiedostorakenne nostaa ImportFormatError:n; jo lisätyt erät jäävät kantaan.
+        """
+        stats = dict(stats or {'read': 0, 'added': 0, 'duplicates': 0, 'skipped': 0, 'errors': []}, bytes=0)
+        stats['errors'] = list(stats['errors'])
+        stats.setdefault('updated', 0)
+        resume_after = stats['read']
+        reader = _CountingReader(stream)
+        batch, positions = [], []
+
+        def flush():
+            if mode == 'upsert':
+                success, result = self.db_manager.upsert_questions_batch(batch)
+            else:
+                # Epäonnistunut erä lisätään rivi kerrallaan, jotta raportti kertoo virheelliset rivit
+                success, result = self.db_manager.insert_questions_batch(batch, row_fallback=True)
+            if success:
+                stats['added'] += result['added']
+                stats['updated'] += result.get('updated', 0)
+                stats['duplicates'] += result.get('unchanged', result.get('duplicates', 0))
+                stats['skipped'] += len(result.get('conflicts', ()))
+                for conflict in result.get('conflicts', ()):
+                    self._error(stats, conflict)
+                stats['skipped'] += len(result.get('failed', ()))
+                for index, error in result.get('failed', ()):
+                    self._error(stats, f"Rivi {positions[index]}: {error}")
+            else:
+                stats['skipped'] += len(batch)
+                self._error(stats, f"{len(batch)} kysymyksen erä ennen riviä {stats['read'] + 1} epäonnistui: {result}")
+            batch.clear()
+            positions.clear()
+            stats['bytes'] = reader.bytes_read
+            if progress:
+                progress(stats)
+
+        for row_number, (position, item, error) in enumerate(iter_items(reader)):
+            if row_number < resume_after:
+                continue
+            if cancelled and cancelled():
+                break
+            stats['read'] += 1
+            if error is None:
+                item, error = clean_item(item)
+            if error:
+                stats['skipped'] += 1
+                self._error(stats, f"Rivi {position}: {error}")
+                continue
+            batch.append(item)
+            positions.append(position)
+            if len(batch) >= self.batch_size:
+                flush()
+        if batch:
+            flush()
+
+        stats['bytes'] = reader.bytes_read
+        logger.info(f"Kysymystuonti ({mode}): {stats['read']} riviä, {stats['added']} lisätty, {stats['updated']} päivitetty, "
+                    f"{stats['duplicates']} duplikaattia, {stats['skipped']} ohitettu")
+        return stats
+
+    @staticmethod
+    def _error(stats, message):
+        if len(stats['errors']) < MAX_ERRORS:
+            stats['errors'].append(message)
+
+
+class DryRunValidator:
+    """Tarkistaa tiedoston kirjoittamatta kantaan ja säilyttää tarkistetut rivit levyllä tallennusta varten."""
+
+    def __init__(self, db_manager, processes=None, output_dir=DRY_RUN_DIR):
+        self.db_manager = db_manager
+        self.processes = processes
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _chunks(stream):
+        chunk = []
+        for entry in iter_items(_CountingReader(stream)):
+            chunk.append(entry)
+            if len(chunk) >= DRY_RUN_CHUNK_ROWS:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _validated_chunks(self, stream, categories):
+        """
+        Tuottaa tarkistetut palat tiedostojärjestyksessä sitä mukaa kuin niitä luetaan.
+        Kun rivejä on luettu DRY_RUN_PARALLEL_MIN_ROWS, loput palat tarkistetaan
+        prosessipoolissa (spawn); kesken on enintään kaksi palaa työprosessia kohden.
+        """
+        workers = self.processes or os.cpu_count() or 1
+        pool, pending, rows_read = None, deque(), 0
+        try:
+            for chunk in self._chunks(stream):
+                rows_read += len(chunk)
+                if pool is None and workers > 1 and rows_read >= DRY_RUN_PARALLEL_MIN_ROWS:
+                    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+                if pool is None:
+                    yield validate_chunk(chunk, categories)
+                    continue
+                pending.append(pool.submit(validate_chunk, chunk, categories))
+                while len(pending) > 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    def _path(self, token):
+        return os.path.join(self.output_dir, f"{token}.ndjson")
+
+    def validate(self, stream, filename=None):
+        """
+        Tarkistaa tiedoston ja palauttaa raportin. Jos kelvollisia uusia rivejä on,
+        raportissa on token, jolla ne tallennetaan commit()-metodilla.
+        Valmistellut rivit kirjoitetaan tokenin tiedostoon sitä mukaa kuin palat
+        valmistuvat, joten muistissa on vain keskeneräiset palat ja sormenjäljet.
+        Virheellinen tiedostorakenne nostaa ImportFormatError:n.
+        """
+        started = time.monotonic()
+        categories = {category.lower() for category in self.db_manager.get_categories()}
+        fingerprints = self.db_manager._get_fingerprints()
+        seen = {}
+        issues, counts, new_categories = [], Counter(), Counter()
+        rows_total = valid = invalid = in_file = in_bank = 0
+
+        def report(position, issue):
+            counts[issue['code']] += 1
+            if len(issues) < DRY_RUN_MAX_ISSUES:
+                issues.append(dict(issue, row=position))
+
+        self._prune()
+        token = secrets.token_urlsafe(16)
+        tmp_path = f"{self._path(token)}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as out:
+                for chunk_results in self._validated_chunks(stream, categories):
+                    for position, row, row_issues in chunk_results:
+                        rows_total += 1
+                        for issue in row_issues:
+                            report(position, issue)
+                            if issue['code'] == 'new_category':
+                                new_categories[issue['value']] += 1
+                        if row is None:
+                            invalid += 1
+                            continue
+                        fingerprint = row[0]
+                        if fingerprint in fingerprints:
+                            in_bank += 1
+                            report(position, dict(make_issue('question', 'duplicate_in_bank', "sama kysymys on jo kannassa", 'warning'),
+                                                  duplicate_of=fingerprints.get(fingerprint)))
+                        elif fingerprint in seen:
+                            in_file += 1
+                            report(position, dict(make_issue('question', 'duplicate_in_file', "sama kysymys on tiedostossa aiemmin", 'warning'),
+                                                  duplicate_of_row=seen[fingerprint]))
+                        else:
+                            seen[fingerprint] = position
+                            out.write(json.dumps(row, ensure_ascii=False) + '\n')
+                            valid += 1
+            if valid:
+                os.replace(tmp_path, self._path(token))
+            else:
+                os.remove(tmp_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        result = {
+            'filename': filename,
+            'rows': rows_total,
+            'valid': valid,
+            'invalid': invalid,
+            'duplicates_in_file': in_file,
+            'duplicates_in_bank': in_bank,
+            'new_categories': dict(new_categories),
+            'issue_counts': dict(counts),
+            'issues': issues,
+            'issues_truncated': sum(counts.values()) > len(issues),
+            'seconds': round(time.monotonic() - started, 2),
+            'token': token if valid else None,
+        }
+        logger.info(f"Kuivaharjoitus: {rows_total} riviä, {valid} kelvollista, {invalid} virheellistä, {result['seconds']} s")
+        return result
+
+    def _prune(self):
+        """Poistaa vanhentuneet tarkistukset ja jättää tilaa uudelle: enintään DRY_RUN_MAX_PENDING tallessa."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        now = time.time()
+        with self._lock:
+            ready = []
+            for name in os.listdir(self.output_dir):
+                path = os.path.join(self.output_dir, name)
+                try:
+                    modified = os.path.getmtime(path)
+                    if now - modified > DRY_RUN_TTL_SECONDS:
+                        os.remove(path)
+                    elif name.endswith('.ndjson'):
+                        ready.append((modified, path))
+                except OSError:
+                    continue
+            for _, path in sorted(ready, reverse=True)[DRY_RUN_MAX_PENDING - 1:]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+
+    def _read_batches(self, path):
+        batch = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                fingerprint, values = json.loads(line)
+                batch.append((fingerprint, tuple(values)))
+                if len(batch) >= BATCH_SIZE:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def commit(self, token):
+        """
+        Tallentaa tarkistetut rivit BATCH_SIZE kokoisina erinä (kukin oma transaktionsa),
+        kuten tiedostotuonti. Kannan muuttuminen tarkistuksen jälkeen huomioidaan:
+        uudet duplikaatit ohitetaan, joten epäonnistuneen tallennuksen voi yrittää uudelleen.
+        Palauttaa (True, {'added', 'duplicates'}) tai (False, virhe).
+        """
+        expired = (False, "Tarkistus on vanhentunut tai jo tallennettu. Tarkista tiedosto uudelleen.")
+        if not DRY_RUN_TOKEN_PATTERN.fullmatch(token or ''):
+            return expired
+        path = self._path(token)
+        claimed = f"{path}.commit"
+        try:
+            if time.time() - os.path.getmtime(path) > DRY_RUN_TTL_SECONDS:
+                return expired
+            os.replace(path, claimed)  # Sama token tallennetaan vain kerran
+        except OSError:
+            return expired
+
+        totals = {'added': 0, 'duplicates': 0}
+        for batch in self._read_batches(claimed):
+            success, result = self.db_manager.insert_prepared_questions(batch)
+            if not success:
+                os.replace(claimed, path)
+                if totals['added']:
+                    result = f"{result} ({totals['added']} kysymystä ehdittiin lisätä; uusi yritys ohittaa ne)"
+                return False, result
+            totals['added'] += result['added']
+            totals['duplicates'] += result['duplicates']
+        os.remove(claimed)
+        return True, totals
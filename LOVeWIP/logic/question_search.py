@@ -0,0 +1,76 @@
+"""
+Question Search - Kysymyspankin tekstihaun kyselyt
+
+Hakuindeksi kattaa kysymyksen, vastausvaihtoehdot ja selityksen:
+  - PostgreSQL: questions.search_vector (tsvector, 'finnish'-konfiguraatio
+    eli Snowball-vartalonmuodostus) ja GIN-indeksi. Painot: kysymys A,
+    vaihtoehdot B, selitys C; järjestys ts_rank_cd:llä.
+  - SQLite: FTS5-virtuaalitaulu questions_fts (unicode61, diakriitit
+    poistettuna, prefiksi-indeksit). Suomelle ei ole FTS5-vartalonmuodostinta,
+    joten hakusanoista poistetaan yleisimmät sijapäätteet ja haku tehdään
+    prefiksinä. Pitkän vartalon viimeinen kirjain jätetään pois, jotta
+    vartalon vokaalimuutokset osuvat ("potilas" -> potila* löytää "potilaalle",
+    "lääkkeiden" -> laakk*). Järjestys bm25:llä samoilla painoilla.
+
+Kaikkien hakusanojen pitää löytyä (AND). Tämä moduuli muodostaa vain
+kyselymerkkijonot; SQL on DatabaseManager.search_questions-metodissa.
+"""
+import re
+
+from logic.question_fingerprint import normalize_question
+
+MAX_TERMS = 8
+MIN_STEM_LENGTH = 4
+TRIM_STEM_LENGTH = 6  # Tätä pidemmistä vartaloista poistetaan viimeinen kirjain
+# Yleisimmät sijapäätteet ja monikon tunnukset ilman diakriittejä, pisimmät ensin
+FINNISH_SUFFIXES = tuple(sorted((
+    'issa', 'ista', 'iin', 'illa', 'ilta', 'ille', 'iksi', 'ina', 'iden', 'itten', 'ien', 'jen',
+    'ssa', 'sta', 'lla', 'lta', 'lle', 'ksi', 'na', 'tta', 'en', 'an', 'in', 'ja', 'ta',
+    'n', 't', 'a', 'i',
+), key=len, reverse=True))
+
+# Painot: kysymys, vaihtoehdot, selitys
+SQLITE_BM25_WEIGHTS = (10.0, 2.0, 1.0)
+
+
+def search_terms(query):
+    """Hakusanat normalisoituna (enintään MAX_TERMS, duplikaatit poistettuna)."""
+    terms = []
+    for term in normalize_question(query).split():
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def finnish_prefix(term):
+    """
+    Hakusanan prefiksi: yksi sijapääte pois, jos vartaloon jää vähintään
+    MIN_STEM_LENGTH merkkiä, ja pitkästä vartalosta vielä viimeinen kirjain.
+    """
+    for suffix in FINNISH_SUFFIXES:
+        if term.endswith(suffix) and len(term) - len(suffix) >= MIN_STEM_LENGTH:
+            term = term[:-len(suffix)]
+            break
+    return term[:-1] if len(term) >= TRIM_STEM_LENGTH else term
+
+
+def fts5_query(query):
+    """FTS5 MATCH -lauseke: jokainen sana lainausmerkeissä prefiksinä. None, jos hakusanoja ei ole."""
+    terms = search_terms(query)
+    if not terms:
+        return None
+    return ' AND '.join(f'"{finnish_prefix(term)}"*' for term in terms)
+
+
+def tsquery(query):
+    """
+    to_tsquery('finnish', ...) -lauseke: sanat prefikseinä (sana:*), jotka
+    PostgreSQL vielä vartaloi. Diakriitit säilytetään, koska indeksissä ne ovat mukana.
+    """
+    terms = []
+    for term in re.sub(r'[\W_]+', ' ', (query or '').casefold()).split():
+        if term not in terms:
+            terms.append(term)
+    if not terms:
+        return None
+    return ' & '.join(f'{term}:*' for term in terms[:MAX_TERMS])
@@ -0,0 +1,160 @@
+"""
+Question Seed - Kysymyspankkien yhdistäminen yhdeksi kanoniseksi pankiksi
+
+Kysymykset/-kansion lähdetiedostot ovat osittain päällekkäisiä. Tämä työkalu
+lukee kaikki annetut tiedostot, tarkistaa rivit ja yhdistää ne muistissa:
+
+  - täsmälleen samat kysymykset (sama sormenjälki, logic/question_fingerprint.py)
+    yhdistetään; ensimmäinen esiintymä tiedostojen annetussa järjestyksessä on
+    kanoninen, mutta pidempi selitys otetaan talteen muista esiintymistä
+  - ristiriidat raportoidaan: sama kysymys eri oikealla vastauksella tai eri
+    vaihtoehdoilla
+  - lähes identtiset kysymykset (MinHash-ehdokkaat, logic/duplicate_index.py)
+    raportoidaan, mutta niitä ei yhdistetä, koska pankeissa on tarkoituksella
+    samaan pohjaan tehtyjä laskuja eri luvuilla
+  - kategoriat yhtenäistetään pienaakkosiksi ("Perusteet" -> "perusteet")
+
+Tuloksena on yksi JSON-pankki, jonka voi ladata kantaan yhdessä
+transaktiossa (DatabaseManager.insert_questions_batch).
+
+Käyttö:
+    python -m logic.question_seed Kysymykset/*.json --output seed.json [--report raportti.json] [--load]
+"""
+import argparse
+import json
+import logging
+from collections import Counter
+
+import numpy as np
+
+from logic.duplicate_index import candidate_pairs, minhash_signature, similarity
+from logic.question_fingerprint import normalize_question, question_fingerprint
+from logic.question_validation import clean_item
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUPLICATE_THRESHOLD = 0.9
+
+
+def load_sources(paths):
+    """Lukee lähdetiedostot. Palauttaa [(tiedosto, rivinumero, rivi)] ja virheelliset tiedostot."""
+    entries, errors = [], []
+    for path in paths:
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            errors.append({'source': path, 'error': str(e)})
+            continue
+        if not isinstance(data, list):
+            errors.append({'source': path, 'error': "tiedosto ei sisällä listaa kysymyksiä"})
+            continue
+        entries.extend((path, index, item) for index, item in enumerate(data))
+    return entries, errors
+
+
+def consolidate(entries, near_threshold=NEAR_DUPLICATE_THRESHOLD):
+    """
+    Yhdistää lähderivit. Palauttaa (kanoniset kysymykset, raportti).
+    Raportissa ovat virheelliset rivit, yhdistetyt duplikaatit, ristiriidat ja lähes identtiset parit.
+    """
+    canonical, origins, by_fingerprint = [], [], {}
+    invalid, conflicts = [], []
+    merged = Counter()
+
+    for source, index, item in entries:
+        question, error = clean_item(item)
+        if error:
+            invalid.append({'source': source, 'index': index, 'error': error})
+            continue
+        fingerprint = question_fingerprint(question['question'])
+        position = by_fingerprint.get(fingerprint)
+        if position is None:
+            by_fingerprint[fingerprint] = len(canonical)
+            canonical.append(question)
+            origins.append((source, index))
+            continue
+
+        kept = canonical[position]
+        merged[source] += 1
+        kept_answer = normalize_question(kept['options'][kept['correct']])
+        answer = normalize_question(question['options'][question['correct']])
+        if kept_answer != answer:
+            conflicts.append({
+                'type': 'correct_answer', 'question': kept['question'],
+                'kept': {'source': origins[position][0], 'index': origins[position][1], 'answer': kept['options'][kept['correct']]},
+                'other': {'source': source, 'index': index, 'answer': question['options'][question['correct']]},
+            })
+        elif sorted(map(normalize_question, kept['options'])) != sorted(map(normalize_question, question['options'])):
+            conflicts.append({
+                'type': 'options', 'question': kept['question'],
+                'kept': {'source': origins[position][0], 'index': origins[position][1], 'options': kept['options']},
+                'other': {'source': source, 'index': index, 'options': question['options']},
+            })
+        elif len(question['explanation']) > len(kept['explanation']):
+            kept['explanation'] = question['explanation']
+
+    near_duplicates = []
+    if len(canonical) > 1:
+        signatures = np.array([minhash_signature(normalize_question(q['question'])) for q in canonical])
+        for i, j in candidate_pairs(signatures).tolist():
+            score = similarity(canonical[i]['question'], canonical[j]['question'], near_threshold)
+            if score >= near_threshold:
+                near_duplicates.append({
+                    'similarity': round(score * 100, 1),
+                    'first': {'source': origins[i][0], 'index': origins[i][1], 'question': canonical[i]['question']},
+                    'second': {'source': origins[j][0], 'index': origins[j][1], 'question': canonical[j]['question']},
+                    'same_answer': normalize_question(canonical[i]['options'][canonical[i]['correct']])
+                                   == normalize_question(canonical[j]['options'][canonical[j]['correct']]),
+                })
+
+    report = {
+        'read': len(entries),
+        'canonical': len(canonical),
+        'invalid': invalid,
+        'merged_duplicates': dict(merged),
+        'conflicts': conflicts,
+        'near_duplicates': sorted(near_duplicates, key=lambda pair: -pair['similarity']),
+        'categories': dict(Counter(q['category'] for q in canonical).most_common()),
+    }
+    return canonical, report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Yhdistä kysymyspankit yhdeksi kanoniseksi pankiksi.")
+    parser.add_argument('sources', nargs='+', help="Lähdetiedostot etusijajärjestyksessä")
+    parser.add_argument('--output', required=True, help="Kanonisen pankin JSON-tiedosto")
+    parser.add_argument('--report', help="Raportti JSON-tiedostoon (oletus: vain yhteenveto)")
+    parser.add_argument('--threshold', type=float, default=NEAR_DUPLICATE_THRESHOLD * 100,
+                        help="Lähes identtisten raportointikynnys prosentteina")
+    parser.add_argument('--load', action='store_true', help="Lataa pankki tietokantaan yhdessä transaktiossa")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    entries, read_errors = load_sources(args.sources)
+    questions, report = consolidate(entries, args.threshold / 100)
+    report['read_errors'] = read_errors
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(questions, f, ensure_ascii=False, indent=2)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"Luettu {report['read']} riviä, kanonisia kysymyksiä {report['canonical']}")
+    print(f"Yhdistetyt duplikaatit: {sum(report['merged_duplicates'].values())} {report['merged_duplicates']}")
+    print(f"Virheelliset rivit: {len(report['invalid'])}, virheelliset tiedostot: {len(read_errors)}")
+    print(f"Ristiriidat: {len(report['conflicts'])}, lähes identtiset parit: {len(report['near_duplicates'])}")
+    for conflict in report['conflicts'][:10]:
+        print(f"  [{conflict['type']}] {conflict['question'][:70]}")
+
+    if args.load:
+        from data_access.database_manager import DatabaseManager
+        from logic.duplicate_index import DuplicateIndex
+
+        db_manager = DatabaseManager()
+        success, result = db_manager.insert_questions_batch(questions)
+        if not success:
+            raise SystemExit(f"Lataus epäonnistui, mitään ei lisätty: {result}")
+        DuplicateIndex(db_manager).sync()
+        print(f"Ladattu: {result['added']} lisätty, {result['duplicates']} oli jo kannassa")
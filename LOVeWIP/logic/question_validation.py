@@ -0,0 +1,128 @@
+"""
+Question Validation - Kysymysrivien tarkistussäännöt
+
+validate_row() tarkistaa yhden rivin ja palauttaa rakenteiset havainnot
+(kenttä, koodi, viesti, vakavuus) sekä normalisoidun rivin:
+
+  - pakolliset kentät (missing_field), rivi ei ole objekti (not_object)
+  - vaihtoehtojen määrä (option_count), tyhjät (empty_option) ja samat
+    vaihtoehdot (duplicate_option, varoitus)
+  - oikean vastauksen tyyppi (correct_type) ja indeksialue (correct_range)
+  - vaikeustaso DIFFICULTIES-sanastosta (difficulty)
+  - kategoria tunnettujen joukosta (new_category, varoitus)
+  - valinnainen id on kokonaisluku (id_type); sitä käytetään upsert-tuonnissa
+
+row_hash() on rivin sisältötiiviste, jolla upsert-tuonti tunnistaa muuttuneet rivit.
+
+Virhe hylkää rivin, varoitus ei. Samoja sääntöjä käyttävät seed-työkalu,
+virtaava tuonti (clean_item) ja kuivaharjoitus (question_import.DryRunValidator).
+"""
+import hashlib
+import json
+
+from logic.question_fingerprint import normalize_question, question_fingerprint
+
+REQUIRED_FIELDS = ('question', 'explanation', 'options', 'correct', 'category', 'difficulty')
+DIFFICULTIES = ('helppo', 'keskivaikea', 'vaikea')
+MAX_OPTIONS = 6
+
+
+def make_issue(field, code, message, severity='error'):
+    return {'field': field, 'code': code, 'message': message, 'severity': severity}
+
+
+def validate_row(item, categories=None):
+    """
+    Tarkistaa rivin. categories: tunnetut kategoriat (None = ei tarkisteta).
+    Palauttaa (normalisoitu rivi tai None, havainnot). Rivi on None, jos havainnoissa on virhe.
+    """
+    if not isinstance(item, dict):
+        return None, [make_issue(None, 'not_object', "rivi ei ole objekti")]
+    issues = [make_issue(field, 'missing_field', f"puuttuva kenttä: {field}")
+              for field in REQUIRED_FIELDS if item.get(field) in (None, '')]
+    if issues:
+        return None, issues
+
+    options = item['options']
+    if not isinstance(options, list) or len(options) < 2:
+        issues.append(make_issue('options', 'option_count', "vaihtoehtoja pitää olla vähintään kaksi"))
+    else:
+        if len(options) > MAX_OPTIONS:
+            issues.append(make_issue('options', 'option_count', f"vaihtoehtoja on yli {MAX_OPTIONS}", 'warning'))
+        if any(not str(option).strip() for option in options):
+            issues.append(make_issue('options', 'empty_option', "tyhjä vaihtoehto"))
+        if len({normalize_question(str(option)) for option in options}) < len(options):
+            issues.append(make_issue('options', 'duplicate_option', "samoja vaihtoehtoja useaan kertaan", 'warning'))
+        try:
+            correct = int(item['correct'])
+            if not 0 <= correct < len(options):
+                issues.append(make_issue('correct', 'correct_range', f"correct {correct} ei osu vaihtoehtoihin (0-{len(options) - 1})"))
+        except (TypeError, ValueError):
+            issues.append(make_issue('correct', 'correct_type', "correct ei ole kokonaisluku"))
+
+    difficulty = str(item['difficulty']).strip().lower()
+    if difficulty not in DIFFICULTIES:
+        issues.append(make_issue('difficulty', 'difficulty', f"tuntematon vaikeustaso '{item['difficulty']}'"))
+    category = str(item['category']).strip().lower()
+    question_id = item.get('id')
+    if question_id is not None:
+        try:
+            question_id = int(question_id)
+        except (TypeError, ValueError):
+            issues.append(make_issue('id', 'id_type', "id ei ole kokonaisluku"))
+    if categories is not None and category not in categories:
+        issues.append(dict(make_issue('category', 'new_category', f"uusi kategoria '{category}'", 'warning'), value=category))
+
+    if any(issue['severity'] == 'error' for issue in issues):
+        return None, issues
+    row = {
+        'question': str(item['question']).strip(),
+        'explanation': str(item['explanation']).strip(),
+        'options': [str(option).strip() for option in options],
+        'correct': int(item['correct']),
+        'category': category,
+        'difficulty': difficulty,
+    }
+    if question_id is not None:
+        row['id'] = question_id
+    return row, issues
+
+
+def clean_item(item):
+    """Tarkistaa ja siistii lähderivin. Palauttaa (kysymys, None) tai (None, virheilmoitus)."""
+    row, issues = validate_row(item)
+    if row is None:
+        return None, issues[0]['message'] if len(issues) == 1 else ', '.join(issue['message'] for issue in issues)
+    return row, None
+
+
+def row_hash(row):
+    """
+    Sisältötiiviste muokattavista kentistä samalla siistimisellä kuin validate_row,
+    joten kannan rivi ja sama rivi viedystä tiedostosta tuottavat saman tiivisteen.
+    """
+    options = json.loads(row['options']) if isinstance(row['options'], str) else row['options']
+    content = [
+        str(row['question']).strip(), str(row['explanation'] or '').strip(), [str(option).strip() for option in options],
+        int(row['correct']), str(row['category']).strip().lower(), str(row['difficulty']).strip().lower(),
+    ]
+    return hashlib.sha1(json.dumps(content, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def prepare_row(row):
+    """Normalisoitu rivi tallennusmuotoon: (sormenjälki, questions-taulun sarakkeet ilman created_at)."""
+    fingerprint = question_fingerprint(row['question'])
+    return fingerprint, (row['question'], normalize_question(row['question']), fingerprint, row['explanation'],
+                         json.dumps(row['options']), row['correct'], row['category'], row['difficulty'])
+
+
+def validate_chunk(chunk, categories):
+    """Prosessipoolin työ: [(sijainti, alkio, jäsennysvirhe)] -> [(sijainti, valmisteltu rivi tai None, havainnot)]."""
+    results = []
+    for position, item, parse_error in chunk:
+        if parse_error:
+            results.append((position, None, [make_issue(None, 'invalid_json', parse_error)]))
+            continue
+        row, issues = validate_row(item, categories)
+        results.append((position, prepare_row(row) if row else None, issues))
+    return results
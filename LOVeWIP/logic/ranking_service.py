@@ -0,0 +1,147 @@
+"""
+Ranking Service - Käyttäjän sijoitus (persentiili) muihin käyttäjiin nähden
+
+Rakentaa säännöllisin väliajoin lajitellut NumPy-taulukot käyttäjien
+onnistumisprosenteista (kokonais- ja kategoriakohtaisesti). Persentiilikysely
+on binäärihaku lajiteltuun taulukkoon, joten se maksaa O(log n) eikä
+koske tietokantaan.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RankingSnapshot:
+    """Yhden rakennuskerran lajitellut onnistumisprosentit."""
+
+    def __init__(self, user_ids, rates):
+        order = np.argsort(rates, kind='stable')
+        self.sorted_rates = rates[order]
+        self.rate_by_user = dict(zip(user_ids.tolist(), rates.tolist()))
+
+    def __len__(self):
+        return len(self.sorted_rates)
+
+    def percentile(self, rate):
+        """Osuus käyttäjistä, joiden onnistumisprosentti on pienempi (tasapelit puoliksi)."""
+        n = len(self.sorted_rates)
+        if n == 0:
+            return None
+        below = np.searchsorted(self.sorted_rates, rate, side='left')
+        not_above = np.searchsorted(self.sorted_rates, rate, side='right')
+        return round(float((below + not_above) / 2 / n * 100), 1)
+
+
+class RankingService:
+    """Pitää muistissa sijoitustaulukot ja rakentaa ne uudelleen, kun ne vanhenevat."""
+
+    REBUILD_INTERVAL = timedelta(minutes=15)
+    MIN_ATTEMPTS = 10  # Näin monta vastausta tarvitaan, jotta käyttäjä otetaan vertailuun
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self._overall = None
+        self._categories = {}
+        self._built_at = None
+        self._attempted_at = None  # Viimeisin rakennusyritys (myös epäonnistunut)
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+
+    def rebuild(self):
+        """Laskee onnistumisprosentit yhdellä koostekyselyllä ja lajittelee ne."""
+        started = datetime.now()
+        rows = self.db_manager._execute("""
+            SELECT p.user_id, q.category,
+                   SUM(p.times_shown) as attempts, SUM(p.times_correct) as corrects
+            FROM user_question_progress p
+            JOIN questions q ON q.id = p.question_id
+            WHERE p.times_shown > 0
+            GROUP BY p.user_id, q.category
+        """, fetch='all') or []
+
+        if rows:
+            user_ids = np.array([r['user_id'] for r in rows], dtype=np.int64)
+            categories = np.array([r['category'] for r in rows])
+            attempts = np.array([r['attempts'] for r in rows], dtype=np.float64)
+            corrects = np.array([r['corrects'] for r in rows], dtype=np.float64)
+        else:
+            user_ids = np.zeros(0, dtype=np.int64)
+            categories = np.zeros(0, dtype=str)
+            attempts = corrects = np.zeros(0)
+
+        # Kokonaisprosentti: summataan kategoriarivit käyttäjittäin
+        unique_users, user_idx = np.unique(user_ids, return_inverse=True)
+        user_attempts = np.bincount(user_idx, weights=attempts, minlength=len(unique_users))
+        user_corrects = np.bincount(user_idx, weights=corrects, minlength=len(unique_users))
+        eligible = user_attempts >= self.MIN_ATTEMPTS
+        overall = RankingSnapshot(unique_users[eligible], user_corrects[eligible] / user_attempts[eligible])
+
+        category_snapshots = {}
+        eligible_rows = attempts >= self.MIN_ATTEMPTS
+        for category in np.unique(categories[eligible_rows]):
+            mask = eligible_rows & (categories == category)
+            category_snapshots[str(category)] = RankingSnapshot(user_ids[mask], corrects[mask] / attempts[mask])
+
+        with self._lock:
+            self._overall = overall
+            self._categories = category_snapshots
+            self._built_at = datetime.now()
+
+        elapsed_ms = (self._built_at - started).total_seconds() * 1000
+        logger.info(f"Sijoitustaulukot rakennettu: {len(overall)} käyttäjää, {len(category_snapshots)} kategoriaa, {elapsed_ms:.0f} ms")
+
+    def _stale(self):
+        return self._attempted_at is None or datetime.now() - self._attempted_at > self.REBUILD_INTERVAL
+
+    def _ensure_fresh(self):
+        """
+        Rakentaa taulukot uudelleen, kun edellisestä yrityksestä on kulunut REBUILD_INTERVAL.
+        Vain yksi kutsuja rakentaa kerrallaan; muut käyttävät sillä välin vanhoja taulukoita
+        (ensimmäistä rakennusta odotetaan). Epäonnistunutta rakennusta yritetään uudelleen
+        vasta seuraavan välin jälkeen.
+        """
+        if not self._stale():
+            return
+        if not self._rebuild_lock.acquire(blocking=self._overall is None):
+            return
+        try:
+            if not self._stale():
+                return
+            self._attempted_at = datetime.now()
+            try:
+                self.rebuild()
+            except Exception as e:
+                logger.error(f"Virhe sijoitustaulukoiden rakentamisessa: {e}")
+        finally:
+            self._rebuild_lock.release()
+
+    def get_percentile(self, user_id, category=None):
+        """Palauttaa käyttäjän persentiilin (kokonais- tai kategoriakohtainen) tai None."""
+        self._ensure_fresh()
+        snapshot = self._categories.get(category) if category else self._overall
+        if snapshot is None or user_id not in snapshot.rate_by_user:
+            return None
+        rate = snapshot.rate_by_user[user_id]
+        return {
+            'percentile': snapshot.percentile(rate),
+            'success_rate': round(rate * 100, 1),
+            'users_ranked': len(snapshot),
+        }
+
+    def get_user_ranking(self, user_id):
+        """Kokonaispersentiili ja kaikki kategoriat, joissa käyttäjä on mukana vertailussa."""
+        self._ensure_fresh()
+        categories = {}
+        for category in self._categories:
+            ranking = self.get_percentile(user_id, category)
+            if ranking:
+                categories[category] = ranking
+        return {
+            'overall': self.get_percentile(user_id),
+            'categories': categories,
+            'built_at': self._built_at.isoformat() if self._built_at else None,
+        }
@@ -0,0 +1,78 @@
+"""
+Review Queue - Käyttäjän päivittäinen kertausjono
+
+Erääntyneiden kysymysten ID:t haetaan kerran päivässä (tai pyydettäessä)
+erääntymisjärjestyksessä ja tallennetaan review_queues-tauluun tiiviinä
+listana. Kertausnäkymä hakee jonosta sivun kerrallaan kursorilla, joten
+raskasta erääntymiskyselyä ei ajeta jokaista korttia kohden. Vastatut
+kysymykset merkitään jonoon heti, jolloin ne ohitetaan seuraavilla sivuilla.
+
+Kursori on indeksi jonon alkuperäiseen järjestykseen, joten se pysyy
+vakaana vaikka kortteja merkitään vastatuiksi kesken kierroksen.
+
+Jonon järjestys (policy) on 'due' tai 'priority' (ks. spaced_repetition.DUE_POLICIES).
+Jos pyydetty järjestys poikkeaa tallennetusta, jono rakennetaan uudelleen.
+"""
+import logging
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+
+class ReviewQueueManager:
+    """Materialisoitu päivittäinen kertausjono ja sen kursorisivutus."""
+
+    MAX_QUEUE_SIZE = 500
+
+    def __init__(self, db_manager, spaced_repetition_manager):
+        self.db_manager = db_manager
+        self.spaced_repetition_manager = spaced_repetition_manager
+
+    def build(self, user_id, policy='due'):
+        """Rakentaa käyttäjän jonon uudelleen erääntyneistä kysymyksistä."""
+        question_ids = self.spaced_repetition_manager.get_due_question_ids(user_id, limit=self.MAX_QUEUE_SIZE, policy=policy)
+        queue = {'queue_date': date.today().isoformat(), 'question_ids': question_ids, 'answered_ids': [], 'policy': policy}
+        success, error = self.db_manager.save_review_queue(user_id, **queue)
+        if not success:
+            logger.error(f"Virhe käyttäjän {user_id} kertausjonon tallennuksessa: {error}")
+        return queue
+
+    def get_queue(self, user_id, policy='due'):
+        """Palauttaa tämän päivän jonon; edellisen päivän, puuttuva tai eri järjestyksellä tehty jono rakennetaan uudelleen."""
+        queue = self.db_manager.get_review_queue(user_id)
+        if not queue or queue['queue_date'] != date.today().isoformat() or queue['policy'] != policy:
+            return self.build(user_id, policy)
+        return queue
+
+    def get_page(self, user_id, cursor=0, limit=5, policy='due'):
+        """
+        Palauttaa seuraavat (enintään limit) vastaamattomat kortit kursorista alkaen.
+        Palauttaa (kysymykset, seuraava kursori tai None, jäljellä olevien määrä).
+        """
+        queue = self.get_queue(user_id, policy)
+        question_ids = queue['question_ids']
+        answered = set(queue['answered_ids'])
+
+        page_ids = []
+        position = max(cursor, 0)
+        while position < len(question_ids) and len(page_ids) < limit:
+            if question_ids[position] not in answered:
+                page_ids.append(question_ids[position])
+            position += 1
+
+        remaining = len(question_ids) - len(answered)
+        next_cursor = position if any(qid not in answered for qid in question_ids[position:]) else None
+        questions = self.spaced_repetition_manager.get_questions_with_progress(user_id, page_ids)
+        return questions, next_cursor, remaining
+
+    def mark_answered(self, user_id, question_id):
+        """Merkitsee jonossa olevan kysymyksen vastatuksi (ei vaikutusta, jos se ei ole jonossa)."""
+        try:
+            queue = self.db_manager.get_review_queue(user_id)
+            if not queue or queue['queue_date'] != date.today().isoformat():
+                return
+            if question_id in queue['question_ids'] and question_id not in queue['answered_ids']:
+                queue['answered_ids'].append(question_id)
+                self.db_manager.save_review_queue(user_id, **queue)
+        except Exception as e:
+            logger.error(f"Virhe kertausjonon päivityksessä: {e}")
@@ -1,81 +1,241 @@
 import json
+import logging
+import os
+from datetime import date, timedelta
 from models.models import Question
 from typing import List
 
+import numpy as np
+
+from logic.load_balancer import DueLoadBalancer
+from logic.memory_model import MemoryModelManager, next_interval, rating_from_answer, retrievability
+
+logger = logging.getLogger(__name__)
+
+# Aktiivinen ajoitusalgoritmi: 'sm2' (oletus) tai 'fsrs' (muistimalli, logic/memory_model.py).
+# Muistimallin tila ja kertausloki päivitetään molemmilla, joten vaihto onnistuu lennossa.
+SR_SCHEDULER = os.environ.get('SR_SCHEDULER', 'sm2').lower()
+
+# SM-2 parametrit. Jos näitä muutetaan, olemassa olevat aikataulut lasketaan
+# uudelleen eräajolla (logic/sr_rescheduler.py).
+SM2_INITIAL_EASE = 2.5
+SM2_MIN_EASE = 1.3
+SM2_FAIL_INTERVAL = 1
+SM2_SECOND_INTERVAL = 6
+
+# Erääntyneiden valintajärjestys: 'due' = vanhin erääntyminen ensin,
+# 'priority' = suurin unohtamisriski ensin (due_priority)
+DUE_POLICIES = ('due', 'priority')
+
+
+def sm2_next_review(times_shown, interval, ease_factor, performance_rating):
+    """
+    Vektoroitu SM-2: sama laskenta kuin calculate_next_review, mutta NumPy-taulukoille.
+    times_shown on näyttökertojen määrä ennen tätä vastausta.
+    """
+    times_shown = np.asarray(times_shown)
+    interval = np.asarray(interval, dtype=np.float64)
+    ease_factor = np.asarray(ease_factor, dtype=np.float64)
+    q = np.asarray(performance_rating, dtype=np.float64)
+
+    failed = q < 3
+    fail_ease = ease_factor - 0.8 + 0.28 * q - 0.02 * q ** 2
+    pass_ease = ease_factor + (0.1 - (5 - q) * (0.08 + (5 - q) * 0.02))
+    pass_interval = np.where(times_shown <= 1, SM2_SECOND_INTERVAL, np.round(interval * ease_factor))
+
+    new_interval = np.where(failed, SM2_FAIL_INTERVAL, pass_interval).astype(np.int64)
+    new_ease = np.maximum(SM2_MIN_EASE, np.where(failed, fail_ease, pass_ease))
+    return new_interval, new_ease
+
+
+def due_priority(elapsed_days, overdue_days, interval, stability):
+    """
+    Erääntyneen kortin prioriteetti: arvioitu unohtamistodennäköisyys (1 - R)
+    kerrottuna myöhästymissuhteella (1 + myöhästyminen / väli). Muistimallin
+    stabiilisuuden puuttuessa stabiilisuutena käytetään kertausväliä.
+    """
+    interval = np.maximum(np.asarray(interval, dtype=np.float64), 1.0)
+    stability = np.asarray(stability, dtype=np.float64)
+    stability = np.where(np.isnan(stability) | (stability <= 0), interval, stability)
+    forgetting = 1.0 - retrievability(np.maximum(np.asarray(elapsed_days, dtype=np.float64), 0.0), stability)
+    return forgetting * (1.0 + np.maximum(overdue_days, 0) / interval)
+
+
+def top_k(scores, k):
+    """
+    Suurimpien k pisteen indeksit laskevassa järjestyksessä (tasapisteet
+    indeksijärjestyksessä). Osittaisjärjestys: O(n + k log k) koko lajittelun sijaan.
+    """
+    scores = np.asarray(scores)
+    if k <= 0 or not len(scores):
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.sort(np.argpartition(-scores, k - 1)[:k])
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
 class SpacedRepetitionManager:
     """SM-2 algoritmin toteutus, nyt käyttäjäkohtainen."""
     
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, scheduler=None, load_balance=None):
         self.db_manager = db_manager
+        self.scheduler = scheduler or SR_SCHEDULER
+        self.memory_model = MemoryModelManager(db_manager)
+        self.load_balancer = DueLoadBalancer(db_manager, load_balance)
     
     def calculate_next_review(self, question: Question, performance_rating: int) -> tuple:
         """Laskee seuraavan kertausajan SM-2 algoritmin mukaan."""
         if performance_rating < 3:
-            interval = 1
-            ease_factor = max(1.3, question.ease_factor - 0.8 + 0.28 * performance_rating - 0.02 * (performance_rating**2))
+            interval = SM2_FAIL_INTERVAL
+            ease_factor = max(SM2_MIN_EASE, question.ease_factor - 0.8 + 0.28 * performance_rating - 0.02 * (performance_rating**2))
         else:
             if question.times_shown <= 1:
-                interval = 6
+                interval = SM2_SECOND_INTERVAL
             else:
                 interval = round(question.interval * question.ease_factor)
             ease_factor = question.ease_factor + (0.1 - (5 - performance_rating) * (0.08 + (5 - performance_rating) * 0.02))
-            ease_factor = max(1.3, ease_factor)
+            ease_factor = max(SM2_MIN_EASE, ease_factor)
         return interval, ease_factor
     
-    def get_due_questions(self, user_id, limit=20) -> List[Question]:
-        """Hakee käyttäjän erääntyvät kertauskysymykset."""
-        date_func = "DATE" if not self.db_manager.is_postgres else ""
-        query = f"""
+    def get_due_questions(self, user_id, limit=20, policy='due') -> List[Question]:
+        """
+        Hakee käyttäjän erääntyvät kertauskysymykset (policy: ks. DUE_POLICIES).
+        Molemmat järjestykset valitaan due_date-sarakkeesta (user_id, due_date) -indeksiä vasten.
+        """
+        return self.get_questions_with_progress(user_id, self.get_due_question_ids(user_id, limit, policy))
+
+    def get_due_question_ids(self, user_id, limit=500, policy='due') -> List[int]:
+        """
+        Hakee erääntyneiden kysymysten ID:t (ei kysymysrivejä). 'due' palauttaa
+        erääntymisjärjestyksessä, 'priority' prioriteettijärjestyksessä.
+        """
+        if policy == 'priority':
+            return self._get_priority_question_ids(user_id, limit)
+        rows = self.db_manager._execute("""
+            SELECT question_id FROM user_question_progress
+            WHERE user_id = ? AND due_date <= ?
+            ORDER BY due_date ASC, question_id
+            LIMIT ?
+        """, (user_id, date.today().isoformat(), limit), fetch='all') or []
+        return [row['question_id'] for row in rows]
+
+    def _get_priority_question_ids(self, user_id, limit):
+        """Pisteyttää kaikki erääntyneet kortit vektoroidusti ja valitsee niistä limit parasta."""
+        rows = self.db_manager._execute("""
+            SELECT question_id, due_date, last_shown, interval, memory_stability
+            FROM user_question_progress
+            WHERE user_id = ? AND due_date <= ?
+        """, (user_id, date.today().isoformat()), fetch='all') or []
+        if not rows:
+            return []
+
+        today = np.datetime64(date.today(), 'D')
+        question_ids = np.array([row['question_id'] for row in rows], dtype=np.int64)
+        due_days = np.array([str(row['due_date'])[:10] for row in rows], dtype='datetime64[D]')
+        shown_days = np.array([str(row['last_shown'] or row['due_date'])[:10] for row in rows], dtype='datetime64[D]')
+        interval = np.array([row['interval'] or 1 for row in rows], dtype=np.float64)
+        stability = np.array([row['memory_stability'] if row['memory_stability'] is not None else np.nan for row in rows])
+
+        # ID-järjestys tekee tasapisteiden järjestyksestä toistettavan
+        order = np.argsort(question_ids, kind='stable')
+        scores = due_priority(
+            (today - shown_days[order]).astype(np.int64),
+            (today - due_days[order]).astype(np.int64),
+            interval[order], stability[order],
+        )
+        return question_ids[order][top_k(scores, limit)].tolist()
+
+    def get_due_summary(self, user_id, horizon_days=30) -> dict:
+        """
+        Erääntyneiden tarkka määrä ja ennuste seuraaville päiville yhdellä
+        koostekyselyllä (user_id, due_date) -indeksiä vasten. Jo erääntyneet
+        lasketaan tälle päivälle.
+        """
+        today = date.today()
+        rows = self.db_manager._execute("""
+            SELECT CASE WHEN due_date <= ? THEN ? ELSE due_date END as day, COUNT(*) as count
+            FROM user_question_progress
+            WHERE user_id = ? AND due_date <= ?
+            GROUP BY 1
+        """, (today.isoformat(), today.isoformat(), user_id, (today + timedelta(days=horizon_days)).isoformat()), fetch='all') or []
+
+        counts = {str(row['day'])[:10]: row['count'] for row in rows}
+        forecast = [
+            {'date': (today + timedelta(days=offset)).isoformat(), 'count': counts.get((today + timedelta(days=offset)).isoformat(), 0)}
+            for offset in range(1, horizon_days + 1)
+        ]
+        return {
+            'due_now': counts.get(today.isoformat(), 0),
+            'horizon_days': horizon_days,
+            'forecast': forecast,
+            'upcoming_total': sum(day['count'] for day in forecast),
+        }
+
+    def get_questions_with_progress(self, user_id, question_ids) -> List[Question]:
+        """Hakee annetut kysymykset käyttäjän SR-tietoineen annetussa järjestyksessä."""
+        if not question_ids:
+            return []
+        placeholders = ','.join(['?'] * len(question_ids))
+        rows = self.db_manager._execute(f"""
             SELECT 
                 q.*,
-                p.times_shown, p.times_correct, p.last_shown, p.ease_factor, p.interval
+                p.times_shown, p.times_correct, p.last_shown, p.ease_factor, p.interval, p.due_date
             FROM questions q
-            JOIN user_question_progress p ON q.id = p.question_id
-            WHERE p.user_id = ?
-              AND p.last_shown IS NOT NULL
-              AND {date_func}(p.last_shown, '+' || p.interval || ' days') <= {date_func}('now')
-            ORDER BY {date_func}(p.last_shown, '+' || p.interval || ' days') ASC
-            LIMIT ?
+            LEFT JOIN user_question_progress p ON q.id = p.question_id AND p.user_id = ?
+            WHERE q.id IN ({placeholders})
+        """, (user_id, *question_ids), fetch='all') or []
+
+        by_id = {}
+        for row in rows:
+            try:
+                by_id[row['id']] = Question(
+                    id=row['id'], question=row['question'], explanation=row['explanation'],
+                    options=json.loads(row['options']), correct=row['correct'], category=row['category'],
+                    difficulty=row['difficulty'], created_at=row.get('created_at'),
+                    times_shown=row.get('times_shown', 0) or 0,
+                    times_correct=row.get('times_correct', 0) or 0,
+                    last_shown=row.get('last_shown'),
+                    ease_factor=row.get('ease_factor', 2.5) or 2.5,
+                    interval=row.get('interval', 1) or 1,
+                    due_date=row.get('due_date')
+                )
+            except (json.JSONDecodeError, TypeError) as e:
+                logger.error(f"Virhe kysymyksen {row.get('id')} jäsentämisessä: {e}")
+        return [by_id[qid] for qid in question_ids if qid in by_id]
+
+    def review(self, user_id, question: Question, is_correct: bool, time_taken=0) -> int:
         """
-        if self.db_manager.is_postgres:
-             query = """
-                SELECT 
-                    q.*,
-                    p.times_shown, p.times_correct, p.last_shown, p.ease_factor, p.interval
-                FROM questions q
-                JOIN user_question_progress p ON q.id = p.question_id
-                WHERE p.user_id = %s
-                  AND p.last_shown IS NOT NULL
-                  AND p.last_shown + (p.interval * INTERVAL '1 day') <= NOW()
-                ORDER BY p.last_shown + (p.interval * INTERVAL '1 day') ASC
-                LIMIT %s
-            """
-        
-        rows = self.db_manager._execute(query, (user_id, limit), fetch='all')
-            
-        questions = []
-        if rows:
-            for row in rows:
-                try:
-                    questions.append(Question(
-                        id=row['id'], question=row['question'], explanation=row['explanation'],
-                        options=json.loads(row['options']), correct=row['correct'], category=row['category'],
-                        difficulty=row['difficulty'], created_at=row.get('created_at'),
-                        times_shown=row.get('times_shown', 0) or 0, 
-                        times_correct=row.get('times_correct', 0) or 0,
-                        last_shown=row.get('last_shown'), 
-                        ease_factor=row.get('ease_factor', 2.5) or 2.5,
-                        interval=row.get('interval', 1) or 1
-                    ))
-                except (json.JSONDecodeError, TypeError) as e:
-                    print(f"Error parsing question data in get_due_questions: {e}")
-                    continue
-        return questions
-
-    def record_review(self, user_id, question_id, interval, ease_factor):
-        """Päivittää käyttäjän SR-tiedot kysymykselle."""
+        Päivittää kortin aikataulun aktiivisella algoritmilla ja kirjaa kertauksen lokiin.
+        question on haettu ennen vastauksen tallennusta (sisältää edellisen näyttökerran).
+        Palauttaa uuden kertausvälin päivinä.
+        """
+        rating = rating_from_answer(is_correct, time_taken)
+        stability, difficulty = self.memory_model.next_state(user_id, question.id, question.last_shown, rating)
+
+        if self.scheduler == 'fsrs':
+            interval = int(next_interval(stability))
+            ease_factor = question.ease_factor
+        else:
+            # SM-2: 5 = täydellinen, 2 = väärä vastaus
+            interval, ease_factor = self.calculate_next_review(question, 5 if is_correct else 2)
+
+        # Erääntymispäivä voi siirtyä kuormantasauksen ikkunassa (SR_LOAD_BALANCE); väli pysyy ennallaan.
+        # Histogrammista poistetaan tallennettu due_date, joka voi jo olla tasattu tai uudelleenajoitettu.
+        due_in = self.load_balancer.schedule(user_id, question.id, interval, question.due_date)
+
+        self.record_review(user_id, question.id, interval, ease_factor, stability, difficulty, due_in)
+        self.memory_model.log_review(user_id, question.id, rating, is_correct, time_taken, self.scheduler)
+        return interval
+
+    def record_review(self, user_id, question_id, interval, ease_factor, stability=None, difficulty=None, due_in=None):
+        """Päivittää käyttäjän SR-tiedot kysymykselle. due_in: erääntyminen päivinä (oletus interval)."""
+        due_date = (date.today() + timedelta(days=interval if due_in is None else due_in)).isoformat()
         self.db_manager._execute("""
             UPDATE user_question_progress
-            SET interval = ?, ease_factor = ?
+            SET interval = ?, ease_factor = ?, due_date = ?,
+                memory_stability = COALESCE(?, memory_stability),
+                memory_difficulty = COALESCE(?, memory_difficulty)
             WHERE user_id = ? AND question_id = ?
-        """, (interval, ease_factor, user_id, question_id), fetch='none')
\ No newline at end of file
+        """, (interval, ease_factor, due_date, stability, difficulty, user_id, question_id), fetch='none')
\ No newline at end of file
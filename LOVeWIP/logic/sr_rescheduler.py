@@ -0,0 +1,202 @@
+"""
+SR Rescheduler - Kertausaikataulujen eräuudelleenlaskenta
+
+Kun SM-2-parametreja (logic/spaced_repetition.py) muutetaan, olemassa olevat
+kortit lasketaan uudelleen toistamalla jokaisen kortin vastaushistoria
+vektoroidusti: historiat pakataan matriisiin (kortti x vastausnumero) ja
+SM-2 ajetaan sarake kerrallaan kaikille korteille yhtä aikaa. Tulokset
+kirjoitetaan takaisin paloittain massapäivityksinä.
+
+Kuivaharjoitus (dry run) ei kirjoita mitään, vaan raportoi miten erääntyvien
+kertausten jakauma tuleville päiville muuttuisi.
+
+Käyttö:
+    python -m logic.sr_rescheduler [--dry-run] [--user USER_ID]
+"""
+import argparse
+import logging
+from datetime import date, datetime
+
+import numpy as np
+
+from logic.spaced_repetition import SM2_INITIAL_EASE, SR_SCHEDULER, sm2_next_review
+
+logger = logging.getLogger(__name__)
+
+
+def replay_histories(card_ids, correct):
+    """
+    Toistaa korttien vastaushistoriat SM-2:lla.
+
+    card_ids: kortin järjestysnumero jokaiselle vastaukselle (0..n-1), vastaukset
+    kortin sisällä aikajärjestyksessä ja kortit peräkkäin.
+    Palauttaa (interval, ease_factor) jokaiselle kortille.
+    """
+    n_cards = int(card_ids.max()) + 1 if len(card_ids) else 0
+    lengths = np.bincount(card_ids, minlength=n_cards)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    position = np.arange(len(card_ids)) - starts[card_ids]
+
+    # Sama laatuasteikko kuin vastausta tallennettaessa: 5 = oikein, 2 = väärin
+    quality = np.zeros((n_cards, int(lengths.max()) if n_cards else 0), dtype=np.int8)
+    quality[card_ids, position] = np.where(correct, 5, 2)
+
+    interval = np.ones(n_cards, dtype=np.int64)
+    ease = np.full(n_cards, SM2_INITIAL_EASE)
+    for step in range(quality.shape[1]):
+        active = lengths > step
+        new_interval, new_ease = sm2_next_review(step, interval[active], ease[active], quality[active, step])
+        interval[active] = new_interval
+        ease[active] = new_ease
+    return interval, ease
+
+
+def due_histogram(last_shown_days, interval, today, horizon_days):
+    """
+    Erääntymisten määrä päivittäin: indeksi 0 = tänään tai jo erääntynyt,
+    1..horizon_days-1 = tulevat päivät, viimeinen = myöhemmin.
+    """
+    offsets = (last_shown_days + interval) - today
+    buckets = np.clip(offsets, 0, horizon_days)
+    return np.bincount(buckets, minlength=horizon_days + 1)
+
+
+class SpacedRepetitionRescheduler:
+    """Laskee kertausaikataulut uudelleen nykyisillä SM-2-parametreilla."""
+
+    READ_CHUNK_SIZE = 50000
+    WRITE_CHUNK_SIZE = 5000
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def _load_cards(self, user_id=None):
+        """Lataa korttien nykytilan taulukoihin järjestettynä (user_id, question_id)."""
+        where = "WHERE last_shown IS NOT NULL" + (" AND user_id = ?" if user_id is not None else "")
+        query = f"""
+            SELECT user_id, question_id, interval, ease_factor, last_shown
+            FROM user_question_progress {where}
+            ORDER BY user_id, question_id
+        """
+        params = (user_id,) if user_id is not None else ()
+        keys, intervals, eases, shown = [], [], [], []
+        for rows in self.db_manager._fetch_in_chunks(query, params, chunk_size=self.READ_CHUNK_SIZE):
+            keys.extend((r[0], r[1]) for r in rows)
+            intervals.extend(r[2] or 1 for r in rows)
+            eases.extend(r[3] or SM2_INITIAL_EASE for r in rows)
+            shown.extend(str(r[4])[:10] for r in rows)
+        return {
+            'keys': np.array(keys, dtype=np.int64).reshape(-1, 2),
+            'interval': np.array(intervals, dtype=np.int64),
+            'ease': np.array(eases, dtype=np.float64),
+            'last_shown_days': np.array(shown, dtype='datetime64[D]').astype(np.int64),
+        }
+
+    def _load_attempts(self, user_id=None):
+        """Lataa vastaushistorian järjestettynä korteittain ja aikajärjestyksessä."""
+        where = "WHERE user_id = ?" if user_id is not None else ""
+        query = f"""
+            SELECT user_id, question_id, correct FROM question_attempts {where}
+            ORDER BY user_id, question_id, id
+        """
+        params = (user_id,) if user_id is not None else ()
+        chunks = []
+        for rows in self.db_manager._fetch_in_chunks(query, params, chunk_size=self.READ_CHUNK_SIZE):
+            chunks.append(np.array([(r[0], r[1], 1 if r[2] else 0) for r in rows], dtype=np.int64))
+        return np.concatenate(chunks) if chunks else np.zeros((0, 3), dtype=np.int64)
+
+    def _write_back(self, keys, interval, ease, last_shown_days):
+        """Kirjoittaa muuttuneet kortit paloittain; jokainen pala on oma transaktionsa."""
+        query = "UPDATE user_question_progress SET interval = ?, ease_factor = ?, due_date = ? WHERE user_id = ? AND question_id = ?"
+        due_dates = (last_shown_days + interval).astype('datetime64[D]').astype(str)
+        for start in range(0, len(keys), self.WRITE_CHUNK_SIZE):
+            end = start + self.WRITE_CHUNK_SIZE
+            rows = [
+                (int(i), round(float(e), 4), str(d), int(u), int(q))
+                for (u, q), i, e, d in zip(keys[start:end], interval[start:end], ease[start:end], due_dates[start:end])
+            ]
+            self.db_manager._executemany(query, rows)
+
+    def run(self, user_id=None, dry_run=False, horizon_days=30):
+        """
+        Laskee yhden käyttäjän (tai kaikkien) kortit uudelleen.
+        Palauttaa (True, raportti) tai (False, virheilmoitus).
+        """
+        if SR_SCHEDULER != 'sm2' and not dry_run:
+            return False, f"Aktiivinen ajoitusalgoritmi on '{SR_SCHEDULER}', SM-2-välejä ei kirjoiteta"
+
+        started = datetime.now()
+        try:
+            cards = self._load_cards(user_id)
+            attempts = self._load_attempts(user_id)
+        except Exception as e:
+            logger.error(f"Virhe korttien latauksessa: {e}")
+            return False, str(e)
+
+        n_cards = len(cards['keys'])
+        new_interval = cards['interval'].copy()
+        new_ease = cards['ease'].copy()
+
+        if n_cards and len(attempts):
+            # Vastausten korttinumerot: vaihtokohdat järjestetyssä (user_id, question_id) -sarjassa
+            boundaries = np.any(np.diff(attempts[:, :2], axis=0) != 0, axis=1)
+            card_ids = np.concatenate(([0], np.cumsum(boundaries)))
+            first = np.concatenate(([0], np.flatnonzero(boundaries) + 1))
+            replayed_interval, replayed_ease = replay_histories(card_ids, attempts[:, 2].astype(bool))
+
+            # Yhdistä toistetut kortit tallennettuihin kortteihin avainten perusteella
+            card_codes = cards['keys'][:, 0] * (1 << 32) + cards['keys'][:, 1]
+            replay_codes = attempts[first, 0] * (1 << 32) + attempts[first, 1]
+            target = np.searchsorted(card_codes, replay_codes)
+            target = np.minimum(target, n_cards - 1)
+            found = card_codes[target] == replay_codes
+            new_interval[target[found]] = replayed_interval[found]
+            new_ease[target[found]] = replayed_ease[found]
+
+        changed = (new_interval != cards['interval']) | ~np.isclose(new_ease, cards['ease'])
+        today = np.datetime64(date.today(), 'D').astype(np.int64)
+        before = due_histogram(cards['last_shown_days'], cards['interval'], today, horizon_days)
+        after = due_histogram(cards['last_shown_days'], new_interval, today, horizon_days)
+
+        if not dry_run and changed.any():
+            try:
+                self._write_back(cards['keys'][changed], new_interval[changed], new_ease[changed], cards['last_shown_days'][changed])
+            except Exception as e:
+                logger.error(f"Virhe aikataulujen tallennuksessa: {e}")
+                return False, str(e)
+
+        seconds = (datetime.now() - started).total_seconds()
+        report = {
+            'dry_run': dry_run,
+            'cards': n_cards,
+            'changed': int(changed.sum()),
+            'due_before': before.tolist(),
+            'due_after': after.tolist(),
+            'due_shift': (after - before).tolist(),
+            'seconds': round(seconds, 2),
+        }
+        logger.info(
+            f"Uudelleenaikataulutus {'(kuivaharjoitus) ' if dry_run else ''}valmis: "
+            f"{report['changed']}/{n_cards} korttia muuttui, {seconds:.2f} s"
+        )
+        return True, report
+
+
+if __name__ == '__main__':
+    from data_access.database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Laske kertausaikataulut uudelleen nykyisillä SM-2-parametreilla.")
+    parser.add_argument('--dry-run', action='store_true', help="Älä kirjoita, raportoi vain jakauman muutos")
+    parser.add_argument('--user', type=int, default=None, help="Vain tämän käyttäjän kortit")
+    parser.add_argument('--horizon', type=int, default=30, help="Raportoitavien päivien määrä")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    success, result = SpacedRepetitionRescheduler(DatabaseManager()).run(args.user, args.dry_run, args.horizon)
+    if not success:
+        raise SystemExit(f"Virhe: {result}")
+    print(f"Kortteja: {result['cards']}, muuttui: {result['changed']} ({result['seconds']} s)")
+    print("Päivä  ennen  jälkeen  muutos")
+    for day, (b, a) in enumerate(zip(result['due_before'], result['due_after'])):
+        label = f"{day:>4}" if day < args.horizon else "myöh"
+        print(f"{label}  {b:>5}  {a:>7}  {a - b:>+6}")
@@ -4,11 +4,14 @@ Stats Manager - Oppimistilastojen hallinta ja analytiikka
 import json
 from datetime import datetime, date, timedelta
 
+from logic.feature_store import FeatureStore, calculate_streaks
+
 class EnhancedStatsManager:
     """Käyttäjäkohtaisten oppimistilastojen hallinta."""
     
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, feature_store=None):
         self.db_manager = db_manager
+        self.feature_store = feature_store or FeatureStore(db_manager)
     
     def start_session(self, user_id, session_type, categories=None):
         """Aloita käyttäjäkohtainen opiskelusessio."""
@@ -113,24 +116,17 @@ class EnhancedStatsManager:
             return analytics_data
 
     def get_recommendations(self, user_id):
-        """Anna käyttäjäkohtaiset oppimissuositukset."""
-        analytics = self.get_learning_analytics(user_id)
+        """Anna käyttäjäkohtaiset oppimissuositukset (haku esilasketuista piirteistä)."""
+        features = self.feature_store.get(user_id)
         recommendations = []
-        if not analytics: return recommendations
 
-        weak_categories = [c for c in analytics.get('categories', []) if c['success_rate'] < 0.7 and c['attempts'] >= 5]
-        if weak_categories:
-            weakest = min(weak_categories, key=lambda x: x['success_rate'])
-            recommendations.append({'type': 'weakest_category', 'title': f"Keskity: {weakest['category'].title()}", 'description': f"Onnistumisprosenttisi on {weakest['success_rate']*100:.1f}%. Harjoittele lisää.", 'action': 'practice_category', 'priority': 'high', 'data': {'category': weakest['category']}, 'category': weakest['category'], 'accuracy': weakest['success_rate']*100})
+        weakest = features.get('weakest_category')
+        weakest_rate = features.get('weakest_success_rate')
+        if weakest and weakest_rate is not None and weakest_rate < 0.7:
+            recommendations.append({'type': 'weakest_category', 'title': f"Keskity: {weakest.title()}", 'description': f"Onnistumisprosenttisi on {weakest_rate*100:.1f}%. Harjoittele lisää.", 'action': 'practice_category', 'priority': 'high', 'data': {'category': weakest}, 'category': weakest, 'accuracy': weakest_rate*100})
 
-        if analytics.get('general', {}).get('answered_questions', 0) >= 50:
-            try:
-                sim_q = "SELECT COUNT(*) as count FROM study_sessions WHERE user_id = ? AND session_type = 'simulation'"
-                sim_count_res = self.db_manager._execute(sim_q, (user_id,), fetch='one')
-                if sim_count_res and sim_count_res['count'] == 0:
-                    recommendations.append({'type': 'simulation', 'title': "Kokeile koesimulaatiota!", 'description': "Olet vastannut yli 50 kysymykseen. Testaa osaamistasi!", 'action': 'start_simulation', 'priority': 'medium', 'data': {}})
-            except Exception as e:
-                print(f"Virhe simulaatiosuosituksessa: {e}")
+        if features.get('answered_questions', 0) >= 50 and features.get('simulation_count', 0) == 0:
+            recommendations.append({'type': 'simulation', 'title': "Kokeile koesimulaatiota!", 'description': "Olet vastannut yli 50 kysymykseen. Testaa osaamistasi!", 'action': 'start_simulation', 'priority': 'medium', 'data': {}})
 
         priority_order = {'high': 0, 'medium': 1, 'low': 2}
         recommendations.sort(key=lambda x: priority_order.get(x.get('priority', 'low'), 2))
@@ -149,27 +145,4 @@ class EnhancedStatsManager:
         if isinstance(dates[0], str):
             dates = [datetime.strptime(d_str, '%Y-%m-%d').date() for d_str in dates]
 
-        current_streak = 0
-        today = date.today()
-        yesterday = today - timedelta(days=1)
-        
-        if dates[0] == today or dates[0] == yesterday:
-            current_streak = 1
-            for i in range(len(dates) - 1):
-                if (dates[i] - dates[i+1]).days == 1:
-                    current_streak += 1
-                else:
-                    break
-        
-        longest_streak = 0
-        if dates:
-            longest_streak = 1
-            temp_streak = 1
-            for i in range(len(dates) - 1):
-                if (dates[i] - dates[i+1]).days == 1:
-                    temp_streak += 1
-                else:
-                    temp_streak = 1
-                longest_streak = max(longest_streak, temp_streak)
-
-        return {'current_streak': current_streak, 'longest_streak': longest_streak}
\ No newline at end of file
+        return calculate_streaks(dates)
@@ -0,0 +1,266 @@
+"""
+Study Packets - Koko ryhmän henkilökohtaiset virhekoosteet (PDF) ZIP-arkistona
+
+Jokaiselle aktiiviselle opiskelijalle tehdään PDF "Omat virheet selityksineen"
+kuittaamattomista virheistä (sama data kuin /api/incorrect_questions):
+
+  - kaikkien opiskelijoiden virheet haetaan yhdellä kyselyllä
+    (DatabaseManager.iter_cohort_mistakes), ja jokainen kysymys muotoillaan
+    ReportLab-merkinnäksi vain kerran (question_markup)
+  - muotoillut kysymykset annetaan prosessipoolin työprosesseille kerran
+    (initializer), ja tyylit rakennetaan kerran per työprosessi
+    (packet_styles), joten opiskelijakohtainen työ on vain tarinan kokoaminen
+  - valmiit PDF:t kirjoitetaan ZIP-arkistoon sitä mukaa kuin ne valmistuvat,
+    joten muistissa on kerrallaan vain keskeneräiset PDF:t
+
+Työ ajetaan taustasäikeessä (gunicornin --timeout 120 ei katkaise sitä), ja
+sen edistymistä seurataan tilareitillä. Valmis arkisto ladataan levyltä.
+Työt ovat prosessikohtaisia (yksi gunicorn-työprosessi, ks. Procfile).
+"""
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import KeepTogether, Paragraph, SimpleDocTemplate, Spacer
+
+logger = logging.getLogger(__name__)
+
+STUDY_PACKET_DIR = os.environ.get('STUDY_PACKET_DIR', os.path.join('uploads', 'study_packets'))
+PACKET_WORKERS = None  # None = prosessorien määrä
+IN_FLIGHT_PER_WORKER = 2  # Kesken olevia koosteita työprosessia kohden
+MAX_FINISHED_JOBS = 5
+DIFFICULTY_LABELS = {'helppo': 'Helppo', 'keskivaikea': 'Keskivaikea', 'vaikea': 'Vaikea'}
+
+_questions = {}  # Työprosessin kysymysmerkinnät (asetetaan initializerissa)
+
+
+def option_letter(index):
+    """Vaihtoehdon kirjain (A, B, ...); vaihtoehtojen määrää ei rajata tallennetuissa kysymyksissä."""
+    return chr(ord('A') + index)
+
+
+def question_markup(row):
+    """Kysymyksen valmiit Paragraph-merkinnät (XML-escapetut), tehdään kerran per kysymys."""
+    options = json.loads(row['options']) if isinstance(row['options'], str) else row['options']
+    return {
+        'question': escape(row['question']),
+        'meta': f"{escape(row['category'].title())} | {DIFFICULTY_LABELS.get(row['difficulty'], escape(row['difficulty']))}",
+        'options': [
+            f"<b>{option_letter(i)}. {escape(str(option))} ✓</b>" if i == row['correct'] else f"{option_letter(i)}. {escape(str(option))}"
+            for i, option in enumerate(options)
+        ],
+        'explanation': f"<b>Oikea vastaus: {option_letter(row['correct'])}</b><br/>{escape(row['explanation'] or '')}",
+    }
+
+
+def _init_worker(questions):
+    global _questions
+    _questions = questions
+
+
+@lru_cache(maxsize=1)
+def packet_styles():
+    """Kaikkien koosteiden yhteiset tyylit (rakennetaan kerran per prosessi)."""
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle('PacketTitle', parent=styles['Heading1'], fontSize=20, alignment=TA_CENTER,
+                                textColor=colors.HexColor('#5A67D8'), spaceAfter=12, fontName='Helvetica-Bold'),
+        'subtitle': ParagraphStyle('PacketSubtitle', parent=styles['Normal'], fontSize=11, alignment=TA_CENTER,
+                                   textColor=colors.HexColor('#718096'), spaceAfter=16),
+        'question': ParagraphStyle('PacketQuestion', parent=styles['Normal'], fontSize=11, fontName='Helvetica-Bold',
+                                   textColor=colors.HexColor('#2D3748'), spaceAfter=4),
+        'meta': ParagraphStyle('PacketMeta', parent=styles['Normal'], fontSize=8,
+                               textColor=colors.HexColor('#A0AEC0'), spaceAfter=6),
+        'option': ParagraphStyle('PacketOption', parent=styles['Normal'], fontSize=10, leftIndent=20, spaceAfter=3),
+        'explanation': ParagraphStyle('PacketExplanation', parent=styles['Normal'], fontSize=9,
+                                      textColor=colors.HexColor('#4A5568'), leftIndent=10, rightIndent=10,
+                                      spaceBefore=4, spaceAfter=6, borderWidth=1, borderPadding=8,
+                                      borderColor=colors.HexColor('#E2E8F0'), backColor=colors.HexColor('#F7FAFC')),
+    }
+
+
+def render_packet(student):
+    """
+    Prosessipoolin työ: yhden opiskelijan kooste.
+    student: {'user_id', 'username', 'mistakes': [(kysymys-ID, näytetty, oikein, onnistumis-%)]}.
+    Palauttaa (user_id, PDF-tavut).
+    """
+    styles = packet_styles()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.75 * inch, bottomMargin=0.75 * inch,
+                            leftMargin=0.75 * inch, rightMargin=0.75 * inch,
+                            title=f"Omat virheet - {student['username']}")
+    story = [
+        Paragraph("Omat virheet selityksineen", styles['title']),
+        Paragraph(f"{escape(student['username'])} | {len(student['mistakes'])} kysymystä | "
+                  f"{datetime.now().strftime('%d.%m.%Y')}", styles['subtitle']),
+    ]
+    for number, (question_id, times_shown, times_correct, success_rate) in enumerate(student['mistakes'], 1):
+        markup = _questions[question_id]
+        rate = f"{success_rate:g} %" if success_rate is not None else "-"
+        block = [
+            Paragraph(f"{number}. {markup['question']}", styles['question']),
+            Paragraph(f"{markup['meta']} | Oikein {times_correct}/{times_shown} ({rate})", styles['meta']),
+            *[Paragraph(option, styles['option']) for option in markup['options']],
+            Paragraph(markup['explanation'], styles['explanation']),
+            Spacer(1, 0.15 * inch),
+        ]
+        story.append(KeepTogether(block))
+    doc.build(story)
+    return student['user_id'], buffer.getvalue()
+
+
+def _filename(student):
+    slug = re.sub(r'[^\w.-]+', '_', student['username']).strip('_') or 'opiskelija'
+    return f"{student['user_id']}_{slug}.pdf"
+
+
+class StudyPacketJob:
+    """Yhden ZIP-arkiston rakennuksen tila."""
+
+    def __init__(self, output_dir):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = os.path.join(output_dir, f"virhekoosteet_{self.id}.zip")
+        self.status = 'running'
+        self.total = 0
+        self.done = 0
+        self.error = None
+        self.started_at = datetime.now()
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status != 'running'
+
+    def progress(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'done': self.done,
+            'percent': round(100 * self.done / self.total, 1) if self.total else (100 if self.status == 'done' else 0),
+            'error': self.error,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'finished_at': self.finished_at.isoformat(timespec='seconds') if self.finished_at else None,
+        }
+
+
+class StudyPacketManager:
+    """Käynnistää, seuraa ja peruu virhekoosteiden rakennuksia."""
+
+    def __init__(self, db_manager, output_dir=STUDY_PACKET_DIR, processes=PACKET_WORKERS):
+        self.db_manager = db_manager
+        self.output_dir = output_dir
+        self.processes = processes
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Käynnistää rakennuksen tai palauttaa jo käynnissä olevan."""
+        with self._lock:
+            for job in self._jobs.values():
+                if not job.finished:
+                    return job
+            os.makedirs(self.output_dir, exist_ok=True)
+            job = StudyPacketJob(self.output_dir)
+            self._jobs[job.id] = job
+            finished = sorted((j for j in self._jobs.values() if j.finished), key=lambda j: j.started_at)
+            for old in finished[:-MAX_FINISHED_JOBS or None]:
+                self._remove(old)
+        threading.Thread(target=self._run, args=(job,), daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def latest(self):
+        return max(self._jobs.values(), key=lambda job: job.started_at, default=None)
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def _remove(self, job):
+        del self._jobs[job.id]
+        if os.path.exists(job.path):
+            os.remove(job.path)
+
+    def _load(self):
+        """Opiskelijat virheineen ja kysymysten merkinnät yhdellä kyselyllä."""
+        students, questions = [], {}
+        for rows in self.db_manager.iter_cohort_mistakes():
+            for row in rows:
+                if not students or students[-1]['user_id'] != row['user_id']:
+                    students.append({'user_id': row['user_id'], 'username': row['username'], 'mistakes': []})
+                if row['question_id'] not in questions:
+                    questions[row['question_id']] = question_markup(row)
+                rate = float(row['success_rate']) if row['success_rate'] is not None else None
+                students[-1]['mistakes'].append((row['question_id'], row['times_shown'], row['times_correct'], rate))
+        return students, questions
+
+    def _run(self, job):
+        tmp_path = f"{job.path}.tmp"
+        try:
+            students, questions = self._load()
+            job.total = len(students)
+            names = {student['user_id']: _filename(student) for student in students}
+            with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as archive:
+                if students:
+                    # spawn: web-prosessin haarauttaminen säikeiden ollessa käynnissä voi periä lukittuja lukkoja
+                    with ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_init_worker, initargs=(questions,)) as pool:
+                        # Rajattu ikkuna: valmis PDF vapautuu heti, kun se on kirjoitettu arkistoon
+                        queue = iter(students)
+                        window = (self.processes or os.cpu_count() or 1) * IN_FLIGHT_PER_WORKER
+                        pending = set()
+                        while True:
+                            while len(pending) < window and not job.cancel_event.is_set():
+                                student = next(queue, None)
+                                if student is None:
+                                    break
+                                pending.add(pool.submit(render_packet, student))
+                            if not pending:
+                                break
+                            completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in completed:
+                                user_id, pdf = future.result()
+                                archive.writestr(names[user_id], pdf)
+                                job.done += 1
+                            if job.cancel_event.is_set():
+                                for future in pending:
+                                    future.cancel()
+                                break
+            if job.cancel_event.is_set():
+                job.status = 'cancelled'
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, job.path)
+                job.status = 'done'
+        except Exception as e:
+            logger.error(f"Virhe virhekoosteiden rakentamisessa: {e}")
+            job.status = 'error'
+            job.error = str(e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        finally:
+            job.finished_at = datetime.now()
+            logger.info(f"Virhekoosteet {job.id}: {job.status}, {job.done}/{job.total} opiskelijaa")
@@ -0,0 +1,245 @@
+"""
+Workload Forecast - Kertauskuorman Monte Carlo -ennuste
+
+Simuloi SM-2-prosessia (logic/spaced_repetition.py) nykyisistä korttitiloista
+eteenpäin N päivää. Jokaisessa kokeessa:
+  - käyttäjä harjoittelee päivänä todennäköisyydellä, joka on hänen
+    aktiivisten päiviensä osuus viimeisen 30 päivän ajalta
+    (väliin jääneet erääntymiset siirtyvät seuraavalle päivälle)
+  - kortin vastaus on oikein todennäköisyydellä, joka yhdistää kortin oman
+    historian ja käyttäjän kokonaisosumatarkkuuden
+  - vastattu kortti saa uuden välin vektoroidulla SM-2:lla
+
+Kaikki kortit simuloidaan samanaikaisesti NumPy-taulukoina. Kun joukossa on
+yli MAX_SIMULATED_USERS käyttäjää, simuloidaan satunnaisotos käyttäjistä ja
+palvelintason luvut skaalataan koko joukkoon, joten kymmenien tuhansien
+käyttäjien ennuste valmistuu sekunneissa. Tuloksena on päivittäisten
+kertausten ja niistä syntyvien HTTP-pyyntöjen odotusarvo ja hajonta.
+
+Käyttö:
+    python -m logic.workload_forecast [--days 30] [--trials 10] [--user ID ...]
+"""
+import argparse
+import json
+import logging
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from logic.spaced_repetition import SM2_INITIAL_EASE, sm2_next_review
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_WINDOW_DAYS = 30
+PRIOR_ATTEMPTS = 10       # Kortin oma historia painottuu käyttäjän tarkkuuden rinnalla tällä painolla
+DEFAULT_ACCURACY = 0.75   # Käyttäjälle, jolla ei vielä ole vastauksia
+REVIEW_PAGE_SIZE = 5      # /api/review-queue palauttaa näin monta korttia kerralla
+PER_USER_LIMIT = 100      # Käyttäjäkohtaiset luvut palautetaan vain pienille joukoille
+MAX_SIMULATED_USERS = 5000  # Suuremmista joukoista simuloidaan satunnaisotos ja tulokset skaalataan
+
+
+def _bucket_by_day(card_idx, due_day, buckets):
+    """Lisää kortit erääntymispäivänsä lokeroon (horisontin ulkopuoliset jätetään pois)."""
+    in_horizon = due_day < len(buckets)
+    card_idx, due_day = card_idx[in_horizon], due_day[in_horizon]
+    order = np.argsort(due_day, kind='stable')
+    card_idx, due_day = card_idx[order], due_day[order]
+    days_present, starts = np.unique(due_day, return_index=True)
+    for day, chunk in zip(days_present, np.split(card_idx, starts[1:])):
+        buckets[day].append(chunk)
+
+
+def sample_users(data, max_users, rng):
+    """Rajaa ladatut tiedot satunnaisotokseen käyttäjistä. Palauttaa (tiedot, skaalauskerroin)."""
+    n_users = len(data['user_ids'])
+    if n_users <= max_users:
+        return data, 1.0
+    chosen = np.sort(rng.choice(n_users, size=max_users, replace=False))
+    new_index = np.full(n_users, -1, dtype=np.int64)
+    new_index[chosen] = np.arange(max_users)
+    keep = new_index[data['cards']['user_idx']] >= 0
+    cards = {key: values[keep] for key, values in data['cards'].items()}
+    cards['user_idx'] = new_index[cards['user_idx']]
+    sampled = {'user_ids': data['user_ids'][chosen], 'p_active': data['p_active'][chosen], 'cards': cards}
+    return sampled, n_users / max_users
+
+
+def simulate_workload(cards, p_active, days, trials, seed=None):
+    """
+    Ajaa Monte Carlo -simulaation.
+
+    cards: sanakirja taulukoita (user_idx, times_shown, interval, ease, due_day, p_correct),
+    due_day = erääntymispäivä suhteessa tähän päivään (<= 0 = erääntynyt).
+    p_active: käyttäjäkohtainen päivittäinen harjoittelutodennäköisyys (indeksi user_idx).
+    seed: siemenluku tai valmis np.random.Generator.
+    Palauttaa (kertaukset muodossa (trials, days), käyttäjäkohtaiset odotetut kertaukset).
+
+    Kortit jaetaan päivälokeroihin erääntymisen mukaan, joten päivän käsittely
+    koskee vain sinä päivänä erääntyviä kortteja eikä koko korttijoukkoa.
+    """
+    rng = np.random.default_rng(seed)
+    n_users = len(p_active)
+    user_idx = cards['user_idx']
+    reviews = np.zeros((trials, days), dtype=np.int64)
+    per_user = np.zeros(n_users)
+    all_cards = np.arange(len(user_idx))
+
+    for trial in range(trials):
+        times_shown = cards['times_shown'].copy()
+        interval = cards['interval'].copy()
+        ease = cards['ease'].copy()
+        buckets = [[] for _ in range(days)]
+        _bucket_by_day(all_cards, np.maximum(cards['due_day'], 0), buckets)
+        backlog = np.zeros(0, dtype=np.int64)
+
+        for day in range(days):
+            candidates = np.concatenate([backlog] + buckets[day])
+            buckets[day] = None
+            active_users = rng.random(n_users) < p_active
+            is_active = active_users[user_idx[candidates]]
+            # Harjoittelemattomien käyttäjien erääntyneet siirtyvät seuraavalle päivälle
+            backlog = candidates[~is_active]
+            idx = candidates[is_active]
+            if not len(idx):
+                continue
+            correct = rng.random(len(idx)) < cards['p_correct'][idx]
+            new_interval, new_ease = sm2_next_review(times_shown[idx], interval[idx], ease[idx], np.where(correct, 5, 2))
+            times_shown[idx] += 1
+            interval[idx] = new_interval
+            ease[idx] = new_ease
+            _bucket_by_day(idx, day + new_interval, buckets)
+            reviews[trial, day] = len(idx)
+            per_user += np.bincount(user_idx[idx], minlength=n_users)
+
+    return reviews, per_user / trials
+
+
+class WorkloadForecaster:
+    """Lataa korttitilat ja käyttäjien aktiivisuuden ja ajaa kuormaennusteen."""
+
+    CHUNK_SIZE = 50000
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def _user_filter(self, user_ids, column='user_id'):
+        if not user_ids:
+            return "", ()
+        return f" AND {column} IN ({','.join(['?'] * len(user_ids))})", tuple(user_ids)
+
+    def load(self, user_ids=None):
+        """Lataa korttitilat ja käyttäjäkohtaiset aktiivisuus- ja tarkkuusluvut taulukoihin."""
+        today = date.today()
+        user_filter, params = self._user_filter(user_ids)
+
+        rows = []
+        query = f"""
+            SELECT user_id, times_shown, times_correct, interval, ease_factor, due_date
+            FROM user_question_progress
+            WHERE due_date IS NOT NULL{user_filter}
+            ORDER BY user_id
+        """
+        for chunk in self.db_manager._fetch_in_chunks(query, params, chunk_size=self.CHUNK_SIZE):
+            rows.extend(
+                (r[0], r[1] or 0, r[2] or 0, r[3] or 1, r[4] or SM2_INITIAL_EASE, str(r[5])[:10])
+                for r in chunk
+            )
+        if not rows:
+            return None
+
+        user_ids_arr = np.array([r[0] for r in rows], dtype=np.int64)
+        times_shown = np.array([r[1] for r in rows], dtype=np.int64)
+        times_correct = np.array([r[2] for r in rows], dtype=np.float64)
+        due_dates = np.array([r[5] for r in rows], dtype='datetime64[D]')
+        unique_users, user_idx = np.unique(user_ids_arr, return_inverse=True)
+
+        # Käyttäjän kokonaistarkkuus ja kortin oma historia yhdistettynä
+        user_shown = np.bincount(user_idx, weights=times_shown, minlength=len(unique_users))
+        user_correct = np.bincount(user_idx, weights=times_correct, minlength=len(unique_users))
+        user_accuracy = np.where(user_shown > 0, user_correct / np.maximum(user_shown, 1), DEFAULT_ACCURACY)
+        p_correct = (times_correct + PRIOR_ATTEMPTS * user_accuracy[user_idx]) / (times_shown + PRIOR_ATTEMPTS)
+
+        # Aktiivisuus: harjoittelupäivien osuus viimeisen 30 päivän ajalta
+        date_expr = "CAST(timestamp AS DATE)" if self.db_manager.is_postgres else "DATE(timestamp)"
+        activity_filter, activity_params = self._user_filter(user_ids)
+        activity_rows = self.db_manager._execute(f"""
+            SELECT user_id, COUNT(DISTINCT {date_expr}) as active_days
+            FROM question_attempts
+            WHERE timestamp >= ?{activity_filter}
+            GROUP BY user_id
+        """, (today - timedelta(days=ACTIVITY_WINDOW_DAYS), *activity_params), fetch='all') or []
+        active_days = {row['user_id']: row['active_days'] for row in activity_rows}
+        p_active = np.array([min(active_days.get(int(u), 0) / ACTIVITY_WINDOW_DAYS, 1.0) for u in unique_users])
+
+        return {
+            'user_ids': unique_users,
+            'p_active': p_active,
+            'cards': {
+                'user_idx': user_idx,
+                'times_shown': times_shown,
+                'interval': np.array([r[3] for r in rows], dtype=np.int64),
+                'ease': np.array([r[4] for r in rows], dtype=np.float64),
+                'due_day': (due_dates - np.datetime64(today, 'D')).astype(np.int64),
+                'p_correct': p_correct,
+            },
+        }
+
+    def forecast(self, user_ids=None, days=30, trials=10, seed=None):
+        """
+        Ennustaa päivittäiset kertaukset ja pyyntömäärät yhdelle käyttäjälle,
+        käyttäjäjoukolle (user_ids) tai kaikille (user_ids=None).
+        """
+        started = datetime.now()
+        data = self.load(user_ids)
+        today = date.today()
+        dates = [(today + timedelta(days=d)).isoformat() for d in range(days)]
+        if data is None:
+            return {'days': dates, 'users': 0, 'cards': 0, 'reviews': None, 'requests': None}
+
+        n_users, n_cards = len(data['user_ids']), len(data['cards']['user_idx'])
+        rng = np.random.default_rng(seed)
+        sample, scale = sample_users(data, MAX_SIMULATED_USERS, rng)
+        reviews, per_user = simulate_workload(sample['cards'], sample['p_active'], days, trials, rng)
+        reviews = reviews * scale
+        # Jokainen kertaus on yksi vastauspyyntö, ja jonosivu haetaan kerran REVIEW_PAGE_SIZE korttia kohden
+        requests = reviews * (1 + 1 / REVIEW_PAGE_SIZE)
+
+        def _summary(values):
+            return {
+                'mean': np.round(values.mean(axis=0), 1).tolist(),
+                'p10': np.percentile(values, 10, axis=0).round(1).tolist(),
+                'p90': np.percentile(values, 90, axis=0).round(1).tolist(),
+            }
+
+        mean_reviews = reviews.mean(axis=0)
+        result = {
+            'days': dates,
+            'users': n_users,
+            'cards': n_cards,
+            'simulated_users': int(len(sample['user_ids'])),
+            'trials': trials,
+            'reviews': _summary(reviews),
+            'requests': _summary(requests),
+            'peak_day': dates[int(mean_reviews.argmax())],
+            'total_reviews': round(float(reviews.sum(axis=1).mean()), 1),
+            'seconds': round((datetime.now() - started).total_seconds(), 2),
+        }
+        if n_users <= PER_USER_LIMIT:
+            result['per_user'] = {int(u): round(float(n), 1) for u, n in zip(sample['user_ids'], per_user)}
+        logger.info(f"Kuormaennuste: {result['users']} käyttäjää, {result['cards']} korttia, {trials} koetta, {result['seconds']} s")
+        return result
+
+
+if __name__ == '__main__':
+    from data_access.database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Kertauskuorman Monte Carlo -ennuste.")
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--trials', type=int, default=10)
+    parser.add_argument('--user', type=int, nargs='*', help="Käyttäjä-ID:t (oletus: kaikki)")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = WorkloadForecaster(DatabaseManager()).forecast(args.user, args.days, args.trials, args.seed)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
@@ -42,6 +42,7 @@ class Question:
     last_shown: Optional[str] = None
     ease_factor: float = 2.5
     interval: int = 1
+    due_date: Optional[str] = None
     hint_type: Optional[str] = None
     created_at: Optional[str] = None
     question_normalized: Optional[str] = None